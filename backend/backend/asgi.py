@@ -12,11 +12,16 @@ django.setup()
 
 # 3. Now it's safe to import routing (which imports consumers)
 from chat.routing import websocket_urlpatterns  # Import after setup!
+from notifications.routing import (
+    websocket_urlpatterns as notification_urlpatterns,
+)
 
 # 4. Define application
 application = ProtocolTypeRouter(
     {
         "http": get_asgi_application(),
-        "websocket": AuthMiddlewareStack(URLRouter(websocket_urlpatterns)),
+        "websocket": AuthMiddlewareStack(
+            URLRouter(websocket_urlpatterns + notification_urlpatterns)
+        ),
     }
 )
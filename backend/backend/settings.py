@@ -15,7 +15,6 @@ import os
 import dj_database_url
 from django.core.management.utils import get_random_secret_key
 
-
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -106,6 +105,8 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Wait for a busy write lock instead of failing right away
+        "OPTIONS": {"timeout": 20},
     }
 }
 
@@ -185,14 +186,117 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 #     },
 # }
 
-# Channels: Redis-backed channel layer
+# Channels: Redis-backed channel layer by default. Single-node deployments
+# (one daphne process) can set CHANNEL_LAYER=local to keep group fan-out
+# in memory instead of going through Redis.
 REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379")
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
-        "CONFIG": {"hosts": [REDIS_URL]},
+CHANNEL_LAYER = os.environ.get("CHANNEL_LAYER", "redis").lower()
+if CHANNEL_LAYER == "local":
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "chat.layers.LocalChannelLayer",
+            "CONFIG": {"capacity": 100, "expiry": 60},
+        }
     }
-}
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {"hosts": [REDIS_URL]},
+        }
+    }
+
+# Chat write-behind: buffer messages per process and persist them with
+# bulk_create once CHAT_WRITE_BEHIND_BATCH_SIZE messages are queued or
+# CHAT_WRITE_BEHIND_FLUSH_INTERVAL seconds have passed. Messages that fail
+# CHAT_WRITE_BEHIND_MAX_RETRIES flushes are saved one by one or dropped.
+CHAT_WRITE_BEHIND = os.environ.get("CHAT_WRITE_BEHIND", "false").lower() == "true"
+CHAT_WRITE_BEHIND_BATCH_SIZE = int(os.environ.get("CHAT_WRITE_BEHIND_BATCH_SIZE", 100))
+CHAT_WRITE_BEHIND_FLUSH_INTERVAL = float(
+    os.environ.get("CHAT_WRITE_BEHIND_FLUSH_INTERVAL", 0.5)
+)
+CHAT_WRITE_BEHIND_MAX_RETRIES = int(os.environ.get("CHAT_WRITE_BEHIND_MAX_RETRIES", 3))
+
+# Chat: cache of authenticated users for WebSocket connects
+CHAT_USER_CACHE_SIZE = int(os.environ.get("CHAT_USER_CACHE_SIZE", 1024))
+CHAT_USER_CACHE_TTL = int(os.environ.get("CHAT_USER_CACHE_TTL", 300))
+
+# Chat: cache of the rooms each user may join, checked on every connect
+CHAT_MEMBERSHIP_CACHE_SIZE = int(os.environ.get("CHAT_MEMBERSHIP_CACHE_SIZE", 1024))
+CHAT_MEMBERSHIP_CACHE_TTL = int(os.environ.get("CHAT_MEMBERSHIP_CACHE_TTL", 300))
+
+# Chat: number of recent messages replayed to a socket when it joins a room
+# (0 disables replay)
+CHAT_REPLAY_SIZE = int(os.environ.get("CHAT_REPLAY_SIZE", 50))
+
+# Chat: rows per query when streaming missed messages to reconnecting clients
+CHAT_CATCH_UP_BATCH_SIZE = int(os.environ.get("CHAT_CATCH_UP_BATCH_SIZE", 200))
+
+# Chat: how long (ms) to hold outgoing messages for clients that opted in to
+# coalesced frames with ?batch=1
+CHAT_COALESCE_WINDOW_MS = int(os.environ.get("CHAT_COALESCE_WINDOW_MS", 5))
+
+# Chat: `manage.py archive_messages` moves messages older than
+# CHAT_ARCHIVE_AFTER_DAYS into compressed segment files in CHAT_ARCHIVE_DIR
+CHAT_ARCHIVE_DIR = os.environ.get("CHAT_ARCHIVE_DIR", BASE_DIR / "chat_archive")
+CHAT_ARCHIVE_AFTER_DAYS = int(os.environ.get("CHAT_ARCHIVE_AFTER_DAYS", 90))
+# Rooms whose loaded archive (manifest and indexes) is kept between requests
+CHAT_ARCHIVE_CACHE_SIZE = int(os.environ.get("CHAT_ARCHIVE_CACHE_SIZE", 256))
+
+# Django cache: per-process memory by default; CACHE_BACKEND=redis shares it
+# (and the course response cache versions) between processes via REDIS_URL
+if os.environ.get("CACHE_BACKEND", "local").lower() == "redis":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+
+# Courses: seconds a cached course/material response may be served for its
+# version (also bounds staleness from changes no signal covers)
+COURSE_CACHE_TIMEOUT = int(os.environ.get("COURSE_CACHE_TIMEOUT", 300))
+
+# Courses: resumable material uploads collect chunks in
+# MATERIAL_UPLOAD_TEMP_DIR; files are limited to MATERIAL_UPLOAD_MAX_SIZE bytes
+# and each chunk to MATERIAL_UPLOAD_MAX_CHUNK_SIZE.
+# `manage.py expire_uploads` discards uploads idle for
+# MATERIAL_UPLOAD_EXPIRY_HOURS.
+MATERIAL_UPLOAD_TEMP_DIR = os.environ.get(
+    "MATERIAL_UPLOAD_TEMP_DIR", os.path.join(MEDIA_ROOT, "material_uploads")
+)
+MATERIAL_UPLOAD_MAX_SIZE = int(
+    os.environ.get("MATERIAL_UPLOAD_MAX_SIZE", 2 * 1024 * 1024 * 1024)
+)
+MATERIAL_UPLOAD_MAX_CHUNK_SIZE = int(
+    os.environ.get("MATERIAL_UPLOAD_MAX_CHUNK_SIZE", 8 * 1024 * 1024)
+)
+MATERIAL_UPLOAD_EXPIRY_HOURS = float(os.environ.get("MATERIAL_UPLOAD_EXPIRY_HOURS", 24))
+
+# Courses: material download links are signed and expire after
+# MATERIAL_DOWNLOAD_URL_MAX_AGE seconds (keep it above COURSE_CACHE_TIMEOUT).
+# Set MATERIAL_SENDFILE_HEADER (e.g. X-Accel-Redirect) to let the proxy send
+# the file from MATERIAL_SENDFILE_PREFIX + its storage name
+MATERIAL_DOWNLOAD_URL_MAX_AGE = int(
+    os.environ.get("MATERIAL_DOWNLOAD_URL_MAX_AGE", 6 * 60 * 60)
+)
+MATERIAL_SENDFILE_HEADER = os.environ.get("MATERIAL_SENDFILE_HEADER", "")
+MATERIAL_SENDFILE_PREFIX = os.environ.get("MATERIAL_SENDFILE_PREFIX", "/protected/")
+
+# Courses: worker processes rendering material thumbnails/previews
+# (0 renders them inline, after the upload's transaction commits)
+MATERIAL_PREVIEW_WORKERS = int(os.environ.get("MATERIAL_PREVIEW_WORKERS", 2))
+
+# Courses: search backend, "fts" (SQLite FTS5), "python" (in-process index)
+# or "auto" to use FTS5 whenever the database is SQLite
+COURSE_SEARCH_BACKEND = os.environ.get("COURSE_SEARCH_BACKEND", "auto")
+
+# Feedback: courses with more students than this stop fanning status updates
+# out to their teacher's timeline; the timeline pulls them instead
+TIMELINE_FANOUT_MAX_STUDENTS = int(os.environ.get("TIMELINE_FANOUT_MAX_STUDENTS", 500))
+
+# Unread notifications sent to a notification socket when it connects
+NOTIFICATIONS_SNAPSHOT_LIMIT = int(os.environ.get("NOTIFICATIONS_SNAPSHOT_LIMIT", 50))
 
 # Allow frontend origin
 # CORS_ALLOWED_ORIGINS = [
@@ -0,0 +1,267 @@
+"""
+Cold storage for old chat messages.
+
+Each room gets a directory under CHAT_ARCHIVE_DIR holding append-only
+segment files. A segment is a run of zlib-compressed msgpack blocks of up to
+BLOCK_SIZE messages, ordered by (timestamp, id), plus a small offset index
+(`.idx`) recording the first/last position, byte offset and length of every
+block. `manifest.json` lists a room's segments oldest first.
+
+Archived messages are always older than the ones left in the Message table:
+the archive covers positions up to `RoomArchive.last` and the hot table
+everything after it, so history pagination can continue from one into the
+other. Blocks are read through mmap and only the blocks a page touches are
+decompressed.
+
+A room's directory is deleted with the room. Deleting a user leaves their
+archived records in the segment files, but readers drop records whose
+sender no longer exists, so they are served by neither history nor exports.
+"""
+
+import bisect
+import json
+import mmap
+import os
+import shutil
+import zlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+import msgpack
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from .cache import TTLCache
+from .models import Message
+
+BLOCK_SIZE = 256
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def to_position(timestamp, pk):
+    """(datetime, id) -> (microseconds since epoch, id)"""
+    delta = timestamp - EPOCH
+    return (
+        (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds,
+        pk,
+    )
+
+
+def from_micros(micros):
+    return EPOCH + timedelta(microseconds=micros)
+
+
+def archive_root():
+    return Path(
+        getattr(settings, "CHAT_ARCHIVE_DIR", Path(settings.BASE_DIR) / "chat_archive")
+    )
+
+
+def room_directory(room_id, root=None):
+    return (root or archive_root()) / f"room_{room_id}"
+
+
+def manifest_version(directory):
+    """What identifies the current manifest of `directory`, None if absent."""
+    try:
+        stat = (directory / "manifest.json").stat()
+    except FileNotFoundError:
+        return None
+    # The manifest is replaced, never rewritten in place
+    return str(directory), stat.st_ino, stat.st_mtime_ns
+
+
+# room id -> (manifest version, RoomArchive), so history pages don't re-read
+# the manifest and every segment index while the archive is unchanged
+archive_cache = TTLCache(
+    max_size=getattr(settings, "CHAT_ARCHIVE_CACHE_SIZE", 256),
+    ttl=getattr(settings, "CHAT_ARCHIVE_CACHE_TTL", 3600),
+)
+
+
+def delete_archive(room_id):
+    archive_cache.invalidate(room_id)
+    shutil.rmtree(room_directory(room_id), ignore_errors=True)
+
+
+class Segment:
+    def __init__(self, path, index):
+        self.path = path
+        # [[first_position, last_position, offset, length, count], ...]
+        self.index = [
+            (tuple(first), tuple(last), offset, length, count)
+            for first, last, offset, length, count in index
+        ]
+        self.first = self.index[0][0]
+        self.last = self.index[-1][1]
+        self._lasts = [block[1] for block in self.index]
+
+    def read_block(self, number):
+        """Decompress block `number` into [(ts_us, id, sender_id, content)]."""
+        _, _, offset, length, _ = self.index[number]
+        with open(self.path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                raw = zlib.decompress(data[offset : offset + length])
+        return [tuple(record) for record in msgpack.unpackb(raw)]
+
+    def iter_after(self, position):
+        """Records strictly after `position`, oldest first."""
+        number = bisect.bisect_right(self._lasts, position)
+        for n in range(number, len(self.index)):
+            for record in self.read_block(n):
+                if record[:2] > position:
+                    yield record
+
+    def iter_before(self, position):
+        """Records strictly before `position`, newest first."""
+        number = bisect.bisect_left(self._lasts, position)
+        for n in range(min(number, len(self.index) - 1), -1, -1):
+            for record in reversed(self.read_block(n)):
+                if record[:2] < position:
+                    yield record
+
+
+class RoomArchive:
+    def __init__(self, room_id, root=None):
+        self.room_id = room_id
+        self.directory = room_directory(room_id, root)
+        self.segments = []
+        manifest = self.directory / "manifest.json"
+        if manifest.exists():
+            for name in json.loads(manifest.read_text())["segments"]:
+                index = msgpack.unpackb((self.directory / f"{name}.idx").read_bytes())
+                self.segments.append(Segment(self.directory / f"{name}.dat", index))
+
+    @classmethod
+    def for_room(cls, room_id):
+        """
+        The room's archive, or None if nothing has been archived. Loaded
+        once per version of its manifest.
+        """
+        version = manifest_version(room_directory(room_id))
+        if version is None:
+            return None
+        cached = archive_cache.get(room_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        archive = cls(room_id)
+        if not archive.segments:
+            return None
+        archive_cache.set(room_id, (version, archive))
+        return archive
+
+    @property
+    def last(self):
+        """Position of the newest archived message, or None."""
+        return self.segments[-1].last if self.segments else None
+
+    def last_datetime(self):
+        micros, pk = self.last
+        return from_micros(micros), pk
+
+    # Reading
+
+    def read_after(self, timestamp, pk, limit):
+        """Up to `limit` messages after the position, oldest first."""
+        position = to_position(timestamp, pk)
+        records = (
+            record
+            for segment in self.segments
+            if segment.last > position
+            for record in segment.iter_after(position)
+        )
+        return self.collect(records, limit)
+
+    def read_before(self, timestamp=None, pk=None, limit=50):
+        """Up to `limit` messages before the position (or the newest
+        archived ones without a position), newest first."""
+        position = to_position(timestamp, pk) if timestamp else (float("inf"), 0)
+        records = (
+            record
+            for segment in reversed(self.segments)
+            if segment.first < position
+            for record in segment.iter_before(position)
+        )
+        return self.collect(records, limit)
+
+    def collect(self, records, limit):
+        """Messages of the first `limit` records whose sender still exists."""
+        messages, batch = [], []
+        if limit <= 0:
+            return messages
+        for record in records:
+            batch.append(record)
+            if len(messages) + len(batch) >= limit:
+                messages += self.to_messages(batch)
+                batch = []
+                if len(messages) >= limit:
+                    return messages
+        return messages + self.to_messages(batch)
+
+    def iter_blocks(self):
+        """Every archived record, oldest first, a block at a time."""
+        for segment in self.segments:
+            for number in range(len(segment.index)):
+                yield segment.read_block(number)
+
+    def to_messages(self, records):
+        """
+        Unsaved Message instances (with senders attached) for records,
+        skipping those of deleted users.
+        """
+        if not records:
+            return []
+        senders = get_user_model().objects.in_bulk({r[2] for r in records})
+        return [
+            Message(
+                id=pk,
+                room_id=self.room_id,
+                sender=senders[sender_id],
+                content=content,
+                timestamp=from_micros(micros),
+            )
+            for micros, pk, sender_id, content in records
+            if sender_id in senders
+        ]
+
+    # Writing
+
+    def append(self, messages):
+        """
+        Write `messages` (ordered by timestamp, id and newer than anything
+        already archived) as a new segment. The segment and its index are
+        fsynced before the manifest is atomically replaced.
+        """
+        records = [
+            (*to_position(m.timestamp, m.id), m.sender_id, m.content) for m in messages
+        ]
+        if not records:
+            return None
+        if self.last is not None and records[0][:2] <= self.last:
+            raise ValueError("Archived messages must be appended in order")
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = "seg_%d_%d" % records[0][:2]
+        index, offset = [], 0
+        with open(self.directory / f"{name}.dat", "wb") as f:
+            for start in range(0, len(records), BLOCK_SIZE):
+                block = records[start : start + BLOCK_SIZE]
+                data = zlib.compress(msgpack.packb(block, use_bin_type=True))
+                f.write(data)
+                index.append(
+                    [block[0][:2], block[-1][:2], offset, len(data), len(block)]
+                )
+                offset += len(data)
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.directory / f"{name}.idx", "wb") as f:
+            f.write(msgpack.packb(index, use_bin_type=True))
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.segments.append(Segment(self.directory / f"{name}.dat", index))
+        manifest = self.directory / "manifest.json"
+        tmp = self.directory / "manifest.json.tmp"
+        tmp.write_text(json.dumps({"segments": [s.path.stem for s in self.segments]}))
+        os.replace(tmp, manifest)
+        return self.segments[-1]
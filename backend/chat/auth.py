@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import UntypedToken
+
+from .cache import TTLCache
+
+User = get_user_model()
+
+
+# Authenticated users for WebSocket connects, so reconnect storms don't turn
+# into one User query per socket. Entries are dropped when the user is saved
+# or deleted (see chat.signals).
+user_cache = TTLCache(
+    max_size=getattr(settings, "CHAT_USER_CACHE_SIZE", 1024),
+    ttl=getattr(settings, "CHAT_USER_CACHE_TTL", 300),
+)
+
+
+def decode_user_id(token):
+    """
+    Verify a JWT once and return the user id it carries.
+    Raises InvalidToken if the token is malformed, expired or badly signed.
+    """
+    try:
+        validated_token = UntypedToken(token)
+    except TokenError as e:
+        raise InvalidToken(str(e))
+    try:
+        return validated_token[api_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken("Token contained no recognizable user identification")
+
+
+def load_user(user_id):
+    """Fetch an active user from the database and cache it."""
+    user = User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+    if user is None or not user.is_active:
+        return None
+    user_cache.set(user.pk, user)
+    return user
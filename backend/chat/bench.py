@@ -0,0 +1,39 @@
+"""
+Helpers shared by the chat benchmark management commands.
+"""
+
+import json
+import math
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (None if empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize_ms(seconds):
+    """p50/p99/max of a list of durations in seconds, reported in ms."""
+    to_ms = lambda value: None if value is None else round(value * 1000, 3)
+    return {
+        "p50_ms": to_ms(percentile(seconds, 50)),
+        "p99_ms": to_ms(percentile(seconds, 99)),
+        "max_ms": to_ms(max(seconds) if seconds else None),
+    }
+
+
+def write_report(stdout, report, as_json):
+    """Print a benchmark report as JSON or as indented key/value lines."""
+    if as_json:
+        stdout.write(json.dumps(report, indent=2))
+        return
+    for section, values in report.items():
+        if isinstance(values, dict):
+            stdout.write(f"{section}:")
+            for key, value in values.items():
+                stdout.write(f"  {key}: {value}")
+        else:
+            stdout.write(f"{section}: {values}")
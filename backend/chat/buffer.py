@@ -0,0 +1,145 @@
+import asyncio
+import atexit
+import logging
+import threading
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from .models import Message
+
+logger = logging.getLogger(__name__)
+
+
+class MessageBuffer:
+    """
+    Per-process write-behind buffer for chat messages.
+
+    Messages are queued in memory and written with a single bulk_create once
+    the buffer reaches `batch_size` messages or `flush_interval` seconds after
+    the first queued message, whichever comes first.
+
+    A batch that fails is retried on later flushes, up to `max_retries`
+    times per message. After that its messages are written one by one and
+    the ones that still can't be (e.g. their room was deleted meanwhile)
+    are logged and dropped, so one bad row can't hold up the queue.
+    """
+
+    def __init__(self, batch_size=None, flush_interval=None, max_retries=None):
+        self.batch_size = batch_size or getattr(
+            settings, "CHAT_WRITE_BEHIND_BATCH_SIZE", 100
+        )
+        self.flush_interval = flush_interval or getattr(
+            settings, "CHAT_WRITE_BEHIND_FLUSH_INTERVAL", 0.5
+        )
+        self.max_retries = max_retries or getattr(
+            settings, "CHAT_WRITE_BEHIND_MAX_RETRIES", 3
+        )
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_task = None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    async def add(self, message):
+        """Queue an unsaved Message and flush if a threshold is reached."""
+        with self._lock:
+            self._pending.append(message)
+            full = len(self._pending) >= self.batch_size
+
+        if full:
+            await self.try_flush()
+        else:
+            self._arm_timer()
+
+    def _arm_timer(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        self._flush_task = None
+        await self.try_flush()
+
+    async def try_flush(self):
+        """
+        Flush for a consumer: a failure (maybe another user's bad row) is
+        logged and left to the timer instead of breaking the caller.
+        """
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Chat flush failed, retrying in %ss", self.flush_interval)
+            if len(self):
+                self._arm_timer()
+
+    async def flush(self):
+        await database_sync_to_async(self.flush_sync)()
+
+    def flush_sync(self):
+        """
+        Write every pending message. Returns the number of rows written;
+        raises if some of them were put back to be retried.
+        """
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+
+        try:
+            with transaction.atomic():
+                Message.objects.bulk_create(batch, batch_size=self.batch_size)
+        except Exception:
+            logger.exception("Failed to flush %d chat messages", len(batch))
+            for message in batch:
+                # Ids given out by an earlier chunk were rolled back with it
+                message.pk = None
+                message.flush_failures = getattr(message, "flush_failures", 0) + 1
+            retry = [m for m in batch if m.flush_failures < self.max_retries]
+            written = self.save_one_by_one(
+                [m for m in batch if m.flush_failures >= self.max_retries]
+            )
+            if not retry:
+                return written
+            # Put the rest back in front of anything queued meanwhile so the
+            # next flush retries it in order.
+            with self._lock:
+                self._pending[:0] = retry
+            raise
+        return len(batch)
+
+    def save_one_by_one(self, messages):
+        """Last try for messages out of retries; drops those that fail."""
+        written = 0
+        for message in messages:
+            try:
+                with transaction.atomic():
+                    Message.objects.bulk_create([message])
+            except Exception:
+                logger.exception(
+                    "Dropping chat message from user %s in room %s",
+                    message.sender_id,
+                    message.room_id,
+                )
+            else:
+                written += 1
+        return written
+
+
+message_buffer = MessageBuffer()
+
+
+def _drain_on_exit():
+    try:
+        message_buffer.flush_sync()
+    except Exception:
+        logger.exception(
+            "Dropping %d unsaved chat messages at shutdown", len(message_buffer)
+        )
+
+
+# Make sure a clean shutdown of the ASGI server doesn't drop queued messages
+atexit.register(_drain_on_exit)
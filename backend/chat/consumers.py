@@ -1,15 +1,29 @@
+import asyncio
+from datetime import datetime, timedelta
 from urllib.parse import parse_qs
+import msgpack
 from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
-from rest_framework_simplejwt.tokens import UntypedToken
-from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework.exceptions import ValidationError
+from rest_framework_simplejwt.exceptions import InvalidToken
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+from .auth import decode_user_id, load_user, user_cache
+from .buffer import message_buffer
+from .history import message_payload, payload_key, recent_messages
+from .membership import joinable_rooms, membership_cache
 from .models import ChatRoom, Message
+from .pagination import decode_cursor, messages_after
 from .serializers import MessageSerializer
 import json
 
 User = get_user_model()
 
+# How far before a socket joined its group a broadcast message can be
+# timestamped (time between receive() and group_send)
+CATCH_UP_OVERLAP_SECONDS = 5
+
 
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -21,70 +35,251 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close(code=4001)  # No token
             return
 
-        # Validate JWT
+        # Validate JWT (decoded once; the user comes from the cache when warm)
         try:
-            validated_token = UntypedToken(token)
-        except (InvalidToken, TokenError):
+            user_id = decode_user_id(token)
+        except InvalidToken:
             await self.close(code=4002)  # Invalid token
             return
 
+        user = user_cache.get(user_id)
+        if user is None:
+            user = await database_sync_to_async(load_user)(user_id)
+        if user is None:
+            await self.close(code=4002)  # Unknown or inactive user
+            return
+
         # Set the authenticated user
-        self.scope["user"] = await self.get_user_from_token(token)
+        self.scope["user"] = user
+
+        # Wire format: msgpack binary frames when asked for via the "msgpack"
+        # subprotocol or ?encoding=msgpack, JSON text frames otherwise
+        subprotocol = None
+        if "msgpack" in self.scope.get("subprotocols", []):
+            subprotocol = "msgpack"
+        self.binary = bool(subprotocol) or (
+            query_string.get("encoding", [None])[0] == "msgpack"
+        )
+        # ?batch=1 opts in to receiving messages coalesced into array frames
+        self.coalesce = query_string.get("batch", [None])[0] in ("1", "true")
+        self.outbox = []
+        self.outbox_flush = None
 
         self.room_name = self.scope["url_route"]["kwargs"]["room_name"]
         self.room_group_name = f"chat_{self.room_name}"
 
+        # Resolve and authorize the room from the cached membership index
+        rooms = membership_cache.get(user.pk)
+        if rooms is None:
+            rooms = await database_sync_to_async(joinable_rooms)(user)
+            membership_cache.set(user.pk, rooms)
+        self.room_id = rooms.get(self.room_name)
+        if self.room_id is None:
+            if await self.room_exists(self.room_name):
+                await self.close(code=4003)  # Not a member of this room
+            else:
+                await self.close(code=4004)  # Unknown room
+            return
+
         # Join room group
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
-        await self.accept()
+
+        # Reconnecting clients pass the last message they saw as ?since=<id>
+        # or ?cursor=<history cursor> and get exactly what they missed
+        position = await self.get_catch_up_position(
+            query_string.get("since", [None])[0],
+            query_string.get("cursor", [None])[0],
+        )
+
+        # Keys of everything sent before live delivery starts, so events that
+        # were queued on our channel meanwhile are not delivered twice
+        self.sent_on_join = set()
+        self.joined_at = timezone.now()
+
+        replay = []
+        if recent_messages.size:
+            recent_messages.join(self.room_name)
+            self.joined_recent = True
+            if position is None:
+                # Replay recent history from the in-memory buffer (one query
+                # when cold)
+                replay = await recent_messages.get(
+                    self.room_name, lambda: self.load_recent(self.room_id)
+                )
+
+        await self.accept(subprotocol=subprotocol)
+        if position is not None:
+            await self.catch_up(position)
+        elif replay:
+            await self.send_payloads(replay)
+            self.sent_on_join.update(payload_key(p) for p in replay)
+
+    async def send_payloads(self, payloads):
+        if self.coalesce:
+            await self.send_frame(payloads)
+        else:
+            for payload in payloads:
+                await self.send_frame(payload)
+
+    async def catch_up(self, position):
+        """
+        Stream every message after `position` in (timestamp, id) order, in
+        batches of CHAT_CATCH_UP_BATCH_SIZE, then tell the client it is live.
+        Runs before any queued live event is dispatched to this consumer.
+        """
+        # Make sure messages broadcast before we joined are queryable
+        if getattr(settings, "CHAT_WRITE_BEHIND", False):
+            await message_buffer.try_flush()
+
+        batch_size = getattr(settings, "CHAT_CATCH_UP_BATCH_SIZE", 200)
+        # Only messages this recent can also be sitting in our channel queue
+        boundary = self.joined_at - timedelta(seconds=CATCH_UP_OVERLAP_SECONDS)
+        while True:
+            payloads, last = await self.fetch_missed(position, batch_size)
+            if payloads:
+                await self.send_payloads(payloads)
+            self.sent_on_join.update(
+                payload_key(p)
+                for p in payloads
+                if datetime.fromisoformat(p["timestamp"]) >= boundary
+            )
+            if len(payloads) < batch_size:
+                break
+            position = last
+        await self.send_frame({"caught_up": True})
 
     @database_sync_to_async
-    def get_user_from_token(self, token):
-        from rest_framework_simplejwt.backends import TokenBackend
+    def get_catch_up_position(self, since, cursor):
+        """Resolve ?since=<message id> or ?cursor= to a (timestamp, id) tuple."""
+        if cursor:
+            try:
+                return decode_cursor(cursor)
+            except ValidationError:
+                return None
+        if since and since.isdigit():
+            return (
+                Message.objects.filter(room_id=self.room_id, id=since)
+                .values_list("timestamp", "id")
+                .first()
+            )
+        return None
+
+    @database_sync_to_async
+    def fetch_missed(self, position, limit):
+        messages = list(
+            messages_after(
+                Message.objects.filter(room_id=self.room_id).select_related("sender"),
+                *position,
+            )[:limit]
+        )
+        if not messages:
+            return [], position
+        last = messages[-1]
+        return [message_payload(m) for m in messages], (last.timestamp, last.id)
 
-        backend = TokenBackend("HS256")
-        decoded_data = backend.decode(token, verify=True)
-        return User.objects.get(id=decoded_data["user_id"])
+    async def send_frame(self, data):
+        if self.binary:
+            await self.send(bytes_data=msgpack.packb(data, use_bin_type=True))
+        else:
+            await self.send(text_data=json.dumps(data))
+
+    async def flush_outbox(self, delay):
+        await asyncio.sleep(delay)
+        self.outbox_flush = None
+        batch, self.outbox = self.outbox, []
+        if batch:
+            await self.send_frame(batch)
+
+    @database_sync_to_async
+    def room_exists(self, room_name):
+        return ChatRoom.objects.filter(name=room_name).exists()
+
+    @database_sync_to_async
+    def load_recent(self, room_id):
+        messages = (
+            Message.objects.filter(room_id=room_id)
+            .select_related("sender")
+            .order_by("-timestamp", "-id")[: recent_messages.size]
+        )
+        return [message_payload(m) for m in reversed(messages)]
 
     async def disconnect(self, close_code):
+        if getattr(self, "outbox_flush", None):
+            self.outbox_flush.cancel()
+
+        if getattr(self, "joined_recent", False):
+            recent_messages.leave(self.room_name)
+
         # Leave room group
-        await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        if hasattr(self, "room_group_name"):
+            await self.channel_layer.group_discard(
+                self.room_group_name, self.channel_name
+            )
+
+        # Don't leave this socket's messages waiting on the flush timer
+        if getattr(settings, "CHAT_WRITE_BEHIND", False):
+            await message_buffer.try_flush()
 
-    async def receive(self, text_data):
-        data = json.loads(text_data)
+    async def receive(self, text_data=None, bytes_data=None):
+        if bytes_data is not None:
+            data = msgpack.unpackb(bytes_data, raw=False)
+        else:
+            data = json.loads(text_data)
         message = data.get("message")
         user = self.scope["user"]
 
         if not message or not user.is_authenticated:
             return
 
-        # Save message to DB
-        msg_obj = await self.save_message(user, self.room_name, message)
+        if getattr(settings, "CHAT_WRITE_BEHIND", False):
+            # Broadcast right away and let the buffer persist it in a batch
+            msg_obj = Message(
+                room_id=self.room_id,
+                sender=user,
+                content=message,
+                timestamp=timezone.now(),
+            )
+        else:
+            # Save message to DB
+            msg_obj = await self.save_message(user, self.room_id, message)
 
         # Broadcast to room group
         await self.channel_layer.group_send(
             self.room_group_name,
-            {
-                "type": "chat_message",
-                "message": message,
-                "user": user.username,
-                "timestamp": msg_obj.timestamp.isoformat(),
-            },
+            {"type": "chat_message", **message_payload(msg_obj)},
         )
 
+        if getattr(settings, "CHAT_WRITE_BEHIND", False):
+            await message_buffer.add(msg_obj)
+
     async def chat_message(self, event):
+        payload = {
+            "id": event.get("id"),
+            "message": event["message"],
+            "user": event["user"],
+            "timestamp": event["timestamp"],
+        }
+        recent_messages.append(self.room_name, payload)
+
+        # Events queued while we were connecting may already have been sent
+        # by the replay or catch-up
+        if payload_key(payload) in self.sent_on_join:
+            return
+
+        if self.coalesce:
+            # Hold the message briefly so a burst goes out as one frame
+            self.outbox.append(payload)
+            if self.outbox_flush is None:
+                self.outbox_flush = asyncio.ensure_future(
+                    self.flush_outbox(
+                        getattr(settings, "CHAT_COALESCE_WINDOW_MS", 5) / 1000
+                    )
+                )
+            return
+
         # Send message to WebSocket
-        await self.send(
-            text_data=json.dumps(
-                {
-                    "message": event["message"],
-                    "user": event["user"],
-                    "timestamp": event["timestamp"],
-                }
-            )
-        )
+        await self.send_frame(payload)
 
     @database_sync_to_async
-    def save_message(self, user, room_name, content):
-        room = ChatRoom.objects.get(name=room_name)
-        return Message.objects.create(room=room, sender=user, content=content)
+    def save_message(self, user, room_id, content):
+        return Message.objects.create(room_id=room_id, sender=user, content=content)
@@ -0,0 +1,137 @@
+import asyncio
+from collections import Counter, deque
+
+from django.conf import settings
+
+
+def message_payload(message):
+    """
+    The JSON-serializable form of a Message sent to WebSocket clients.
+    `id` is None for messages still waiting in the write-behind buffer.
+    """
+    return {
+        "id": message.id,
+        "message": message.content,
+        "user": message.sender.username,
+        "timestamp": message.timestamp.isoformat(),
+    }
+
+
+def payload_key(payload):
+    """
+    Identity of a payload that is stable whether it came from the database
+    or from a broadcast (write-behind broadcasts have no id yet).
+    """
+    return (payload["timestamp"], payload["user"], payload["message"])
+
+
+class RoomBuffer:
+    """A ring buffer of payloads with O(1) duplicate checks."""
+
+    def __init__(self, size, payloads=()):
+        self.payloads = deque(maxlen=size)
+        self.keys = set()
+        for payload in payloads:
+            self.append(payload)
+
+    def __contains__(self, payload):
+        return payload_key(payload) in self.keys
+
+    def __iter__(self):
+        return iter(self.payloads)
+
+    def append(self, payload):
+        if payload in self:
+            return
+        if len(self.payloads) == self.payloads.maxlen:
+            self.keys.discard(payload_key(self.payloads[0]))
+        self.payloads.append(payload)
+        self.keys.add(payload_key(payload))
+
+
+class RecentMessages:
+    """
+    Per-room ring buffers of the last `size` message payloads, used to replay
+    history to a socket right after it joins.
+
+    A room's buffer lives only while this process has at least one socket in
+    the room: every local socket sees every broadcast for the room, so the
+    buffer can be kept current from the group events without extra queries.
+    When the last local socket leaves, the buffer is dropped and the next
+    join loads it from the database once.
+
+    Meant to be used from a single event loop (one per ASGI process).
+    """
+
+    def __init__(self, size=None):
+        self.size = (
+            size if size is not None else getattr(settings, "CHAT_REPLAY_SIZE", 50)
+        )
+        self.hits = 0
+        self.misses = 0
+        self._buffers = {}
+        self._loading = {}
+        self._listeners = Counter()
+
+    def join(self, room_name):
+        self._listeners[room_name] += 1
+
+    def leave(self, room_name):
+        self._listeners[room_name] -= 1
+        if self._listeners[room_name] <= 0:
+            del self._listeners[room_name]
+            self._buffers.pop(room_name, None)
+
+    def evict(self, room_name):
+        """Drop a room's buffer so the next join reloads it."""
+        self._buffers.pop(room_name, None)
+
+    def evict_all(self):
+        self._buffers.clear()
+
+    def append(self, room_name, payload):
+        """Record a broadcast payload; duplicates from other sockets are ignored."""
+        buffer = self._buffers.get(room_name)
+        if buffer is not None:
+            buffer.append(payload)
+
+    async def get(self, room_name, loader):
+        """
+        Return the buffered payloads for a room, oldest first. On a cold
+        buffer the rows come from `loader` (an async callable returning
+        payloads oldest first); concurrent joins share the same load.
+        """
+        if room_name in self._loading:
+            await asyncio.shield(self._loading[room_name])
+            return list(self._buffers.get(room_name, ()))
+
+        if room_name in self._buffers:
+            self.hits += 1
+            return list(self._buffers[room_name])
+
+        self.misses += 1
+        # Start buffering broadcasts now so nothing sent during the load is lost
+        self._buffers[room_name] = RoomBuffer(self.size)
+        self._loading[room_name] = asyncio.ensure_future(loader())
+        try:
+            rows = await self._loading[room_name]
+        except BaseException:
+            self._buffers.pop(room_name, None)
+            raise
+        finally:
+            del self._loading[room_name]
+
+        # The last local socket may have left while we were loading
+        arrived = self._buffers.pop(room_name, None) or ()
+        buffer = RoomBuffer(self.size, rows)
+        for payload in arrived:
+            buffer.append(payload)
+        if room_name in self._listeners:
+            self._buffers[room_name] = buffer
+        return list(buffer)
+
+    def stats(self):
+        return {"rooms": len(self._buffers), "hits": self.hits, "misses": self.misses}
+
+
+recent_messages = RecentMessages()
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import time
+
+import msgpack
+from channels.exceptions import ChannelFull
+from channels.layers import InMemoryChannelLayer
+
+logger = logging.getLogger(__name__)
+
+
+class LocalChannelLayer(InMemoryChannelLayer):
+    """
+    In-process channel layer for single-node deployments.
+
+    Behaves like channels_redis.core.RedisChannelLayer without the network
+    hop: messages are msgpack-encoded (so anything Redis would reject is
+    rejected here too), `send` raises ChannelFull when a channel is at
+    capacity, `group_send` silently skips full channels, and messages and
+    group memberships expire after `expiry` / `group_expiry` seconds.
+
+    Compared to channels' InMemoryChannelLayer, a group_send encodes the
+    message once and enqueues it directly instead of spawning a task and a
+    deepcopy per member, and expiry sweeps run at most every
+    `clean_interval` seconds instead of on every call.
+
+    Only sockets served by the same process can reach each other, so this
+    must not be used when running more than one ASGI worker.
+    """
+
+    def __init__(
+        self,
+        expiry=60,
+        group_expiry=86400,
+        capacity=100,
+        channel_capacity=None,
+        clean_interval=1,
+        **kwargs,
+    ):
+        super().__init__(
+            expiry=expiry,
+            group_expiry=group_expiry,
+            capacity=capacity,
+            channel_capacity=channel_capacity,
+            **kwargs,
+        )
+        self.clean_interval = clean_interval
+        self._next_clean = 0
+
+    # Serialization
+
+    def serialize(self, message):
+        return msgpack.packb(message, use_bin_type=True)
+
+    def deserialize(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+    # Channel layer API
+
+    def _get_queue(self, channel):
+        queue = self.channels.get(channel)
+        if queue is None:
+            queue = self.channels[channel] = asyncio.Queue(
+                maxsize=self.get_capacity(channel)
+            )
+        return queue
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_channel_name(channel)
+        assert "__asgi_channel__" not in message
+
+        try:
+            self._get_queue(channel).put_nowait(
+                (time.time() + self.expiry, self.serialize(message))
+            )
+        except asyncio.QueueFull:
+            raise ChannelFull(channel)
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        self._clean_expired()
+
+        while True:
+            queue = self._get_queue(channel)
+            try:
+                expires, data = await queue.get()
+            finally:
+                if queue.empty() and self.channels.get(channel) is queue:
+                    self.channels.pop(channel, None)
+            # A message can outlive its expiry between two sweeps
+            if expires >= time.time():
+                return self.deserialize(data)
+
+    def _clean_expired(self):
+        now = time.time()
+        if now < self._next_clean:
+            return
+        self._next_clean = now + self.clean_interval
+        super()._clean_expired()
+
+    # Groups extension
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "Message is not a dict"
+        self.require_valid_group_name(group)
+        self._clean_expired()
+
+        channels = list(self.groups.get(group, ()))
+        if not channels:
+            return
+
+        item = (time.time() + self.expiry, self.serialize(message))
+        over_capacity = 0
+        for channel in channels:
+            try:
+                self._get_queue(channel).put_nowait(item)
+            except asyncio.QueueFull:
+                over_capacity += 1
+
+        if over_capacity:
+            logger.info(
+                "%s of %s channels over capacity in group %s",
+                over_capacity,
+                len(channels),
+                group,
+            )
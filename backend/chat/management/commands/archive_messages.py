@@ -0,0 +1,74 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from chat.archive import RoomArchive
+from chat.models import Message
+
+DELETE_CHUNK = 500
+
+
+def delete_ids(ids):
+    for start in range(0, len(ids), DELETE_CHUNK):
+        Message.objects.filter(id__in=ids[start : start + DELETE_CHUNK]).delete()
+
+
+class Command(BaseCommand):
+    help = (
+        "Move chat messages older than --older-than-days out of the Message "
+        "table into compressed per-room segment files under CHAT_ARCHIVE_DIR."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-days",
+            type=int,
+            default=getattr(settings, "CHAT_ARCHIVE_AFTER_DAYS", 90),
+        )
+        parser.add_argument("--room", type=int, help="Only archive this room id.")
+        parser.add_argument(
+            "--batch-size", type=int, default=10000, help="Messages per segment."
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["older_than_days"])
+        old = Message.objects.filter(timestamp__lt=cutoff)
+        if options["room"]:
+            old = old.filter(room_id=options["room"])
+
+        total = 0
+        for room_id in old.values_list("room_id", flat=True).distinct():
+            archive = RoomArchive(room_id)
+            self.recover(archive)
+            while True:
+                batch = list(
+                    old.filter(room_id=room_id).order_by("timestamp", "id")[
+                        : options["batch_size"]
+                    ]
+                )
+                if not batch:
+                    break
+                # Rows are only deleted once their segment is safely on disk
+                archive.append(batch)
+                delete_ids([m.id for m in batch])
+                total += len(batch)
+            self.stdout.write(f"Room {room_id}: archived up to {archive.last}")
+
+        self.stdout.write(self.style.SUCCESS(f"Archived {total} messages."))
+
+    def recover(self, archive):
+        """
+        Finish an interrupted run: delete rows that made it into the newest
+        segment but were not removed from the table.
+        """
+        if not archive.segments:
+            return
+        segment = archive.segments[-1]
+        ids = [
+            record[1]
+            for number in range(len(segment.index))
+            for record in segment.read_block(number)
+        ]
+        delete_ids(ids)
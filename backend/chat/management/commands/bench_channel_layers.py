@@ -0,0 +1,115 @@
+import asyncio
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+
+from chat.bench import summarize_ms, write_report
+from chat.layers import LocalChannelLayer
+
+
+def make_redis_layer(redis_url=None, **config):
+    """
+    A RedisChannelLayer pointed at `redis_url`, or at an in-process fake
+    Redis server (fakeredis) when no URL is given. Returns None if neither
+    is available.
+    """
+    try:
+        from channels_redis.core import RedisChannelLayer
+    except ImportError:
+        return None
+
+    if redis_url:
+        return RedisChannelLayer(hosts=[redis_url], **config)
+
+    try:
+        import fakeredis
+    except ImportError:
+        return None
+
+    server = fakeredis.FakeServer()
+
+    class FakeRedisChannelLayer(RedisChannelLayer):
+        def create_pool(self, index):
+            return fakeredis.FakeAsyncRedis(server=server).connection_pool
+
+    return FakeRedisChannelLayer(hosts=["redis://fakeredis"], **config)
+
+
+async def measure_fanout(layer, receivers, messages):
+    """
+    Join `receivers` channels to one group, group_send `messages` messages
+    and time how long each takes to reach every member.
+    """
+    group = "bench"
+    channels = [await layer.new_channel() for _ in range(receivers)]
+    for channel in channels:
+        await layer.group_add(group, channel)
+
+    sent_at = {}
+    latest = [0.0] * messages
+
+    async def consume(channel):
+        for _ in range(messages):
+            event = await layer.receive(channel)
+            seq = event["seq"]
+            latest[seq] = max(latest[seq], time.perf_counter() - sent_at[seq])
+
+    tasks = [asyncio.create_task(consume(channel)) for channel in channels]
+    # Let the receivers start waiting before we measure
+    await asyncio.sleep(0.05)
+
+    start = time.perf_counter()
+    for seq in range(messages):
+        sent_at[seq] = time.perf_counter()
+        await layer.group_send(
+            group, {"type": "chat_message", "seq": seq, "message": "x" * 64}
+        )
+        # Stay under the per-channel capacity so nothing is dropped
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    await layer.flush()
+    return {
+        "deliveries_per_sec": round(receivers * messages / elapsed, 1),
+        **summarize_ms(latest),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare group_send fan-out latency of the in-process channel layers "
+        "against channels_redis (a fake in-process Redis unless --redis-url "
+        "is given)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--receivers", type=int, default=100)
+        parser.add_argument("--messages", type=int, default=200)
+        parser.add_argument("--redis-url", default=None)
+        parser.add_argument("--json", action="store_true")
+
+    def handle(self, *args, **options):
+        # Capacity is raised so the run measures latency, not drops
+        layers = {
+            "local": LocalChannelLayer(capacity=options["messages"]),
+            "inmemory": InMemoryChannelLayer(capacity=options["messages"]),
+        }
+        redis_layer = make_redis_layer(
+            options["redis_url"], capacity=options["messages"]
+        )
+        if redis_layer is not None:
+            layers["redis"] = redis_layer
+        else:
+            self.stderr.write("channels_redis/fakeredis not installed; skipping redis")
+
+        report = {
+            "receivers": options["receivers"],
+            "messages": options["messages"],
+        }
+        for name, layer in layers.items():
+            report[name] = asyncio.run(
+                measure_fanout(layer, options["receivers"], options["messages"])
+            )
+        write_report(self.stdout, report, options["json"])
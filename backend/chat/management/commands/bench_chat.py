@@ -0,0 +1,212 @@
+import asyncio
+import json
+import time
+import tracemalloc
+
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from chat.bench import summarize_ms, write_report
+from chat.models import ChatRoom
+
+User = get_user_model()
+
+LAYERS = {
+    "local": {"BACKEND": "chat.layers.LocalChannelLayer"},
+    "inmemory": {"BACKEND": "channels.layers.InMemoryChannelLayer"},
+}
+
+
+def create_fixtures(connections, rooms):
+    """Create bench users and rooms; returns [(room_name, token)] per socket."""
+    room_objs = [ChatRoom.objects.create(name=f"bench_room_{i}") for i in range(rooms)]
+    users = []
+    for i in range(connections):
+        user = User(username=f"bench_user_{i}", role="student")
+        user.set_unusable_password()
+        users.append(user)
+    users = User.objects.bulk_create(users)
+
+    plan = []
+    for i, user in enumerate(users):
+        room = room_objs[i % rooms]
+        room.participants.add(user)
+        plan.append((room.name, str(RefreshToken.for_user(user).access_token)))
+    return plan
+
+
+async def open_connections(application, plan):
+    """Connect every socket, returning (communicators, connect latencies)."""
+    communicators, latencies = [], []
+    for room_name, token in plan:
+        communicator = WebsocketCommunicator(
+            application, f"/ws/chat/{room_name}/?token={token}"
+        )
+        start = time.perf_counter()
+        connected, code = await communicator.connect(timeout=10)
+        latencies.append(time.perf_counter() - start)
+        if not connected:
+            raise RuntimeError(f"Connection to {room_name} rejected ({code})")
+        communicators.append(communicator)
+    return communicators, latencies
+
+
+async def drive(communicators, plan, rate, duration, settle):
+    """
+    Send `rate` messages/sec for `duration` seconds, round-robin over the
+    sockets, while every socket reads its room's broadcasts. Each message
+    carries its send time so receivers can compute delivery latency.
+    """
+    total = int(rate * duration)
+    members = {}
+    for communicator, (room_name, _) in zip(communicators, plan):
+        members.setdefault(room_name, []).append(communicator)
+
+    # Every socket in a room receives every message sent to that room
+    expected = {id(c): 0 for c in communicators}
+    for seq in range(total):
+        room_name = plan[seq % len(plan)][0]
+        for communicator in members[room_name]:
+            expected[id(communicator)] += 1
+
+    latencies = []
+
+    async def read(communicator):
+        received = 0
+        while received < expected[id(communicator)]:
+            try:
+                frame = await communicator.receive_output(timeout=settle)
+            except asyncio.TimeoutError:
+                return received
+            if frame["type"] != "websocket.send" or "text" not in frame:
+                continue
+            payload = json.loads(frame["text"])
+            sent_at = float(payload["message"].split(" ")[-1])
+            latencies.append(time.perf_counter() - sent_at)
+            received += 1
+        return received
+
+    readers = [asyncio.create_task(read(c)) for c in communicators]
+
+    start = time.perf_counter()
+    for seq in range(total):
+        communicator = communicators[seq % len(communicators)]
+        await communicator.send_to(
+            text_data=json.dumps({"message": f"bench {seq} {time.perf_counter()}"})
+        )
+        # Pace the sender against the wall clock rather than per-message sleeps
+        delay = start + (seq + 1) / rate - time.perf_counter()
+        await asyncio.sleep(max(delay, 0))
+    send_elapsed = time.perf_counter() - start
+
+    delivered = sum(await asyncio.gather(*readers))
+    elapsed = time.perf_counter() - start
+    return {
+        "sent": total,
+        "sent_per_sec": round(total / send_elapsed, 1) if send_elapsed else None,
+        "expected_deliveries": sum(expected.values()),
+        "delivered": delivered,
+        "delivered_per_sec": round(delivered / elapsed, 1) if elapsed else None,
+        **summarize_ms(latencies),
+    }
+
+
+async def close_connections(communicators):
+    for communicator in communicators:
+        try:
+            await communicator.disconnect()
+        except BaseException:
+            # The communicator was already torn down by a receive timeout
+            pass
+
+
+async def run(options, plan):
+    from backend.asgi import application
+
+    tracemalloc.start()
+    baseline = tracemalloc.take_snapshot()
+    communicators, connect_latencies = await open_connections(application, plan)
+    opened = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    memory = sum(stat.size_diff for stat in opened.compare_to(baseline, "filename"))
+
+    try:
+        delivery = await drive(
+            communicators,
+            plan,
+            options["rate"],
+            options["duration"],
+            options["settle"],
+        )
+    finally:
+        await close_connections(communicators)
+
+    return {
+        "connect": {
+            "connections": len(communicators),
+            **summarize_ms(connect_latencies),
+        },
+        "delivery": delivery,
+        "memory": {
+            "bytes_per_connection": memory // max(len(communicators), 1),
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test ChatConsumer through the ASGI application: open N "
+        "authenticated sockets across M rooms, send messages at a fixed rate "
+        "and report connect latency, throughput, delivery latency and memory. "
+        "Runs against a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--connections", type=int, default=50)
+        parser.add_argument("--rooms", type=int, default=5)
+        parser.add_argument(
+            "--rate", type=float, default=200, help="Messages per second."
+        )
+        parser.add_argument("--duration", type=float, default=5, help="Seconds.")
+        parser.add_argument(
+            "--settle",
+            type=float,
+            default=5,
+            help="Seconds to wait for outstanding deliveries before giving up.",
+        )
+        parser.add_argument(
+            "--layer",
+            choices=[*LAYERS, "settings"],
+            default="local",
+            help="Channel layer to use ('settings' keeps CHANNEL_LAYERS).",
+        )
+        parser.add_argument("--json", action="store_true")
+        parser.add_argument("--output", help="Also write the JSON report to this file.")
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            plan = create_fixtures(options["connections"], options["rooms"])
+            layers = None
+            if options["layer"] != "settings":
+                layers = {"default": LAYERS[options["layer"]]}
+            with override_settings(**({"CHANNEL_LAYERS": layers} if layers else {})):
+                report = asyncio.run(run(options, plan))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = {
+            "config": {
+                key: options[key]
+                for key in ("connections", "rooms", "rate", "duration", "layer")
+            },
+            **report,
+        }
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+        write_report(self.stdout, report, options["json"])
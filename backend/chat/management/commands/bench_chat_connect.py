@@ -0,0 +1,84 @@
+import asyncio
+import time
+
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from chat.auth import user_cache
+from chat.bench import summarize_ms, write_report
+from chat.management.commands.bench_chat import (
+    LAYERS,
+    close_connections,
+    create_fixtures,
+    open_connections,
+)
+from chat.membership import membership_cache
+
+
+async def measure(application, plan, iterations, cached):
+    """Time connect+accept for every socket in `plan`, `iterations` times."""
+    latencies = []
+    for _ in range(iterations):
+        for room_name, token in plan:
+            if not cached:
+                user_cache.clear()
+                membership_cache.clear()
+            communicator = WebsocketCommunicator(
+                application, f"/ws/chat/{room_name}/?token={token}"
+            )
+            start = time.perf_counter()
+            connected, code = await communicator.connect(timeout=10)
+            latencies.append(time.perf_counter() - start)
+            if not connected:
+                raise RuntimeError(f"Connection to {room_name} rejected ({code})")
+            await communicator.disconnect()
+    return {"connects": len(latencies), **summarize_ms(latencies)}
+
+
+async def run(plan, rooms, iterations):
+    from backend.asgi import application
+
+    # Keep one socket open per room so the replay buffers stay warm and the
+    # numbers only reflect authentication and room authorization.
+    anchors, _ = await open_connections(application, plan[:rooms])
+    try:
+        report = {
+            "uncached": await measure(application, plan, iterations, cached=False),
+        }
+        # Warm the caches, then measure
+        await measure(application, plan, 1, cached=True)
+        report["cached"] = await measure(application, plan, iterations, cached=True)
+    finally:
+        await close_connections(anchors)
+    return report
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure ChatConsumer connect latency with the user and room "
+        "membership caches cleared before every connect versus warm. Runs "
+        "against a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--rooms", type=int, default=5)
+        parser.add_argument("--iterations", type=int, default=5)
+        parser.add_argument("--json", action="store_true")
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            plan = create_fixtures(options["users"], options["rooms"])
+            with override_settings(CHANNEL_LAYERS={"default": LAYERS["local"]}):
+                report = asyncio.run(run(plan, options["rooms"], options["iterations"]))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = {
+            "config": {key: options[key] for key in ("users", "rooms", "iterations")},
+            **report,
+        }
+        write_report(self.stdout, report, options["json"])
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from chat.search import fts_available, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index over chat messages."
+
+    def handle(self, *args, **options):
+        if not fts_available():
+            self.stderr.write("Full-text search needs SQLite FTS5; nothing to do.")
+            return
+        total = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} messages."))
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.db.models import Q
+
+from .cache import TTLCache
+from .models import ChatRoom
+
+# user id -> {room name: room id} of every room the user may join.
+# Kept current by the signal handlers in chat.signals.
+membership_cache = TTLCache(
+    max_size=getattr(settings, "CHAT_MEMBERSHIP_CACHE_SIZE", 1024),
+    ttl=getattr(settings, "CHAT_MEMBERSHIP_CACHE_TTL", 300),
+)
+
+
+def joinable_rooms(user):
+    """
+    Rooms a user may join, as {name: id}:
+    - rooms listing the user as a participant
+    - course rooms of courses the user is enrolled in or teaches
+    - public rooms that don't belong to a course (e.g. dashboard_chat)
+    """
+    rooms = (
+        ChatRoom.objects.filter(
+            Q(participants=user)
+            | Q(course__enrollments__student=user)
+            | Q(course__teacher=user)
+            | Q(is_private=False, course__isnull=True)
+        )
+        .values_list("name", "id")
+        .distinct()
+    )
+    return dict(rooms)
+
+
+def get_joinable_rooms(user):
+    """Cached version of joinable_rooms (runs one query on a miss)."""
+    rooms = membership_cache.get(user.pk)
+    if rooms is None:
+        rooms = joinable_rooms(user)
+        membership_cache.set(user.pk, rooms)
+    return rooms
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:48
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0004_message_fts"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="message",
+            options={},
+        ),
+    ]
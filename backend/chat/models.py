@@ -1,6 +1,8 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from courses.models import Course
+from .history import recent_messages
 
 User = settings.AUTH_USER_MODEL
 
@@ -35,16 +37,49 @@ class ChatRoom(models.Model):
         return self.name or f"Course chat for {self.course.title}"
 
 
+def evict_replayed(room_ids):
+    """Make the next join of these rooms reload their replay buffers."""
+    names = ChatRoom.objects.filter(pk__in=room_ids).values_list("name", flat=True)
+    for name in names:
+        recent_messages.evict(name)
+
+
+class MessageQuerySet(models.QuerySet):
+    def delete(self):
+        # Evicted here rather than from a post_delete receiver, which would
+        # make every bulk delete (archiving, cascades) fetch and signal rows
+        room_ids = set(self.values_list("room_id", flat=True).distinct())
+        result = super().delete()
+        evict_replayed(room_ids)
+        return result
+
+
 class Message(models.Model):
     room = models.ForeignKey(
         ChatRoom, on_delete=models.CASCADE, related_name="messages"
     )
     sender = models.ForeignKey(User, on_delete=models.CASCADE)
     content = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set in Python rather than with auto_now_add so that messages buffered by
+    # the write-behind path keep the time they were received, not flushed.
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
+
+    objects = MessageQuerySet.as_manager()
 
+    # No default ordering: sorting is requested explicitly by the queries that
+    # need it, so plain filters/counts don't sort the whole table.
     class Meta:
-        ordering = ["timestamp"]
+        indexes = [
+            # Backs keyset pagination of a room's history
+            models.Index(
+                fields=["room", "timestamp", "id"], name="chat_message_room_ts_id"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.sender.username}: {self.content[:30]}"
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        evict_replayed([self.room_id])
+        return result
@@ -0,0 +1,89 @@
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework import serializers
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(message):
+    """Encode a message's (timestamp, id) position as an opaque cursor."""
+    raw = f"{message.timestamp.isoformat()}|{message.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return the (timestamp, id) tuple stored in a cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        timestamp, pk = raw.split("|")
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (binascii.Error, UnicodeError, ValueError):
+        raise serializers.ValidationError({"cursor": "Invalid cursor."})
+
+
+def get_page_size(value):
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def messages_after(queryset, timestamp, pk):
+    """Messages strictly after the (timestamp, id) position, oldest first."""
+    return queryset.filter(
+        Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=pk)
+    ).order_by("timestamp", "id")
+
+
+def paginate_messages(
+    queryset, before=None, after=None, limit=DEFAULT_PAGE_SIZE, archive=None
+):
+    """
+    Keyset pagination over (timestamp, id).
+
+    Returns `(messages, has_older, has_newer)` with messages in chronological
+    order. Without a cursor the newest page is returned. Each query reads at
+    most `limit + 1` rows from the (room, timestamp, id) index, so the cost
+    does not depend on how large the room is.
+
+    With an `archive` (chat.archive.RoomArchive), pages that run past the
+    oldest row in the table continue into the archived messages.
+    """
+    boundary = archive.last_datetime() if archive else None
+    if boundary:
+        # Anything at or before the boundary is served from the archive
+        queryset = messages_after(queryset, *boundary)
+
+    if after:
+        timestamp, pk = decode_cursor(after)
+        rows = []
+        if boundary and (timestamp, pk) < boundary:
+            rows = archive.read_after(timestamp, pk, limit + 1)
+        if len(rows) <= limit:
+            rows += list(
+                messages_after(queryset, timestamp, pk)[: limit + 1 - len(rows)]
+            )
+        has_newer = len(rows) > limit
+        return rows[:limit], True, has_newer
+
+    if before:
+        timestamp, pk = decode_cursor(before)
+        queryset = queryset.filter(
+            Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk)
+        )
+
+    rows = list(queryset.order_by("-timestamp", "-id")[: limit + 1])
+    if boundary and len(rows) <= limit:
+        if before and (timestamp, pk) <= boundary:
+            rows += archive.read_before(timestamp, pk, limit + 1 - len(rows))
+        else:
+            rows += archive.read_before(limit=limit + 1 - len(rows))
+    has_older = len(rows) > limit
+    rows = rows[:limit]
+    rows.reverse()
+    return rows, has_older, bool(before)
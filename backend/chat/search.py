@@ -0,0 +1,81 @@
+import re
+
+from django.db import connection, transaction
+
+from .models import Message
+
+FTS_TABLE = "chat_message_fts"
+SNIPPET_TOKENS = 12
+
+
+def fts_available():
+    return connection.vendor == "sqlite"
+
+
+def build_match_query(query):
+    """
+    Turn free text into an FTS5 MATCH expression: every word must appear,
+    and the last word also matches as a prefix so partial words work. Words
+    are quoted so user input can't inject FTS5 query syntax.
+    """
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    terms = ['"%s"' % word for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search_messages(query, room_ids, limit, offset=0):
+    """
+    Rank messages in `room_ids` matching `query`, best match first.
+    Returns a list of (message, snippet) for the requested page.
+    """
+    if not room_ids:
+        return []
+
+    if not fts_available():
+        messages = (
+            Message.objects.filter(room_id__in=room_ids, content__icontains=query)
+            .select_related("sender")
+            .order_by("-timestamp", "-id")[offset : offset + limit]
+        )
+        return [(m, m.content[:200]) for m in messages]
+
+    match = build_match_query(query)
+    if match is None:
+        return []
+
+    placeholders = ", ".join(["%s"] * len(room_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT m.id, snippet({FTS_TABLE}, 0, '[', ']', '…', %s)
+            FROM {FTS_TABLE}
+            JOIN chat_message m ON m.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH %s AND m.room_id IN ({placeholders})
+            ORDER BY bm25({FTS_TABLE}), m.id DESC
+            LIMIT %s OFFSET %s
+            """,
+            [SNIPPET_TOKENS, match, *room_ids, limit, offset],
+        )
+        rows = cursor.fetchall()
+
+    messages = Message.objects.select_related("sender").in_bulk([pk for pk, _ in rows])
+    return [(messages[pk], snippet) for pk, snippet in rows if pk in messages]
+
+
+def rebuild_index():
+    """
+    Re-index every message with FTS5's 'rebuild' command, which re-reads the
+    external content table in one statement: searches keep seeing the old
+    index until it commits, and rows inserted meanwhile are not indexed
+    twice. Returns the row count.
+    """
+    if not fts_available():
+        return 0
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        cursor.execute("SELECT COUNT(*) FROM chat_message")
+        return cursor.fetchone()[0]
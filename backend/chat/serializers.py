@@ -13,8 +13,9 @@ class MessageSerializer(serializers.ModelSerializer):
 
 class ChatRoomSerializer(serializers.ModelSerializer):
     participants = UserSerializer(many=True, read_only=True)
-    messages = MessageSerializer(many=True, read_only=True)
 
+    # Messages are not embedded here; page through them with
+    # /api/chat/rooms/<id>/messages/ instead.
     class Meta:
         model = ChatRoom
-        fields = ["id", "name", "course", "participants", "is_private", "messages"]
+        fields = ["id", "name", "course", "participants", "is_private"]
@@ -29,10 +29,22 @@
 #     return enrollment
 
 
-from django.db.models.signals import post_migrate
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_migrate,
+    post_save,
+)
+from django.db import transaction
 from django.dispatch import receiver
 from django.apps import apps
-from chat.models import ChatRoom
+from django.contrib.auth import get_user_model
+from chat.archive import delete_archive
+from chat.auth import user_cache
+from chat.history import recent_messages
+from chat.membership import membership_cache
+from chat.models import ChatRoom, Message, evict_replayed
+from courses.models import Course, Enrollment
 
 
 @receiver(post_migrate)
@@ -41,3 +53,73 @@ def create_dashboard_chat(sender, **kwargs):
         ChatRoom.objects.get_or_create(
             name="dashboard_chat", defaults={"is_private": False}
         )
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_cached_user(sender, instance, **kwargs):
+    # Role/active changes must be visible to the next WebSocket connect
+    user_cache.invalidate(instance.pk)
+
+
+@receiver(m2m_changed, sender=ChatRoom.participants.through)
+def invalidate_participant_rooms(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # user.chat_rooms.add/remove/clear(...)
+        if action in ("post_add", "post_remove", "post_clear"):
+            membership_cache.invalidate(instance.pk)
+    elif action in ("post_add", "post_remove"):
+        for user_id in pk_set:
+            membership_cache.invalidate(user_id)
+    elif action == "pre_clear":
+        for user_id in instance.participants.values_list("id", flat=True):
+            membership_cache.invalidate(user_id)
+
+
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def invalidate_enrolled_rooms(sender, instance, **kwargs):
+    membership_cache.invalidate(instance.student_id)
+
+
+@receiver(post_save, sender=Course)
+def invalidate_teacher_rooms(sender, instance, **kwargs):
+    membership_cache.invalidate(instance.teacher_id)
+    # A course changing hands also takes its rooms from the previous teacher
+    # (remembered by courses.signals.remember_previous_teacher)
+    previous = getattr(instance, "_previous_teacher_id", None)
+    if previous and previous != instance.teacher_id:
+        membership_cache.invalidate(previous)
+
+
+@receiver(post_save, sender=ChatRoom)
+@receiver(post_delete, sender=ChatRoom)
+def invalidate_all_rooms(sender, instance, **kwargs):
+    # New public rooms are joinable by everyone; rooms come and go rarely
+    membership_cache.clear()
+
+
+@receiver(post_delete, sender=ChatRoom)
+def delete_room_archive(sender, instance, **kwargs):
+    room_id = instance.pk
+    transaction.on_commit(lambda: delete_archive(room_id))
+
+
+@receiver(post_delete, sender=ChatRoom)
+def evict_deleted_room(sender, instance, **kwargs):
+    recent_messages.evict(instance.name)
+
+
+@receiver(post_save, sender=Message)
+def evict_edited_message(sender, instance, created, **kwargs):
+    # New messages reach the replay buffers through their broadcast; edits
+    # (admin, shell) don't, so the room is reloaded on the next join.
+    # Deletes are handled by Message.delete and its queryset.
+    if not created:
+        evict_replayed([instance.room_id])
+
+
+@receiver(post_delete, sender=get_user_model())
+def evict_deleted_users_messages(sender, instance, **kwargs):
+    # Their messages were cascaded away but may sit in any room's buffer
+    recent_messages.evict_all()
@@ -1,8 +1,12 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import ChatRoomViewSet, MessageViewSet
+from .views import ChatRoomViewSet, MessageViewSet, cache_stats, search
 
 router = DefaultRouter()
 router.register(r"rooms", ChatRoomViewSet, basename="chat-room")
 router.register(r"messages", MessageViewSet, basename="message")
 
-urlpatterns = router.urls
+urlpatterns = [
+    path("cache-stats/", cache_stats, name="chat-cache-stats"),
+    path("search/", search, name="chat-search"),
+] + router.urls
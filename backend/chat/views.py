@@ -1,7 +1,21 @@
-from rest_framework import viewsets, permissions
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.response import Response
+from courses.exports import CHUNK_SIZE, export_format, stream_export
+from .archive import RoomArchive, from_micros
+from .auth import user_cache
+from .history import recent_messages
+from .membership import get_joinable_rooms, membership_cache
 from .models import ChatRoom, Message
+from .pagination import encode_cursor, get_page_size, paginate_messages
+from .search import search_messages
 from .serializers import ChatRoomSerializer, MessageSerializer
 
+User = get_user_model()
+
 
 class ChatRoomViewSet(viewsets.ModelViewSet):
     queryset = ChatRoom.objects.all()
@@ -11,13 +25,175 @@ class ChatRoomViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user = self.request.user
         # Only show rooms where the user is a participant
-        return ChatRoom.objects.filter(participants=user)
+        return ChatRoom.objects.filter(participants=user).prefetch_related(
+            "participants"
+        )
+
+    @action(detail=True, methods=["get"])
+    def messages(self, request, pk=None):
+        """
+        Room history, paginated by (timestamp, id) cursors.
+        Usage: /api/chat/rooms/<id>/messages/?before=<cursor>&limit=50
+               /api/chat/rooms/<id>/messages/?after=<cursor>
+        Open to everyone who may join the room, like the WebSocket and search.
+        """
+        room_ids = get_joinable_rooms(request.user).values()
+        if not str(pk).isdigit() or int(pk) not in room_ids:
+            raise NotFound("No such room.")
+        messages, has_older, has_newer = paginate_messages(
+            Message.objects.filter(room_id=pk).select_related("sender"),
+            before=request.query_params.get("before"),
+            after=request.query_params.get("after"),
+            limit=get_page_size(request.query_params.get("limit")),
+            archive=RoomArchive.for_room(int(pk)),
+        )
+        return Response(
+            {
+                "results": MessageSerializer(messages, many=True).data,
+                "before": (
+                    encode_cursor(messages[0]) if messages and has_older else None
+                ),
+                "after": (
+                    encode_cursor(messages[-1]) if messages and has_newer else None
+                ),
+            }
+        )
 
 
-class MessageViewSet(viewsets.ModelViewSet):
-    queryset = Message.objects.all()
+class MessageViewSet(viewsets.ReadOnlyModelViewSet):
+    # Messages are sent over the room's WebSocket, which keeps the replay
+    # buffers (chat.history) current; REST writes would bypass them
+    queryset = Message.objects.order_by("timestamp", "id")
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-    def perform_create(self, serializer):
-        serializer.save(sender=self.request.user)
+    @action(detail=False, methods=["get"], permission_classes=[permissions.IsAdminUser])
+    def export(self, request):
+        """
+        Stream chat logs as CSV or NDJSON for moderation (staff only): room
+        by room, oldest first, archived messages included.
+        Usage: /api/chat/messages/export/?as=ndjson&room=3
+        """
+        fmt = export_format(request)
+        rooms = ChatRoom.objects.order_by("id")
+        if request.query_params.get("room"):
+            try:
+                rooms = rooms.filter(pk=int(request.query_params["room"]))
+            except ValueError:
+                raise ValidationError({"room": "Must be a room id."})
+        return stream_export(
+            export_rows(list(rooms.values_list("id", "name"))),
+            EXPORT_COLUMNS,
+            fmt,
+            "chat-messages",
+        )
+
+
+EXPORT_COLUMNS = [
+    "id",
+    "room_id",
+    "room_name",
+    "sender_id",
+    "sender_username",
+    "content",
+    "timestamp",
+]
+
+
+def export_rows(rooms):
+    """Export rows of every message of `rooms` ((id, name) pairs)."""
+    for room_id, room_name in rooms:
+        messages = Message.objects.filter(room_id=room_id)
+        archive = RoomArchive.for_room(room_id)
+        if archive:
+            for records in archive.iter_blocks():
+                usernames = dict(
+                    User.objects.filter(pk__in={r[2] for r in records}).values_list(
+                        "id", "username"
+                    )
+                )
+                for micros, pk, sender_id, content in records:
+                    if sender_id not in usernames:
+                        continue  # The sender was deleted
+                    yield (
+                        pk,
+                        room_id,
+                        room_name,
+                        sender_id,
+                        usernames[sender_id],
+                        content,
+                        from_micros(micros),
+                    )
+            # Rows left behind by an interrupted archiving run
+            timestamp, pk = archive.last_datetime()
+            messages = messages.filter(
+                Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=pk)
+            )
+        rows = messages.order_by("timestamp", "id").values_list(
+            "id", "sender_id", "sender__username", "content", "timestamp"
+        )
+        for pk, sender_id, username, content, timestamp in rows.iterator(CHUNK_SIZE):
+            yield (pk, room_id, room_name, sender_id, username, content, timestamp)
+
+
+@api_view(["GET"])
+@permission_classes([permissions.IsAdminUser])
+def cache_stats(request):
+    """
+    Hit/miss counters of the in-process chat caches (staff only).
+    Usage: /api/chat/cache-stats/
+    """
+    return Response(
+        {
+            "users": user_cache.stats(),
+            "memberships": membership_cache.stats(),
+            "recent_messages": recent_messages.stats(),
+        }
+    )
+
+
+@api_view(["GET"])
+@permission_classes([permissions.IsAuthenticated])
+def search(request):
+    """
+    Full-text search over messages in rooms the user can join, best match
+    first, with highlighted snippets.
+    Usage: /api/chat/search/?q=exam&room=<id>&limit=20&offset=0
+    """
+    query = request.GET.get("q", "").strip()
+    # Require at least 2 characters
+    if len(query) < 2:
+        return Response({"results": [], "next_offset": None})
+
+    room_ids = list(get_joinable_rooms(request.user).values())
+    room = request.GET.get("room")
+    if room:
+        if not room.isdigit() or int(room) not in room_ids:
+            return Response(
+                {"detail": "You are not a member of this room."},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+        room_ids = [int(room)]
+
+    limit = get_page_size(request.GET.get("limit"))
+    try:
+        offset = max(int(request.GET.get("offset", 0)), 0)
+    except ValueError:
+        offset = 0
+
+    hits = search_messages(query, room_ids, limit + 1, offset)
+    return Response(
+        {
+            "results": [
+                {
+                    "id": message.id,
+                    "room": message.room_id,
+                    "sender": message.sender.username,
+                    "timestamp": message.timestamp,
+                    "snippet": snippet,
+                }
+                for message, snippet in hits[:limit]
+            ],
+            "next_offset": offset + limit if len(hits) > limit else None,
+        }
+    )
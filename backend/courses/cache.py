@@ -0,0 +1,176 @@
+"""
+Versioned response cache for the course endpoints.
+
+Every course has a version counter, and the catalog as a whole has one
+more, bumped by signals whenever a course, its enrollments, materials or
+feedback change. Responses are cached under a key built from the versions
+they depend on, so a bump makes old entries unreachable rather than
+deleting them. The same key doubles as a strong ETag, which lets
+If-None-Match be answered with a 304 from the counters alone.
+
+Counters and responses live in the Django cache (COURSE_CACHE_ALIAS); use a
+shared backend when running more than one process.
+"""
+
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+
+CATALOG = "catalog"
+
+
+def get_cache():
+    return caches[getattr(settings, "COURSE_CACHE_ALIAS", "default")]
+
+
+def version_key(scope):
+    return f"courses:version:{scope}"
+
+
+def get_versions(scopes):
+    """Current version of each scope (a course id or CATALOG)."""
+    cache = get_cache()
+    keys = {scope: version_key(scope) for scope in scopes}
+    found = cache.get_many(keys.values())
+    versions = {}
+    for scope, key in keys.items():
+        if key not in found:
+            # Start from a value never used before, so an evicted counter
+            # can't make responses cached under an older value reachable
+            cache.add(key, time.time_ns(), timeout=None)
+            found[key] = cache.get(key) or time.time_ns()
+        versions[scope] = found[key]
+    return versions
+
+
+def bump(course_id):
+    cache = get_cache()
+    for scope in (course_id, CATALOG):
+        try:
+            cache.incr(version_key(scope))
+        except ValueError:
+            cache.set(version_key(scope), time.time_ns(), timeout=None)
+
+
+def invalidate_course(course_id):
+    """
+    Bump a course's version now and again once the transaction commits, so
+    a response built from pre-commit data can't stay cached under the new
+    version.
+    """
+    bump(course_id)
+    transaction.on_commit(lambda: bump(course_id))
+
+
+class ResponseCache:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self._lock = threading.Lock()
+
+    def etag(self, request, scopes):
+        """Strong ETag for this request against the current versions."""
+        versions = get_versions(scopes)
+        raw = "|".join(
+            [
+                request.build_absolute_uri(),
+                str(request.user.pk),
+                request.accepted_media_type,
+                *(f"{scope}={versions[scope]}" for scope in scopes),
+            ]
+        )
+        return '"%s"' % hashlib.sha1(raw.encode()).hexdigest()
+
+    def get(self, etag):
+        entry = get_cache().get(f"courses:response:{etag}")
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def set(self, etag, content, content_type):
+        get_cache().set(
+            f"courses:response:{etag}",
+            (content, content_type),
+            getattr(settings, "COURSE_CACHE_TIMEOUT", 300),
+        )
+
+    def count_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def clear(self):
+        with self._lock:
+            self.hits = self.misses = self.not_modified = 0
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses + self.not_modified
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "hit_rate": (
+                    round((self.hits + self.not_modified) / requests, 3)
+                    if requests
+                    else None
+                ),
+            }
+
+
+response_cache = ResponseCache()
+
+
+class CachedResponseMixin:
+    """
+    Serve list/retrieve from `response_cache`. A hit (or a 304) skips the
+    queryset and serializer entirely. Subclasses return the version scopes
+    a request depends on from `cache_scopes`.
+    """
+
+    def cache_scopes(self):
+        return [CATALOG]
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(super().retrieve, request, *args, **kwargs)
+
+    def cached(self, handler, request, *args, **kwargs):
+        etag = response_cache.etag(request, self.cache_scopes())
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response_cache.count_not_modified()
+            response = HttpResponse(status=304)
+        else:
+            entry = response_cache.get(etag)
+            if entry is not None:
+                content, content_type = entry
+                response = HttpResponse(content, content_type=content_type)
+            else:
+                response = handler(request, *args, **kwargs)
+                # Stored once rendered, in finalize_response
+                self.store_as = etag
+        response["ETag"] = etag
+        # Let browsers keep the body and revalidate it with If-None-Match
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ["Authorization"])
+        return response
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        etag = getattr(self, "store_as", None)
+        if etag and response.status_code == 200:
+            response.render()
+            response_cache.set(etag, response.content, response["Content-Type"])
+        return response
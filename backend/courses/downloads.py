@@ -0,0 +1,181 @@
+"""
+Permission-checked, streaming downloads of course materials.
+
+Files are streamed from storage a block at a time, so memory per download
+doesn't grow with the file, under ASGI as well (see courses.streaming).
+With MATERIAL_SENDFILE_HEADER set (e.g. "X-Accel-Redirect") the reverse
+proxy serves the file instead, which keeps large files off the app server. Single byte ranges are answered with 206 for
+video seeking, and ETag/Last-Modified allow conditional requests.
+
+Download links carry a signed, expiring token so they also work from
+<a>/<video> tags, which can't send the Authorization header.
+"""
+
+import mimetypes
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+from .models import Enrollment
+from .streaming import BlockFileResponse, BlockStreamingHttpResponse
+
+BLOCK_SIZE = 64 * 1024
+SIGNING_SALT = "courses.material-download"
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def can_download(user, material):
+    if not user or not user.is_authenticated:
+        return False
+    course = material.course
+    return (
+        user.is_staff
+        or course.teacher_id == user.id
+        or Enrollment.objects.filter(course=course, student=user).exists()
+    )
+
+
+def download_url(request, material, size=None):
+    """
+    Absolute download link for `material` (or one of its previews),
+    signed for the requesting user.
+    """
+    token = signing.dumps(
+        {"m": material.pk, "u": request.user.pk}, salt=SIGNING_SALT, compress=True
+    )
+    path = reverse("material-download", args=[material.pk])
+    query = f"size={size}&token={token}" if size else f"token={token}"
+    return request.build_absolute_uri(f"{path}?{query}")
+
+
+def user_from_token(token, material):
+    """The user a download token was issued to, or None if it's invalid."""
+    max_age = getattr(settings, "MATERIAL_DOWNLOAD_URL_MAX_AGE", 6 * 60 * 60)
+    try:
+        payload = signing.loads(token, salt=SIGNING_SALT, max_age=max_age)
+    except signing.BadSignature:
+        return None
+    if payload.get("m") != material.pk:
+        return None
+    return get_user_model().objects.filter(pk=payload.get("u"), is_active=True).first()
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single "bytes=" range, None to serve the
+    whole file (no/unsupported header), or False if it can't be satisfied.
+    """
+    match = RANGE_RE.match(header or "")
+    if not match or not size:
+        return None if not match else False
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def iter_range(f, start, length):
+    try:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(BLOCK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        f.close()
+
+
+def material_etag(material, variant, size, mtime):
+    if material.blob_id:
+        tag = material.blob.sha256
+        return f'"{tag}-{variant}"' if variant else f'"{tag}"'
+    return f'"{size:x}-{mtime or 0:x}"'
+
+
+def file_mtime(storage, name):
+    try:
+        modified = storage.get_modified_time(name)
+    except (NotImplementedError, OSError):
+        return None
+    # HTTP dates have whole-second precision
+    return int(modified.timestamp())
+
+
+def serve_material(request, material, variant=None):
+    """
+    Stream `material`'s file, or the preview named `variant`, honouring
+    conditional and Range headers.
+    """
+    storage = material.file.storage
+    name = material.previews[variant] if variant else material.file.name
+    size = storage.size(name)
+    mtime = file_mtime(storage, name)
+    etag = material_etag(material, variant, size, mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=mtime)
+    if response is not None:
+        return response
+
+    byte_range = parse_range(request.headers.get("Range"), size)
+    if_range = request.headers.get("If-Range")
+    if byte_range and if_range:
+        # Only honour the range if the client's copy is still current
+        if if_range.startswith('"') or if_range.startswith("W/"):
+            current = etag in parse_etags(if_range)
+        else:
+            current = mtime is not None and parse_http_date_safe(if_range) == mtime
+        if not current:
+            byte_range = None
+
+    filename = material.title or material.file.name.rsplit("/", 1)[-1]
+    if variant:
+        filename = f"{filename.rsplit('.', 1)[0]}-{variant}.jpg"
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+    elif getattr(settings, "MATERIAL_SENDFILE_HEADER", ""):
+        # The proxy streams the file (and handles Range) itself
+        response = HttpResponse()
+        response[settings.MATERIAL_SENDFILE_HEADER] = getattr(
+            settings, "MATERIAL_SENDFILE_PREFIX", "/protected/"
+        ) + quote(name)
+        response["Content-Type"] = ""
+    elif byte_range:
+        start, end = byte_range
+        length = end - start + 1
+        f = storage.open(name, "rb")
+        response = BlockStreamingHttpResponse(
+            iter_range(f, start, length),
+            status=206,
+            content_type=mimetypes.guess_type(filename)[0]
+            or "application/octet-stream",
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = str(length)
+    else:
+        response = BlockFileResponse(storage.open(name, "rb"), filename=filename)
+        response.block_size = BLOCK_SIZE
+
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    if mtime is not None:
+        response["Last-Modified"] = http_date(mtime)
+    response["Cache-Control"] = "private, no-cache"
+    return response
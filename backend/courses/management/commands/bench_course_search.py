@@ -0,0 +1,188 @@
+import itertools
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from chat.bench import summarize_ms, write_report
+from courses.models import Course, Enrollment
+from courses.search import course_index, search_courses
+
+User = get_user_model()
+
+BACKENDS = ("fts", "python")
+
+
+def make_vocabulary(rng, size):
+    """Pronounceable made-up words, so term frequencies look like text."""
+    consonants, vowels = "bcdfghklmnprstvz", "aeiou"
+    words = set()
+    while len(words) < size:
+        syllables = rng.randint(1, 4)
+        words.add(
+            "".join(
+                rng.choice(consonants) + rng.choice(vowels) for _ in range(syllables)
+            )
+        )
+    return sorted(words)
+
+
+def create_courses(rng, vocabulary, courses, teachers):
+    # Zipf-like word frequencies: a few very common words, a long tail
+    weights = list(
+        itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1))
+    )
+    teacher_objs = User.objects.bulk_create(
+        [User(username=f"bench_teacher_{i}", role="teacher") for i in range(teachers)]
+    )
+    batch = []
+    for i in range(courses):
+        batch.append(
+            Course(
+                title=" ".join(
+                    rng.choices(vocabulary, cum_weights=weights, k=rng.randint(2, 6))
+                ),
+                description=" ".join(
+                    rng.choices(vocabulary, cum_weights=weights, k=rng.randint(20, 60))
+                ),
+                teacher=teacher_objs[i % teachers],
+            )
+        )
+        if len(batch) == 2000:
+            Course.objects.bulk_create(batch)
+            batch = []
+    Course.objects.bulk_create(batch)
+    return teacher_objs
+
+
+def make_queries(rng, vocabulary, count, teachers):
+    """(kind, query, filters) mixing words, phrases, prefixes and filters."""
+    queries = []
+    for i in range(count):
+        kind = ("word", "two_words", "prefix", "teacher", "enrolled")[i % 5]
+        word = rng.choice(vocabulary)
+        filters = {}
+        if kind == "two_words":
+            query = f"{word} {rng.choice(vocabulary)}"
+        elif kind == "prefix":
+            query = word[: rng.randint(2, 4)]
+        else:
+            query = word
+        if kind == "teacher":
+            filters["teacher_id"] = rng.choice(teachers).pk
+        elif kind == "enrolled":
+            filters["enrolled"] = rng.random() < 0.5
+        queries.append((kind, query, filters))
+    return queries
+
+
+def run(courses, queries, teachers, vocabulary, limit, seed):
+    rng = random.Random(seed)
+    words = make_vocabulary(rng, vocabulary)
+    start = time.perf_counter()
+    teacher_objs = create_courses(rng, words, courses, teachers)
+    student = User.objects.create(username="bench_student", role="student")
+    Enrollment.objects.bulk_create(
+        Enrollment(course_id=pk, student=student)
+        for pk in Course.objects.order_by("?").values_list("pk", flat=True)[:1000]
+    )
+    report = {"setup": {"seconds": round(time.perf_counter() - start, 1)}}
+    plan = make_queries(rng, words, queries, teacher_objs)
+
+    for backend in BACKENDS:
+        with override_settings(COURSE_SEARCH_BACKEND=backend):
+            section = {}
+            if backend == "python":
+                start = time.perf_counter()
+                course_index.clear()
+                course_index.ensure_current()
+                section["index_build_ms"] = round(
+                    (time.perf_counter() - start) * 1000, 1
+                )
+            durations, by_kind, hits = [], {}, 0
+            for kind, query, filters in plan:
+                start = time.perf_counter()
+                ids = search_courses(query, limit, user=student, **filters)
+                elapsed = time.perf_counter() - start
+                durations.append(elapsed)
+                by_kind.setdefault(kind, []).append(elapsed)
+                hits += bool(ids)
+            section.update(
+                {
+                    "queries": len(plan),
+                    "with_results": hits,
+                    **summarize_ms(durations),
+                    **{
+                        f"{kind}_p99_ms": summarize_ms(values)["p99_ms"]
+                        for kind, values in by_kind.items()
+                    },
+                }
+            )
+            report[backend] = section
+    course_index.clear()
+    return report
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark course search: index synthetic courses (100k by default) "
+        "and time a mix of word, prefix and filtered queries against the "
+        "FTS5 and in-process backends. Runs against a throwaway test "
+        "database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--courses", type=int, default=100_000)
+        parser.add_argument("--queries", type=int, default=1000)
+        parser.add_argument("--teachers", type=int, default=200)
+        parser.add_argument("--vocabulary", type=int, default=20_000)
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--target-p99-ms",
+            type=float,
+            default=50,
+            help="Fail if a backend's p99 latency is above this.",
+        )
+        parser.add_argument("--json", action="store_true")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("The FTS5 backend needs SQLite.")
+
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            report = run(
+                options["courses"],
+                options["queries"],
+                options["teachers"],
+                options["vocabulary"],
+                options["limit"],
+                options["seed"],
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        target = options["target_p99_ms"]
+        report = {
+            "config": {
+                key: options[key]
+                for key in (
+                    "courses",
+                    "queries",
+                    "vocabulary",
+                    "limit",
+                    "target_p99_ms",
+                )
+            },
+            **report,
+        }
+        for backend in BACKENDS:
+            report[backend]["meets_target"] = report[backend]["p99_ms"] <= target
+        write_report(self.stdout, report, options["json"])
+        missed = [b for b in BACKENDS if not report[b]["meets_target"]]
+        if missed:
+            raise CommandError(f"p99 above {target} ms for: {', '.join(missed)}")
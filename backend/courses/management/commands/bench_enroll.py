@@ -0,0 +1,156 @@
+import os
+import tempfile
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from chat.bench import summarize_ms, write_report
+from courses import seats
+from courses.models import Course, Enrollment, WaitlistEntry
+
+User = get_user_model()
+
+
+def in_parallel(items, threads, work):
+    """
+    Run `work(item)` for every item from `threads` threads released at the
+    same moment. Returns ([results], [durations], error count).
+    """
+    chunks = [items[i::threads] for i in range(threads)]
+    barrier = threading.Barrier(threads)
+    results, durations, errors = [], [], []
+    lock = threading.Lock()
+
+    def worker(chunk):
+        try:
+            barrier.wait()
+            for item in chunk:
+                start = time.perf_counter()
+                try:
+                    result = work(item)
+                except Exception as exc:
+                    with lock:
+                        errors.append(exc)
+                    continue
+                elapsed = time.perf_counter() - start
+                with lock:
+                    results.append(result)
+                    durations.append(elapsed)
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return results, durations, len(errors)
+
+
+def run(students, capacity, threads, unenroll):
+    teacher = User.objects.create(username="bench_teacher", role="teacher")
+    course = Course.objects.create(
+        title="Bench course", description="", teacher=teacher, capacity=capacity
+    )
+    users = User.objects.bulk_create(
+        [User(username=f"bench_student_{i}", role="student") for i in range(students)]
+    )
+
+    results, durations, errors = in_parallel(
+        users, threads, lambda user: seats.enroll(course, user)[0]
+    )
+    report = {
+        "enroll": {
+            "requests": len(users),
+            "enrolled": results.count(seats.ENROLLED),
+            "waitlisted": results.count(seats.WAITLISTED),
+            "errors": errors,
+            **summarize_ms(durations),
+        }
+    }
+
+    # Drop some enrollments at once; each freed seat goes to the waitlist
+    leaving = list(Enrollment.objects.filter(course=course)[:unenroll])
+    _, durations, errors = in_parallel(
+        leaving, min(threads, len(leaving)) or 1, lambda e: e.delete()
+    )
+    report["unenroll"] = {
+        "requests": len(leaving),
+        "errors": errors,
+        **summarize_ms(durations),
+    }
+
+    course.refresh_from_db()
+    enrolled = set(
+        Enrollment.objects.filter(course=course).values_list("student_id", flat=True)
+    )
+    waiting = set(
+        WaitlistEntry.objects.filter(course=course).values_list("student_id", flat=True)
+    )
+    report["final"] = {
+        "capacity": capacity,
+        "seats_taken": course.seats_taken,
+        "enrollments": len(enrolled),
+        "waitlist": len(waiting),
+        "oversubscribed": len(enrolled) > capacity,
+        "counter_matches": course.seats_taken == len(enrolled),
+        "enrolled_and_waitlisted": len(enrolled & waiting),
+    }
+    return report
+
+
+class Command(BaseCommand):
+    help = (
+        "Stress-test enrollment: many students enroll in one limited course "
+        "from parallel threads, then some unenroll so the waitlist is "
+        "promoted. Reports latency and checks the course was never "
+        "oversubscribed. Runs against a throwaway test database (a file for "
+        "SQLite, so the threads can share it)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--students", type=int, default=300)
+        parser.add_argument("--capacity", type=int, default=50)
+        parser.add_argument("--threads", type=int, default=32)
+        parser.add_argument("--unenroll", type=int, default=10)
+        parser.add_argument("--json", action="store_true")
+
+    def handle(self, *args, **options):
+        test_settings = connection.settings_dict.setdefault("TEST", {})
+        tmpdir = None
+        if connection.vendor == "sqlite":
+            # An in-memory database can't be written from several threads
+            tmpdir = tempfile.mkdtemp()
+            test_settings["NAME"] = os.path.join(tmpdir, "bench_enroll.sqlite3")
+
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            report = run(
+                options["students"],
+                options["capacity"],
+                options["threads"],
+                options["unenroll"],
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if tmpdir:
+                os.rmdir(tmpdir)
+
+        report = {
+            "config": {
+                key: options[key]
+                for key in ("students", "capacity", "threads", "unenroll")
+            },
+            **report,
+        }
+        write_report(self.stdout, report, options["json"])
+        final = report["final"]
+        if (
+            final["oversubscribed"]
+            or not final["counter_matches"]
+            or final["enrolled_and_waitlisted"]
+        ):
+            raise CommandError("Seat accounting is inconsistent")
@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from courses.uploads import expire_uploads
+
+
+class Command(BaseCommand):
+    help = (
+        "Discard resumable material uploads that haven't received a chunk "
+        "for a while, with their part files, and part files left without a "
+        "session. Meant to run periodically (e.g. hourly from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hours",
+            type=float,
+            default=getattr(settings, "MATERIAL_UPLOAD_EXPIRY_HOURS", 24),
+            help="Idle time after which an upload is discarded.",
+        )
+
+    def handle(self, *args, **options):
+        sessions, files = expire_uploads(timedelta(hours=options["hours"]))
+        self.stdout.write(
+            f"Discarded {sessions} upload sessions and {files} orphaned part files"
+        )
@@ -0,0 +1,49 @@
+from concurrent.futures import as_completed
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from courses.models import CourseMaterial
+from courses.previews import get_pool, record
+from courses.thumbnails import render_previews
+
+
+class Command(BaseCommand):
+    help = (
+        "Render thumbnails and previews for course materials that don't have "
+        "them yet (pending or failed), e.g. after a restart or for materials "
+        "uploaded before previews existed. Safe to run repeatedly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Process every material, not only pending and failed ones.",
+        )
+
+    def handle(self, *args, **options):
+        materials = CourseMaterial.objects.exclude(file="")
+        if not options["all"]:
+            materials = materials.filter(preview_status__in=["pending", "failed"])
+
+        pool = get_pool()
+        futures = {
+            pool.submit(render_previews, default_storage.path(name)): pk
+            for pk, name in materials.values_list("pk", "file").iterator()
+        }
+        counts = {}
+        for future in as_completed(futures):
+            try:
+                paths, failed = future.result(), False
+            except Exception as exc:
+                self.stderr.write(f"Material {futures[future]}: {exc}")
+                paths, failed = None, True
+            record(futures[future], paths, failed=failed)
+            status = "failed" if failed else "unsupported" if paths is None else "ready"
+            counts[status] = counts.get(status, 0) + 1
+
+        self.stdout.write(
+            ", ".join(f"{count} {status}" for status, count in sorted(counts.items()))
+            or "Nothing to do"
+        )
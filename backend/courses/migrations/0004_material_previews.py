@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0003_material_blobs_uploads"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="coursematerial",
+            name="preview_status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("ready", "Ready"),
+                    ("unsupported", "Unsupported"),
+                    ("failed", "Failed"),
+                ],
+                default="pending",
+                max_length=12,
+            ),
+        ),
+        migrations.AddField(
+            model_name="coursematerial",
+            name="previews",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
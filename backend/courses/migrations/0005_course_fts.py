@@ -0,0 +1,67 @@
+from django.db import migrations
+
+# External-content FTS5 index over the course title and description, kept
+# in sync by triggers. Three- and four-character prefixes are indexed so
+# type-ahead prefix queries don't scan the whole term list. Existing courses
+# are indexed by the 'rebuild' below. SQLite only; elsewhere courses.search
+# uses its in-process index.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS courses_course_fts USING fts5(
+        title, description, content='courses_course', content_rowid='id',
+        prefix='3 4'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS courses_course_fts_insert
+    AFTER INSERT ON courses_course BEGIN
+        INSERT INTO courses_course_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS courses_course_fts_delete
+    AFTER DELETE ON courses_course BEGIN
+        INSERT INTO courses_course_fts(courses_course_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS courses_course_fts_update
+    AFTER UPDATE OF title, description ON courses_course BEGIN
+        INSERT INTO courses_course_fts(courses_course_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO courses_course_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    "INSERT INTO courses_course_fts(courses_course_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS courses_course_fts_update",
+    "DROP TRIGGER IF EXISTS courses_course_fts_delete",
+    "DROP TRIGGER IF EXISTS courses_course_fts_insert",
+    "DROP TABLE IF EXISTS courses_course_fts",
+]
+
+
+def run_sql(statements):
+    def forwards(apps, schema_editor):
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return forwards
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0004_material_previews"),
+    ]
+
+    operations = [
+        migrations.RunPython(run_sql(CREATE_SQL), run_sql(DROP_SQL)),
+    ]
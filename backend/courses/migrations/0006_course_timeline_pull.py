@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:27
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+# SQLite adds the column by rebuilding courses_course, which drops the
+# search triggers; create them again (and reindex) after
+# migrating either way
+fts = import_module("courses.migrations.0005_course_fts")
+restore_search_index = fts.run_sql(fts.CREATE_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0005_course_fts"),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_search_index),
+        migrations.AddField(
+            model_name="course",
+            name="timeline_pull",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(restore_search_index, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from django.conf import settings
 
@@ -10,6 +12,15 @@ class Course(models.Model):
     teacher = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name="courses_taught"
     )
+    # Seat limit (None = unlimited). seats_taken is kept in step with the
+    # enrollments by courses.seats so the limit can be enforced with one
+    # conditional UPDATE.
+    capacity = models.PositiveIntegerField(null=True, blank=True)
+    seats_taken = models.PositiveIntegerField(default=0, editable=False)
+    # Set once the course outgrows fanning status updates out to its
+    # teacher's timeline; they are pulled at read time instead
+    # (see feedback.timelines)
+    timeline_pull = models.BooleanField(default=False, editable=False)
 
     def __str__(self):
         return self.title
@@ -31,12 +42,87 @@ class Enrollment(models.Model):
         return f"{self.student} enrolled in {self.course}"
 
 
+class MaterialBlob(models.Model):
+    """
+    A stored file, named after the SHA-256 of its content so identical
+    uploads share one copy. `ref_count` counts the materials using it.
+    """
+
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to="material_blobs/")
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.sha256
+
+
 class CourseMaterial(models.Model):
+    PREVIEW_STATUS_CHOICES = (
+        ("pending", "Pending"),
+        ("ready", "Ready"),
+        ("unsupported", "Unsupported"),
+        ("failed", "Failed"),
+    )
+
     course = models.ForeignKey(
         Course, on_delete=models.CASCADE, related_name="materials"
     )
     file = models.FileField(upload_to="course_materials/")
     title = models.CharField(max_length=255, blank=True)
+    # Set for uploads stored content-addressed; `file` then names the blob
+    blob = models.ForeignKey(
+        MaterialBlob,
+        on_delete=models.PROTECT,
+        related_name="materials",
+        null=True,
+        blank=True,
+    )
+    # Rendered in the background by courses.previews; maps a size name
+    # (see courses.thumbnails.SIZES) to the stored image
+    preview_status = models.CharField(
+        max_length=12, choices=PREVIEW_STATUS_CHOICES, default="pending"
+    )
+    previews = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return self.title or f"Material for {self.course.title}"
+
+
+class WaitlistEntry(models.Model):
+    course = models.ForeignKey(
+        Course, on_delete=models.CASCADE, related_name="waitlist"
+    )
+    student = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="waitlist_entries"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("course", "student")
+        indexes = [models.Index(fields=["course", "created_at", "id"])]
+
+    def __str__(self):
+        return f"{self.student} waiting for {self.course}"
+
+
+class UploadSession(models.Model):
+    """A resumable material upload; chunks are appended until `offset == size`."""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    course = models.ForeignKey(
+        Course, on_delete=models.CASCADE, related_name="upload_sessions"
+    )
+    owner = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="upload_sessions"
+    )
+    filename = models.CharField(max_length=255)
+    title = models.CharField(max_length=255, blank=True)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
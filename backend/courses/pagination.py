@@ -0,0 +1,24 @@
+from rest_framework.pagination import LimitOffsetPagination
+
+SUMMARY_VIEW = "summary"
+
+
+def wants_summary(request):
+    return request.query_params.get("view") == SUMMARY_VIEW
+
+
+class CoursePagination(LimitOffsetPagination):
+    """
+    Limit/offset pages for the course list. The catalog summary is always
+    paginated; the full representation only when ?limit= is given, so
+    existing clients keep receiving a plain list.
+    """
+
+    max_limit = 100
+    summary_limit = 20
+
+    def get_limit(self, request):
+        limit = super().get_limit(request)
+        if limit is None and wants_summary(request):
+            return self.summary_limit
+        return limit
@@ -0,0 +1,17 @@
+from django.conf import settings
+from rest_framework.parsers import BaseParser
+
+
+def max_chunk_size():
+    return getattr(settings, "MATERIAL_UPLOAD_MAX_CHUNK_SIZE", 8 * 1024 * 1024)
+
+
+class ChunkParser(BaseParser):
+    """Raw bytes of an upload chunk (PATCH /api/courses/uploads/<id>/)."""
+
+    media_type = "application/offset+octet-stream"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        # One byte past the limit is enough for the view to reject the chunk
+        # without reading the rest of an oversized body into memory
+        return stream.read(max_chunk_size() + 1) if stream is not None else b""
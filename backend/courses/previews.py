@@ -0,0 +1,113 @@
+"""
+Background thumbnail and preview generation for course materials.
+
+Once a new material is committed its file is handed to a pool of worker
+processes (MATERIAL_PREVIEW_WORKERS of them) that render the sizes in
+courses.thumbnails.SIZES with Pillow, next to the original file. The
+result is recorded on the material from the pool's callback, so uploads
+never wait for it. Rendering is idempotent: retrying a material, or
+uploading the same blob twice, reuses the files already on disk.
+
+Materials left "pending" or "failed" (e.g. by a restart) can be processed
+again with `manage.py generate_previews`.
+"""
+
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+
+from .cache import invalidate_course
+from .models import CourseMaterial
+from .thumbnails import SIZES, derived_path, render_previews
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=getattr(settings, "MATERIAL_PREVIEW_WORKERS", 2) or 1,
+                # Workers only import courses.thumbnails; don't fork a
+                # (possibly threaded) server process
+                mp_context=multiprocessing.get_context("forkserver"),
+            )
+        return _pool
+
+
+def schedule(material):
+    """Render `material`'s previews in the background once it's committed."""
+    material_id, name = material.pk, material.file.name
+    transaction.on_commit(lambda: submit(material_id, name))
+
+
+def submit(material_id, name):
+    if not getattr(settings, "MATERIAL_PREVIEW_WORKERS", 2):
+        # No pool (tests, management commands): render inline
+        generate(material_id, name)
+        return
+    future = get_pool().submit(render_previews, default_storage.path(name))
+    future.add_done_callback(lambda f: _record_future(material_id, f))
+
+
+def generate(material_id, name):
+    """Render and record the previews of one material in this process."""
+    try:
+        paths = render_previews(default_storage.path(name))
+    except Exception:
+        logger.exception("Preview generation failed for material %s", material_id)
+        record(material_id, None, failed=True)
+    else:
+        record(material_id, paths)
+
+
+def _record_future(material_id, future):
+    # Runs on the pool's management thread
+    close_old_connections()
+    try:
+        try:
+            paths = future.result()
+        except Exception:
+            logger.exception("Preview generation failed for material %s", material_id)
+            record(material_id, None, failed=True)
+        else:
+            record(material_id, paths)
+    finally:
+        close_old_connections()
+
+
+def record(material_id, paths, failed=False):
+    material = (
+        CourseMaterial.objects.filter(pk=material_id).only("file", "course").first()
+    )
+    if material is None:
+        # Deleted meanwhile
+        return
+    if failed:
+        status, previews = "failed", {}
+    elif paths is None:
+        status, previews = "unsupported", {}
+    else:
+        # Stored by storage name, like the original file
+        status = "ready"
+        previews = {size: derived_path(material.file.name, size) for size in paths}
+    CourseMaterial.objects.filter(pk=material_id).update(
+        preview_status=status, previews=previews
+    )
+    # Cached material lists should pick up the new fields
+    invalidate_course(material.course_id)
+
+
+def delete_previews(name):
+    """Remove the rendered images of the file stored as `name`."""
+    for size in SIZES:
+        default_storage.delete(derived_path(name, size))
@@ -0,0 +1,134 @@
+import csv
+import io
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from feedback.timelines import add_students
+from .cache import invalidate_course
+from .models import Enrollment, WaitlistEntry
+from .seats import claim_seats
+
+User = get_user_model()
+
+BATCH_SIZE = 500
+
+
+def read_csv(upload):
+    """First non-empty cell of every row; a header row is skipped."""
+    text = io.TextIOWrapper(upload, encoding="utf-8-sig", newline="")
+    values = []
+    for row in csv.reader(text):
+        cells = [cell.strip() for cell in row if cell.strip()]
+        if cells:
+            values.append(cells[0])
+    if values and values[0].lower() in ("id", "email", "student"):
+        values = values[1:]
+    return values
+
+
+def parse_identifier(value):
+    """('id', int) or ('email', lowercased address), or None if neither."""
+    value = str(value).strip()
+    if value.isdigit():
+        return "id", int(value)
+    if "@" in value:
+        return "email", value.lower()
+    return None
+
+
+def bulk_enroll(course, values, attempts=3):
+    """
+    Enroll the students identified by `values` (ids or emails) in `course`.
+
+    Users are resolved in one query, existing enrollments are skipped, and
+    the new rows are inserted with bulk_create; students that don't fit
+    the course capacity are waitlisted. Returns one result per input value
+    plus a summary.
+    """
+    for attempt in range(attempts):
+        try:
+            return enroll_values(course, values)
+        except IntegrityError:
+            # A listed student enrolled concurrently; start over
+            if attempt == attempts - 1:
+                raise
+
+
+def enroll_values(course, values):
+    parsed = [parse_identifier(value) for value in values]
+    ids = {ident for kind, ident in filter(None, parsed) if kind == "id"}
+    emails = {ident for kind, ident in filter(None, parsed) if kind == "email"}
+
+    users = list(
+        User.objects.annotate(email_lower=Lower("email"))
+        .filter(Q(id__in=ids) | Q(email_lower__in=emails))
+        .only("id", "email", "role")
+    )
+    by_key = {("id", user.id): user for user in users}
+    by_key.update({("email", user.email_lower): user for user in users if user.email})
+
+    enrolled = set(
+        Enrollment.objects.filter(
+            course=course, student_id__in=[user.id for user in users]
+        ).values_list("student_id", flat=True)
+    )
+
+    results, to_enroll = [], []
+    for value, key in zip(values, parsed):
+        user = by_key.get(key) if key else None
+        if key is None:
+            status = "invalid"
+        elif user is None:
+            status = "not_found"
+        elif user.role != "student":
+            status = "not_student"
+        elif user.id in enrolled:
+            # Includes students listed twice in the same request
+            status = "already_enrolled"
+        else:
+            status = "enrolled"
+            enrolled.add(user.id)
+            to_enroll.append(user.id)
+        results.append(
+            {"input": value, "student": user.id if user else None, "status": status}
+        )
+
+    if to_enroll:
+        with transaction.atomic():
+            # Seats beyond the course capacity go to the waitlist
+            taken = claim_seats(course.id, len(to_enroll))
+            to_enroll, to_waitlist = to_enroll[:taken], to_enroll[taken:]
+            # No ignore_conflicts: a student enrolling concurrently must roll
+            # the batch (and the claimed seats) back
+            Enrollment.objects.bulk_create(
+                [Enrollment(course=course, student_id=pk) for pk in to_enroll],
+                batch_size=BATCH_SIZE,
+            )
+            # Students enrolled from the waitlist leave it
+            WaitlistEntry.objects.filter(
+                course=course, student_id__in=to_enroll
+            ).delete()
+            WaitlistEntry.objects.bulk_create(
+                [WaitlistEntry(course=course, student_id=pk) for pk in to_waitlist],
+                batch_size=BATCH_SIZE,
+                ignore_conflicts=True,
+            )
+            # bulk_create sends no post_save, so do what the signals would
+            if to_enroll:
+                for room in course.chat_rooms.filter(is_private=False):
+                    room.participants.add(*to_enroll)
+                add_students(course, to_enroll)
+            invalidate_course(course.id)
+
+        to_waitlist = set(to_waitlist)
+        for result in results:
+            if result["status"] == "enrolled" and result["student"] in to_waitlist:
+                result["status"] = "waitlisted"
+
+    summary = {}
+    for result in results:
+        summary[result["status"]] = summary.get(result["status"], 0) + 1
+    return {"summary": summary, "results": results}
@@ -0,0 +1,261 @@
+"""
+Ranked course search over titles and descriptions.
+
+On SQLite queries run against the FTS5 index from migration 0005, which
+triggers keep in sync with the course table. Other backends (or
+COURSE_SEARCH_BACKEND = "python") use CourseIndex, an inverted index kept
+in process memory: built from the database on first use and updated by the
+course signals afterwards. Both rank with BM25, a title match weighing
+TITLE_WEIGHT times a description match, and both treat the last query word
+as a prefix (from PREFIX_MIN_LENGTH letters) so results follow the user's
+typing.
+"""
+
+import bisect
+import heapq
+import math
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+
+from .cache import get_cache
+from .models import Course, Enrollment
+
+FTS_TABLE = "courses_course_fts"
+TITLE_WEIGHT = 10.0
+# Shorter last words only match whole words: a one- or two-letter prefix
+# matches nearly every course, which is slow to rank and useless to show
+PREFIX_MIN_LENGTH = 3
+# BM25 parameters, the same FTS5 uses
+K1 = 1.2
+B = 0.75
+WORD_RE = re.compile(r"[^\W_]+")
+VERSION_KEY = "courses:search:version"
+
+
+def tokenize(text):
+    return WORD_RE.findall(text.lower())
+
+
+def use_fts():
+    backend = getattr(settings, "COURSE_SEARCH_BACKEND", "auto")
+    if backend == "auto":
+        return connection.vendor == "sqlite"
+    return backend == "fts"
+
+
+def search_courses(query, limit, offset=0, teacher_id=None, enrolled=None, user=None):
+    """
+    Ids of the courses matching every word of `query`, best match first.
+    `teacher_id` keeps one teacher's courses; `enrolled` True/False keeps
+    the courses `user` is/isn't enrolled in.
+    """
+    words = tokenize(query)
+    if not words:
+        return []
+    if use_fts():
+        return search_fts(words, limit, offset, teacher_id, enrolled, user)
+
+    enrolled_ids = None
+    if enrolled is not None:
+        enrolled_ids = set(
+            Enrollment.objects.filter(student=user).values_list("course_id", flat=True)
+        )
+    return course_index.search(words, limit, offset, teacher_id, enrolled, enrolled_ids)
+
+
+def is_prefix(words, i):
+    return i == len(words) - 1 and len(words[i]) >= PREFIX_MIN_LENGTH
+
+
+def match_expression(words):
+    # Quoted so user input can't inject FTS5 query syntax
+    terms = ['"%s"' % word for word in words]
+    if is_prefix(words, len(words) - 1):
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search_fts(words, limit, offset, teacher_id, enrolled, user):
+    conditions, params = [], [match_expression(words)]
+    if teacher_id is not None:
+        conditions.append("AND c.teacher_id = %s")
+        params.append(teacher_id)
+    if enrolled is not None:
+        conditions.append(
+            ("AND " if enrolled else "AND NOT ")
+            + "EXISTS (SELECT 1 FROM courses_enrollment e "
+            "WHERE e.course_id = c.id AND e.student_id = %s)"
+        )
+        params.append(user.pk)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT c.id
+            FROM {FTS_TABLE}
+            JOIN courses_course c ON c.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH %s {" ".join(conditions)}
+            ORDER BY bm25({FTS_TABLE}, {TITLE_WEIGHT}, 1.0), c.id
+            LIMIT %s OFFSET %s
+            """,
+            [*params, limit, offset],
+        )
+        return [pk for (pk,) in cursor.fetchall()]
+
+
+class CourseIndex:
+    """
+    In-memory inverted index of course titles and descriptions.
+
+    Changes made by this process are applied as they commit. A version
+    counter in the course cache tells the index when another process
+    changed a course, in which case it's rebuilt on the next search.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.version = None
+            # term -> {course id: weighted term frequency}
+            self.postings = {}
+            # Sorted, for prefix lookups
+            self.terms = []
+            # course id -> (length in words, teacher id, terms)
+            self.docs = {}
+            self.total_length = 0.0
+
+    def rebuild(self, version=None):
+        with self._lock:
+            self.clear()
+            courses = Course.objects.values_list(
+                "id", "title", "description", "teacher_id"
+            )
+            for row in courses.iterator(chunk_size=2000):
+                self._add(*row, sort=False)
+            self.terms = sorted(self.postings)
+            self.version = version
+
+    def _add(self, course_id, title, description, teacher_id, sort=True):
+        title_words, description_words = tokenize(title), tokenize(description)
+        frequencies = Counter(description_words)
+        for word in title_words:
+            frequencies[word] += TITLE_WEIGHT
+        # Like FTS5, weights scale frequencies but not the document length
+        length = len(title_words) + len(description_words)
+
+        for term, frequency in frequencies.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = {}
+                if sort:
+                    bisect.insort(self.terms, term)
+            postings[course_id] = frequency
+        self.docs[course_id] = (length, teacher_id, tuple(frequencies))
+        self.total_length += length
+
+    def _remove(self, course_id):
+        doc = self.docs.pop(course_id, None)
+        if doc is None:
+            return
+        length, _, terms = doc
+        self.total_length -= length
+        for term in terms:
+            postings = self.postings[term]
+            del postings[course_id]
+            if not postings:
+                del self.postings[term]
+                del self.terms[bisect.bisect_left(self.terms, term)]
+
+    def changed(self, course_id, fields=None):
+        """
+        Record a committed change: `fields` is (title, description,
+        teacher id), or None for a deleted course.
+        """
+        cache = get_cache()
+        try:
+            version = cache.incr(VERSION_KEY)
+        except ValueError:
+            version = None
+            cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+        with self._lock:
+            if self.version is None or version != self.version + 1:
+                # Not built yet, or behind another process: rebuild lazily
+                self.version = None
+                return
+            self._remove(course_id)
+            if fields is not None:
+                self._add(course_id, *fields)
+            self.version = version
+
+    def ensure_current(self):
+        cache = get_cache()
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+        with self._lock:
+            if self.version is None or self.version != version:
+                self.rebuild(version)
+
+    def matches(self, word, prefix):
+        """{course id: frequency} of the documents containing `word`."""
+        if not prefix:
+            return self.postings.get(word, {})
+        # A prefix is one phrase: its frequency sums every matching term
+        found = {}
+        start = bisect.bisect_left(self.terms, word)
+        for term in self.terms[start:]:
+            if not term.startswith(word):
+                break
+            for course_id, frequency in self.postings[term].items():
+                found[course_id] = found.get(course_id, 0) + frequency
+        return found
+
+    def search(
+        self, words, limit, offset=0, teacher_id=None, enrolled=None, enrolled_ids=None
+    ):
+        self.ensure_current()
+        with self._lock:
+            phrases = [
+                self.matches(word, prefix=is_prefix(words, i))
+                for i, word in enumerate(words)
+            ]
+            if not all(phrases):
+                return []
+            candidates = set(min(phrases, key=len))
+            for postings in phrases:
+                candidates.intersection_update(postings)
+            if teacher_id is not None:
+                candidates = {c for c in candidates if self.docs[c][1] == teacher_id}
+            if enrolled is not None:
+                candidates = (
+                    candidates & enrolled_ids if enrolled else candidates - enrolled_ids
+                )
+
+            total = len(self.docs)
+            average_length = self.total_length / total
+            idfs = [
+                max(math.log((total - len(p) + 0.5) / (len(p) + 0.5)), 1e-6)
+                for p in phrases
+            ]
+
+            def score(course_id):
+                norm = K1 * (1 - B + B * self.docs[course_id][0] / average_length)
+                return sum(
+                    idf * p[course_id] * (K1 + 1) / (p[course_id] + norm)
+                    for idf, p in zip(idfs, phrases)
+                )
+
+            ranked = heapq.nsmallest(
+                offset + limit, candidates, key=lambda c: (-score(c), c)
+            )
+            return ranked[offset:]
+
+
+course_index = CourseIndex()
@@ -0,0 +1,131 @@
+"""
+Seat accounting for course enrollment.
+
+`Course.seats_taken` mirrors the number of enrollments so the capacity can
+be enforced with a single conditional UPDATE instead of counting rows, and
+duplicate enrollments are rejected by the (course, student) unique
+constraint rather than an exists() check. Both hold under concurrent
+requests without explicit locks.
+
+Seats are claimed here when enrolling and released by the Enrollment
+post_delete signal, which also hands the seat to the first waitlisted
+student.
+"""
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+
+from .models import Course, Enrollment, WaitlistEntry
+
+ENROLLED = "enrolled"
+WAITLISTED = "waitlisted"
+ALREADY_ENROLLED = "already_enrolled"
+
+CLAIM_RETRIES = 10
+
+
+def claim_seat(course_id):
+    """Take one seat if the course has room; True if it was taken."""
+    return bool(
+        Course.objects.filter(pk=course_id)
+        .filter(Q(capacity__isnull=True) | Q(seats_taken__lt=F("capacity")))
+        .update(seats_taken=F("seats_taken") + 1)
+    )
+
+
+def claim_seats(course_id, wanted):
+    """
+    Take up to `wanted` seats at once (compare-and-set on seats_taken).
+    Returns how many were taken.
+    """
+    for _ in range(CLAIM_RETRIES):
+        capacity, taken = Course.objects.values_list("capacity", "seats_taken").get(
+            pk=course_id
+        )
+        count = wanted if capacity is None else max(0, min(wanted, capacity - taken))
+        if count == 0:
+            return 0
+        if Course.objects.filter(pk=course_id, seats_taken=taken).update(
+            seats_taken=taken + count
+        ):
+            return count
+    return 0
+
+
+def free_seats(course_id, count=1):
+    Course.objects.filter(pk=course_id, seats_taken__gte=count).update(
+        seats_taken=F("seats_taken") - count
+    )
+
+
+def enroll(course, student):
+    """
+    Enroll `student` in `course`, or put them on the waitlist when every
+    seat is taken. One transaction: claim a seat and insert, letting the
+    unique constraint reject duplicates (which also returns the seat).
+    Returns (status, Enrollment or WaitlistEntry or None).
+    """
+    try:
+        with transaction.atomic():
+            if claim_seat(course.id):
+                enrollment = Enrollment.objects.create(course=course, student=student)
+                return ENROLLED, enrollment
+            if Enrollment.objects.filter(course=course, student=student).exists():
+                return ALREADY_ENROLLED, None
+            entry, _ = WaitlistEntry.objects.get_or_create(
+                course=course, student=student
+            )
+            return WAITLISTED, entry
+    except IntegrityError:
+        return ALREADY_ENROLLED, None
+
+
+def waitlist_position(entry):
+    """1-based position of a waitlist entry in its course's queue."""
+    return (
+        WaitlistEntry.objects.filter(course_id=entry.course_id)
+        .filter(
+            Q(created_at__lt=entry.created_at)
+            | Q(created_at=entry.created_at, id__lt=entry.id)
+        )
+        .count()
+        + 1
+    )
+
+
+def promote_waitlisted(course_id):
+    """
+    Move waitlisted students into free seats, oldest first. Returns the
+    promoted enrollments.
+    """
+    promoted = []
+    with transaction.atomic():
+        while True:
+            entry = (
+                WaitlistEntry.objects.filter(course_id=course_id)
+                .order_by("created_at", "id")
+                .first()
+            )
+            if entry is None or not claim_seat(course_id):
+                break
+            if not WaitlistEntry.objects.filter(pk=entry.pk).delete()[0]:
+                # Promoted by a concurrent request; give the seat back
+                free_seats(course_id)
+                continue
+            try:
+                with transaction.atomic():
+                    promoted.append(
+                        Enrollment.objects.create(
+                            course_id=course_id, student_id=entry.student_id
+                        )
+                    )
+            except IntegrityError:
+                free_seats(course_id)
+    return promoted
+
+
+def release_seat(course_id):
+    """Free a seat after an unenrollment and offer it to the waitlist."""
+    with transaction.atomic():
+        free_seats(course_id)
+        promote_waitlisted(course_id)
@@ -1,29 +1,73 @@
 # courses/serializers.py
 from rest_framework import serializers
-from .models import Course, Enrollment, CourseMaterial
+from .models import Course, Enrollment, CourseMaterial, UploadSession
 from django.conf import settings
 from users.serializers import UserSerializer  # To show teacher details
 from feedback.serializers import FeedbackSerializer
-
+from .downloads import download_url
 
 # Optional: Import feedback only if you want to nest feedback in course
 # But we'll keep it simple and avoid circular imports
 
 
+class SparseFieldsMixin:
+    """
+    Let clients ask for a subset of fields with ?fields=id,title. Unknown
+    names are ignored; an empty selection keeps every field.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        if request is None:
+            return
+        requested = request.query_params.get("fields", "")
+        wanted = {name.strip() for name in requested.split(",")} & set(self.fields)
+        if wanted:
+            for name in set(self.fields) - wanted:
+                self.fields.pop(name)
+
+
 class CourseMaterialSerializer(serializers.ModelSerializer):
     file = serializers.SerializerMethodField()
     title = serializers.SerializerMethodField()  # override title
+    # Rendered in the background; null until preview_status is "ready"
+    thumbnail = serializers.SerializerMethodField()
+    preview = serializers.SerializerMethodField()
 
     class Meta:
         model = CourseMaterial
-        fields = ["id", "title", "file", "course"]
-        read_only_fields = ["course"]
+        fields = [
+            "id",
+            "title",
+            "file",
+            "course",
+            "thumbnail",
+            "preview",
+            "preview_status",
+        ]
+        read_only_fields = ["course", "preview_status"]
 
     def get_file(self, obj):
+        # Files are only served through the permission-checked download view
+        request = self.context.get("request")
+        if not obj.file:
+            return None
+        if request and request.user.is_authenticated:
+            return download_url(request, obj)
+        return obj.file.url
+
+    def get_thumbnail(self, obj):
+        return self.preview_url(obj, "thumbnail")
+
+    def get_preview(self, obj):
+        return self.preview_url(obj, "preview")
+
+    def preview_url(self, obj, size):
         request = self.context.get("request")
-        if obj.file and hasattr(obj.file, "url"):
-            return request.build_absolute_uri(obj.file.url) if request else obj.file.url
-        return None
+        if size not in obj.previews or not (request and request.user.is_authenticated):
+            return None
+        return download_url(request, obj, size)
 
     def get_title(self, obj):
         # If title is blank, use the file name
@@ -32,6 +76,28 @@ class CourseMaterialSerializer(serializers.ModelSerializer):
         return obj.file.name.split("/")[-1] if obj.file else "Untitled"
 
 
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = ["id", "course", "filename", "title", "size", "offset", "created_at"]
+        read_only_fields = ["offset", "created_at"]
+
+    def validate_course(self, course):
+        if course.teacher_id != self.context["request"].user.id:
+            raise serializers.ValidationError(
+                "You can only upload materials for your own courses."
+            )
+        return course
+
+    def validate_size(self, size):
+        if size < 1:
+            raise serializers.ValidationError("Empty files can't be uploaded.")
+        limit = getattr(settings, "MATERIAL_UPLOAD_MAX_SIZE", 2 * 1024**3)
+        if size > limit:
+            raise serializers.ValidationError(f"Uploads are limited to {limit} bytes.")
+        return size
+
+
 class EnrollmentSerializer(serializers.ModelSerializer):
     student = UserSerializer(read_only=True)  # Full user data
     course_title = serializers.CharField(source="course.title", read_only=True)
@@ -42,14 +108,10 @@ class EnrollmentSerializer(serializers.ModelSerializer):
         read_only_fields = ["student", "date_enrolled"]
 
     def validate(self, attrs):
-        course = attrs["course"]
         user = self.context["request"].user
 
-        # Prevent duplicate enrollment
-        if Enrollment.objects.filter(student=user, course=course).exists():
-            raise serializers.ValidationError(
-                "You are already enrolled in this course."
-            )
+        # Duplicates are rejected by the unique constraint on insert
+        # (courses.seats.enroll)
 
         # Only students can enroll
         if user.role != "student":
@@ -58,11 +120,28 @@ class EnrollmentSerializer(serializers.ModelSerializer):
         return attrs
 
 
-class CourseSerializer(serializers.ModelSerializer):
+class BulkEnrollSerializer(serializers.Serializer):
+    """Student ids/emails as a list, or an uploaded CSV with one per row."""
+
+    students = serializers.ListField(
+        child=serializers.CharField(), required=False, max_length=5000
+    )
+    file = serializers.FileField(required=False)
+
+    def validate(self, attrs):
+        if not attrs.get("students") and not attrs.get("file"):
+            raise serializers.ValidationError(
+                "Provide a list of students or a CSV file."
+            )
+        return attrs
+
+
+class CourseSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     teacher = UserSerializer(read_only=True)  # Show full teacher info
     materials = CourseMaterialSerializer(many=True, read_only=True)
     enrollments = EnrollmentSerializer(many=True, read_only=True)
     feedbacks = serializers.SerializerMethodField()  # Dynamic field
+    rating = serializers.SerializerMethodField()
 
     class Meta:
         model = Course
@@ -71,24 +150,28 @@ class CourseSerializer(serializers.ModelSerializer):
             "title",
             "description",
             "teacher",
+            "capacity",
+            "seats_taken",
             "materials",
             "enrollments",
             "feedbacks",
+            "rating",
         ]
 
     def get_feedbacks(self, obj):
-        """
-        Optionally include feedbacks related to this course.
-        This avoids needing a direct import from feedback app.
-        If you get ImportError, remove this or use a string reference.
-        """
-        try:
-            from feedback.serializers import FeedbackSerializer
-
-            feedbacks = obj.feedbacks.all()  # Related by Course -> Feedback
-            return FeedbackSerializer(feedbacks, many=True).data
-        except (ImportError, AttributeError):
-            return []
+        # Uses the feedbacks prefetched by CourseViewSet when available
+        return FeedbackSerializer(obj.feedbacks.all(), many=True).data
+
+    def get_rating(self, obj):
+        # The course's rating aggregate; None until it's first rated
+        rating = getattr(obj, "rating", None)
+        if rating is None:
+            return None
+        return {
+            "count": rating.count,
+            "average": rating.average,
+            "histogram": rating.histogram,
+        }
 
     def create(self, validated_data):
         """
@@ -100,6 +183,36 @@ class CourseSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class CourseSummarySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    Catalog card for a course. The counts, average rating and enrollment
+    flag are annotated by CourseViewSet, so no rosters are loaded.
+    """
+
+    teacher_name = serializers.CharField(source="teacher.username", read_only=True)
+    material_count = serializers.IntegerField(read_only=True)
+    enrollment_count = serializers.IntegerField(read_only=True)
+    average_rating = serializers.FloatField(read_only=True)
+    rating_count = serializers.IntegerField(read_only=True)
+    is_enrolled = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = Course
+        fields = [
+            "id",
+            "title",
+            "description",
+            "teacher_name",
+            "capacity",
+            "seats_taken",
+            "material_count",
+            "enrollment_count",
+            "average_rating",
+            "rating_count",
+            "is_enrolled",
+        ]
+
+
 class CourseDetailSerializer(serializers.ModelSerializer):
     teacher = serializers.StringRelatedField()
     materials = CourseMaterialSerializer(many=True, read_only=True)
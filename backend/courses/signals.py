@@ -0,0 +1,82 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from feedback.models import Feedback
+from .cache import invalidate_course
+from .models import Course, CourseMaterial, Enrollment
+from .previews import schedule
+from .search import course_index, use_fts
+from .seats import free_seats, promote_waitlisted, release_seat
+from .uploads import release_blob
+
+
+@receiver(pre_save, sender=Course)
+def remember_previous_teacher(sender, instance, **kwargs):
+    # For receivers that follow a course changing hands (chat, feedback)
+    instance._previous_teacher_id = None
+    if instance.pk:
+        instance._previous_teacher_id = (
+            Course.objects.filter(pk=instance.pk)
+            .values_list("teacher_id", flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def invalidate_cached_course(sender, instance, **kwargs):
+    invalidate_course(instance.pk)
+
+
+@receiver(post_save, sender=Course)
+def index_course(sender, instance, **kwargs):
+    # Without FTS5 (whose table triggers maintain) update the in-process index
+    if not use_fts():
+        course_id = instance.pk
+        fields = (instance.title, instance.description, instance.teacher_id)
+        transaction.on_commit(lambda: course_index.changed(course_id, fields))
+
+
+@receiver(post_delete, sender=Course)
+def unindex_course(sender, instance, **kwargs):
+    if not use_fts():
+        course_id = instance.pk
+        transaction.on_commit(lambda: course_index.changed(course_id))
+
+
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+@receiver(post_save, sender=CourseMaterial)
+@receiver(post_delete, sender=CourseMaterial)
+@receiver(post_save, sender=Feedback)
+@receiver(post_delete, sender=Feedback)
+def invalidate_cached_course_rows(sender, instance, **kwargs):
+    invalidate_course(instance.course_id)
+
+
+@receiver(post_delete, sender=Enrollment)
+def release_enrollment_seat(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Course):
+        # The whole course is going away
+        return
+    if isinstance(origin, Enrollment) or getattr(origin, "model", None) is Enrollment:
+        release_seat(instance.course_id)
+    else:
+        # Cascaded from a user deletion: don't promote while rows are being
+        # collected for deletion; free the seat and promote once it's done
+        course_id = instance.course_id
+        free_seats(course_id)
+        transaction.on_commit(lambda: promote_waitlisted(course_id))
+
+
+@receiver(post_save, sender=CourseMaterial)
+def generate_material_previews(sender, instance, created, **kwargs):
+    if created and instance.file:
+        schedule(instance)
+
+
+@receiver(post_delete, sender=CourseMaterial)
+def release_material_blob(sender, instance, **kwargs):
+    if instance.blob_id:
+        release_blob(instance.blob_id)
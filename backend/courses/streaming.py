@@ -0,0 +1,30 @@
+"""
+Streaming responses that stay streamed under ASGI.
+
+Given a sync iterator, Django's StreamingHttpResponse.__aiter__ reads it
+into a list before sending anything, so under daphne/uvicorn a large
+export or download would be held in memory whole. These responses pull one
+block at a time through sync_to_async instead, on the request's
+thread-sensitive thread so a database cursor stays on its connection. Sync
+consumers (WSGI, the test client) still iterate the blocks directly.
+"""
+
+from asgiref.sync import sync_to_async
+from django.http import FileResponse, StreamingHttpResponse
+
+
+class BlockStreamingMixin:
+    async def __aiter__(self):
+        parts = iter(self.streaming_content)
+        # StopIteration can't cross sync_to_async; blocks are never None
+        next_part = sync_to_async(next, thread_sensitive=True)
+        while (part := await next_part(parts, None)) is not None:
+            yield part
+
+
+class BlockStreamingHttpResponse(BlockStreamingMixin, StreamingHttpResponse):
+    pass
+
+
+class BlockFileResponse(BlockStreamingMixin, FileResponse):
+    pass
@@ -1,15 +1,91 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from PIL import Image
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.utils import FileProxyMixin
+from django.core.handlers.asgi import ASGIHandler
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections
+from django.test import TestCase, TransactionTestCase, override_settings
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from .models import Course
+from chat.models import ChatRoom
+from feedback.models import Feedback
+from . import exports
+from .cache import get_cache, response_cache
+from .models import Course, CourseMaterial, Enrollment, MaterialBlob, UploadSession
+from .search import VERSION_KEY, course_index
+from .uploads import finish_upload, hashers, store_material
 
 User = get_user_model()
 
 
+def asgi_get(path, token, headers=(), events=None):
+    """
+    GET `path` through Django's ASGI handler; returns the response start
+    message and the body messages. "sent" is appended to `events` as each
+    body message arrives.
+    """
+    events = [] if events is None else events
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path.split("?")[0],
+        "query_string": path.partition("?")[2].encode(),
+        "headers": [
+            (b"host", b"testserver"),
+            (b"authorization", f"Bearer {token}".encode()),
+            *[(k.lower().encode(), v.encode()) for k, v in headers],
+        ],
+        "client": ("127.0.0.1", 1),
+        "server": ("testserver", 80),
+    }
+
+    async def run():
+        communicator = ApplicationCommunicator(ASGIHandler(), scope)
+        await communicator.send_input({"type": "http.request"})
+        start = await communicator.receive_output(5)
+        body = [await communicator.receive_output(5)]
+        events.append("sent")
+        while body[-1].get("more_body"):
+            body.append(await communicator.receive_output(5))
+            events.append("sent")
+        await communicator.wait()
+        return start, body
+
+    # Like the test client, keep the test's connection (and transaction) open
+    request_started.disconnect(close_old_connections)
+    request_finished.disconnect(close_old_connections)
+    try:
+        return async_to_sync(run)()
+    finally:
+        request_started.connect(close_old_connections)
+        request_finished.connect(close_old_connections)
+
+
 class CourseViewsTest(APITestCase):
 
     def setUp(self):
@@ -50,3 +126,1066 @@ class CourseViewsTest(APITestCase):
         response = self.client.post(url, data, format="json")
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
         self.assertEqual(Course.objects.count(), 0)
+
+
+class CourseQueryCountTest(APITestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.teacher = User.objects.create_user(
+            username="teacher1", password="pass123", role="teacher"
+        )
+        self.student = User.objects.create_user(
+            username="student1", password="pass123", role="student"
+        )
+
+    def add_courses(self, count):
+        for i in range(count):
+            course = Course.objects.create(
+                title=f"Course {i}", description="", teacher=self.teacher
+            )
+            CourseMaterial.objects.create(course=course, file="course_materials/a.pdf")
+            student = User.objects.create(
+                username=f"learner_{course.id}", role="student"
+            )
+            Enrollment.objects.create(course=course, student=student)
+            Enrollment.objects.create(course=course, student=self.student)
+            Feedback.objects.create(course=course, student=student, rating=5)
+
+    def login(self, user):
+        token = str(RefreshToken.for_user(user).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def assertConstantQueries(self, url, num):
+        # auth lookup + one query per level of the serializer tree
+        for count in (1, 10):
+            self.add_courses(count)
+            with self.assertNumQueries(num):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_course_list(self):
+        self.login(self.student)
+        self.assertConstantQueries(reverse("course-list"), 5)
+
+    def test_teacher_course_list(self):
+        self.login(self.teacher)
+        self.assertConstantQueries(reverse("course-list"), 5)
+
+    def test_enrollment_lists(self):
+        self.login(self.student)
+        self.assertConstantQueries(reverse("enrollment-list"), 2)
+        self.assertConstantQueries(reverse("enrollment-my-enrollments"), 2)
+        self.login(self.teacher)
+        self.assertConstantQueries(reverse("enrollment-list"), 2)
+
+    def test_summary_list(self):
+        self.login(self.student)
+        self.assertConstantQueries(reverse("course-list") + "?view=summary", 3)
+
+        # Served from the response cache, so read the rendered body
+        data = self.client.get(reverse("course-list"), {"view": "summary"}).json()
+        self.assertEqual(data["count"], 11)
+        self.assertEqual(len(data["results"]), 11)
+        card = data["results"][0]
+        self.assertEqual(card["teacher_name"], "teacher1")
+        self.assertEqual(card["material_count"], 1)
+        self.assertEqual(card["enrollment_count"], 2)
+        self.assertEqual(card["average_rating"], 5.0)
+        self.assertTrue(card["is_enrolled"])
+        self.assertNotIn("enrollments", card)
+
+    def test_summary_pagination_and_fields(self):
+        self.add_courses(3)
+        empty = Course.objects.create(
+            title="Empty", description="", teacher=self.teacher
+        )
+        self.login(self.teacher)
+
+        response = self.client.get(
+            reverse("course-list"),
+            {"view": "summary", "limit": 2, "offset": 2, "fields": "id,average_rating"},
+        )
+        self.assertEqual(response.data["count"], 4)
+        self.assertIsNone(response.data["next"])
+        self.assertEqual(
+            response.data["results"][1],
+            {"id": empty.id, "average_rating": None},
+        )
+
+    def test_full_list_stays_unpaginated(self):
+        self.add_courses(2)
+        self.login(self.student)
+        response = self.client.get(reverse("course-list"), {"fields": "id,title"})
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(set(response.data[0]), {"id", "title"})
+
+
+class CourseResponseCacheTest(APITestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        response_cache.clear()
+        self.teacher = User.objects.create(username="teacher1", role="teacher")
+        self.student = User.objects.create(username="student1", role="student")
+        self.course = Course.objects.create(
+            title="Math 101", description="Algebra", teacher=self.teacher
+        )
+        self.url = reverse("course-detail", args=[self.course.id])
+        token = str(RefreshToken.for_user(self.student).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_hit_skips_queryset_and_serializer(self):
+        first = self.client.get(self.url)
+        # Only the authentication lookup remains
+        with self.assertNumQueries(1):
+            second = self.client.get(self.url)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second["ETag"], first["ETag"])
+        self.assertEqual(response_cache.stats()["hits"], 1)
+        self.assertEqual(response_cache.stats()["misses"], 1)
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get(self.url)["ETag"]
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response_cache.stats()["hit_rate"], 0.5)
+
+    def test_related_changes_invalidate(self):
+        changes = [
+            lambda: Enrollment.objects.create(course=self.course, student=self.student),
+            lambda: Feedback.objects.create(
+                course=self.course, student=self.student, rating=4
+            ),
+            lambda: CourseMaterial.objects.create(
+                course=self.course, file="course_materials/a.pdf"
+            ),
+            lambda: Course.objects.filter(pk=self.course.pk).first().save(),
+            lambda: Enrollment.objects.all().delete(),
+        ]
+        for change in changes:
+            etag = self.client.get(self.url)["ETag"]
+            listed = self.client.get(reverse("course-list"))["ETag"]
+            change()
+            self.assertNotEqual(self.client.get(self.url)["ETag"], etag)
+            self.assertNotEqual(self.client.get(reverse("course-list"))["ETag"], listed)
+
+        data = self.client.get(self.url).json()
+        self.assertEqual(len(data["feedbacks"]), 1)
+        self.assertEqual(len(data["enrollments"]), 0)
+
+    def test_other_courses_stay_cached(self):
+        other = Course.objects.create(
+            title="Other", description="", teacher=self.teacher
+        )
+        etag = self.client.get(self.url)["ETag"]
+        Enrollment.objects.create(course=other, student=self.student)
+        self.assertEqual(self.client.get(self.url)["ETag"], etag)
+
+    def test_responses_are_per_user(self):
+        self.client.get(reverse("course-list"), {"view": "summary"})
+        other = User.objects.create(username="student2", role="student")
+        token = str(RefreshToken.for_user(other).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        Enrollment.objects.create(course=self.course, student=self.student)
+        response = self.client.get(reverse("course-list"), {"view": "summary"})
+        self.assertFalse(response.data["results"][0]["is_enrolled"])
+
+    def test_cache_stats_is_staff_only(self):
+        url = reverse("course-cache-stats")
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(
+            User.objects.create(username="admin", is_staff=True)
+        )
+        self.assertIn("hit_rate", self.client.get(url).data)
+
+
+class BulkEnrollTest(APITestCase):
+
+    def setUp(self):
+        self.teacher = User.objects.create(username="teacher1", role="teacher")
+        self.course = Course.objects.create(
+            title="Math 101", description="", teacher=self.teacher
+        )
+        self.room = ChatRoom.objects.create(course=self.course)
+        self.students = [
+            User.objects.create(
+                username=f"s{i}", email=f"S{i}@example.com", role="student"
+            )
+            for i in range(4)
+        ]
+        Enrollment.objects.create(course=self.course, student=self.students[0])
+        self.url = reverse("course-enroll", args=[self.course.id])
+        self.login(self.teacher)
+
+    def login(self, user):
+        token = str(RefreshToken.for_user(user).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_enroll_ids_and_emails(self):
+        students = [
+            self.students[0].id,
+            self.students[1].id,
+            "s2@example.com",
+            str(self.students[2].id),
+            "nobody@example.com",
+            self.teacher.id,
+            "garbage",
+        ]
+        # auth, course, users, existing enrollments, seat read + claim, one
+        # insert, the waitlist cleanup, the chat room and its participant
+        # check + insert, the timeline backfill's pull switch, check and
+        # update read (plus the savepoint pair)
+        with self.assertNumQueries(16):
+            response = self.client.post(self.url, {"students": students}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [r["status"] for r in response.data["results"]],
+            [
+                "already_enrolled",
+                "enrolled",
+                "enrolled",
+                "already_enrolled",
+                "not_found",
+                "not_student",
+                "invalid",
+            ],
+        )
+        self.assertEqual(response.data["summary"]["enrolled"], 2)
+        self.assertEqual(
+            set(self.course.enrollments.values_list("student_id", flat=True)),
+            {s.id for s in self.students[:3]},
+        )
+        self.assertEqual(
+            set(self.room.participants.values_list("id", flat=True)),
+            {self.students[1].id, self.students[2].id},
+        )
+
+    def test_enroll_from_csv(self):
+        upload = SimpleUploadedFile(
+            "roster.csv",
+            f"email\ns1@example.com\n\n{self.students[3].id}\n".encode(),
+            content_type="text/csv",
+        )
+        response = self.client.post(self.url, {"file": upload}, format="multipart")
+        self.assertEqual(response.data["summary"], {"enrolled": 2})
+        self.assertEqual(self.course.enrollments.count(), 3)
+
+    def test_requires_course_teacher(self):
+        self.login(self.students[1])
+        response = self.client.post(
+            self.url, {"students": [self.students[1].id]}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        other = User.objects.create(username="teacher2", role="teacher")
+        self.login(other)
+        response = self.client.post(
+            self.url, {"students": [self.students[1].id]}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.course.enrollments.count(), 1)
+
+    def test_requires_students_or_file(self):
+        response = self.client.post(self.url, {}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class EnrollmentSeatTest(APITestCase):
+
+    def setUp(self):
+        self.teacher = User.objects.create(username="teacher1", role="teacher")
+        self.course = Course.objects.create(
+            title="Math 101", description="", teacher=self.teacher, capacity=2
+        )
+        self.students = [
+            User.objects.create(username=f"s{i}", role="student") for i in range(4)
+        ]
+        self.url = reverse("enrollment-list")
+
+    def login(self, user):
+        token = str(RefreshToken.for_user(user).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def enroll(self, student):
+        self.login(student)
+        return self.client.post(self.url, {"course": self.course.id}, format="json")
+
+    def test_full_course_waitlists(self):
+        self.assertEqual(self.enroll(self.students[0]).status_code, 201)
+        self.assertEqual(self.enroll(self.students[1]).status_code, 201)
+        response = self.enroll(self.students[2])
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data["position"], 1)
+        self.assertEqual(self.enroll(self.students[3]).data["position"], 2)
+        # Asking again keeps the place in the queue
+        self.assertEqual(self.enroll(self.students[2]).data["position"], 1)
+
+        duplicate = self.enroll(self.students[0])
+        self.assertEqual(duplicate.status_code, status.HTTP_400_BAD_REQUEST)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.seats_taken, 2)
+        self.assertEqual(self.course.enrollments.count(), 2)
+
+    def test_unenroll_promotes_first_waitlisted(self):
+        for student in self.students:
+            self.enroll(student)
+        enrollment = Enrollment.objects.get(student=self.students[0])
+
+        self.login(self.students[0])
+        response = self.client.delete(
+            reverse("enrollment-detail", args=[enrollment.id])
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.seats_taken, 2)
+        self.assertEqual(
+            set(self.course.enrollments.values_list("student_id", flat=True)),
+            {self.students[1].id, self.students[2].id},
+        )
+        self.assertEqual(
+            list(self.course.waitlist.values_list("student_id", flat=True)),
+            [self.students[3].id],
+        )
+
+    def test_raising_capacity_promotes_waitlist(self):
+        for student in self.students:
+            self.enroll(student)
+        self.login(self.teacher)
+        response = self.client.patch(
+            reverse("course-detail", args=[self.course.id]),
+            {"capacity": 3},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.seats_taken, 3)
+        self.assertEqual(self.course.waitlist.count(), 1)
+
+    def test_leave_waitlist(self):
+        for student in self.students[:3]:
+            self.enroll(student)
+        response = self.client.delete(reverse("course-waitlist", args=[self.course.id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(self.course.waitlist.exists())
+
+    def test_bulk_enroll_fills_seats_then_waitlists(self):
+        self.login(self.teacher)
+        response = self.client.post(
+            reverse("course-enroll", args=[self.course.id]),
+            {"students": [s.id for s in self.students[:3]]},
+            format="json",
+        )
+        self.assertEqual(response.data["summary"], {"enrolled": 2, "waitlisted": 1})
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.seats_taken, 2)
+
+    def test_bulk_enrolling_a_waitlisted_student_removes_the_entry(self):
+        for student in self.students[:3]:
+            self.enroll(student)
+        # A seat opens without promoting anyone
+        Course.objects.filter(pk=self.course.pk).update(capacity=3)
+
+        self.login(self.teacher)
+        response = self.client.post(
+            reverse("course-enroll", args=[self.course.id]),
+            {"students": [self.students[2].id]},
+            format="json",
+        )
+        self.assertEqual(response.data["summary"], {"enrolled": 1})
+        self.assertTrue(
+            self.course.enrollments.filter(student=self.students[2]).exists()
+        )
+        self.assertFalse(self.course.waitlist.exists())
+
+    def test_deleting_a_user_promotes_first_waitlisted(self):
+        for student in self.students:
+            self.enroll(student)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.students[0].delete()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.seats_taken, 2)
+        self.assertEqual(
+            set(self.course.enrollments.values_list("student_id", flat=True)),
+            {self.students[1].id, self.students[2].id},
+        )
+        self.assertEqual(
+            list(self.course.waitlist.values_list("student_id", flat=True)),
+            [self.students[3].id],
+        )
+
+
+class ConcurrentEnrollTest(TestCase):
+
+    def test_parallel_enrollments_never_oversubscribe(self):
+        # bench_enroll needs its own file-backed database so its threads can
+        # share it, so run it in a separate process
+        result = subprocess.run(
+            [
+                sys.executable,
+                "manage.py",
+                "bench_enroll",
+                "--students=200",
+                "--capacity=50",
+                "--threads=16",
+                "--unenroll=10",
+                "--json",
+            ],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            timeout=300,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        report = json.loads(result.stdout)
+        self.assertEqual(report["enroll"]["errors"], 0)
+        self.assertEqual(report["enroll"]["enrolled"], 50)
+        self.assertEqual(report["enroll"]["waitlisted"], 150)
+        self.assertEqual(
+            report["final"],
+            {
+                "capacity": 50,
+                "seats_taken": 50,
+                "enrollments": 50,
+                "waitlist": 140,
+                "oversubscribed": False,
+                "counter_matches": True,
+                "enrolled_and_waitlisted": 0,
+            },
+        )
+
+
+class MaterialUploadTest(APITestCase):
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        media_override = override_settings(
+            MEDIA_ROOT=media, MATERIAL_UPLOAD_TEMP_DIR=os.path.join(media, "parts")
+        )
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        self.teacher = User.objects.create(username="teacher1", role="teacher")
+        self.course = Course.objects.create(
+            title="Math 101", description="", teacher=self.teacher
+        )
+        self.other_course = Course.objects.create(
+            title="Math 101 (B)", description="", teacher=self.teacher
+        )
+        self.content = b"lecture video " * 1000
+        token = str(RefreshToken.for_user(self.teacher).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def start(self, course, size=None):
+        response = self.client.post(
+            reverse("upload-list"),
+            {
+                "course": course.id,
+                "filename": "week1.mp4",
+                "size": len(self.content) if size is None else size,
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data["id"]
+
+    def send(self, upload_id, offset, data):
+        return self.client.generic(
+            "PATCH",
+            reverse("upload-detail", args=[upload_id]),
+            data,
+            content_type="application/offset+octet-stream",
+            HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def upload(self, course, chunk_size=5000):
+        upload_id = self.start(course)
+        for offset in range(0, len(self.content), chunk_size):
+            response = self.send(
+                upload_id, offset, self.content[offset : offset + chunk_size]
+            )
+        return response
+
+    def test_chunked_upload_resumes_and_completes(self):
+        upload_id = self.start(self.course)
+        self.assertEqual(
+            self.send(upload_id, 0, self.content[:6000]).data["offset"], 6000
+        )
+
+        # A lost response: the client asks where to continue
+        response = self.client.get(reverse("upload-detail", args=[upload_id]))
+        self.assertEqual(response.data["offset"], 6000)
+        stale = self.send(upload_id, 0, self.content[:6000])
+        self.assertEqual(stale.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(stale["Upload-Offset"], "6000")
+
+        # This process forgot the running hash; it's rebuilt from the part file
+        hashers.discard(UploadSession.objects.get(pk=upload_id).id)
+        response = self.send(upload_id, 6000, self.content[6000:])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["title"], "week1.mp4")
+
+        material = CourseMaterial.objects.get(pk=response.data["id"])
+        self.assertEqual(material.blob.sha256, hashlib.sha256(self.content).hexdigest())
+        with material.file.open("rb") as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(settings.MEDIA_ROOT, "parts")), [])
+
+    def test_failed_finish_can_be_retried(self):
+        upload_id = self.start(self.course)
+        self.send(upload_id, 0, self.content[:6000])
+        with mock.patch(
+            "courses.uploads.create_material", side_effect=RuntimeError("db down")
+        ):
+            with self.assertRaises(RuntimeError):
+                self.send(upload_id, 6000, self.content[6000:])
+
+        # Nothing was kept from the attempt; the session and its bytes were
+        session = UploadSession.objects.get(pk=upload_id)
+        self.assertEqual(session.offset, len(self.content))
+        self.assertFalse(MaterialBlob.objects.exists())
+        blobs = os.path.join(settings.MEDIA_ROOT, "material_blobs")
+        self.assertEqual([files for _, _, files in os.walk(blobs) if files], [])
+        self.assertEqual(
+            os.listdir(os.path.join(settings.MEDIA_ROOT, "parts")),
+            [f"{upload_id}.part"],
+        )
+
+        material = finish_upload(session)
+        with material.file.open("rb") as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(settings.MEDIA_ROOT, "parts")), [])
+
+    def test_failed_single_request_upload_leaves_no_blob_file(self):
+        with mock.patch(
+            "courses.uploads.create_material", side_effect=RuntimeError("db down")
+        ):
+            with self.assertRaises(RuntimeError):
+                store_material(
+                    self.course, SimpleUploadedFile("week1.mp4", self.content)
+                )
+
+        self.assertFalse(MaterialBlob.objects.exists())
+        blobs = os.path.join(settings.MEDIA_ROOT, "material_blobs")
+        self.assertEqual([files for _, _, files in os.walk(blobs) if files], [])
+
+    def test_idle_uploads_expire(self):
+        idle, active = self.start(self.course), self.start(self.other_course)
+        self.send(idle, 0, self.content[:5000])
+        self.send(active, 0, self.content[:5000])
+        UploadSession.objects.filter(pk=idle).update(
+            updated_at=timezone.now() - timedelta(hours=30)
+        )
+        parts = os.path.join(settings.MEDIA_ROOT, "parts")
+        orphan = os.path.join(parts, "gone.part")
+        with open(orphan, "wb") as f:
+            f.write(b"left behind")
+        os.utime(orphan, (0, 0))
+
+        out = io.StringIO()
+        call_command("expire_uploads", hours=24, stdout=out)
+        self.assertIn("Discarded 1 upload sessions and 1 orphaned", out.getvalue())
+        self.assertEqual(
+            list(UploadSession.objects.values_list("id", flat=True)),
+            [UploadSession.objects.get(pk=active).id],
+        )
+        self.assertEqual(os.listdir(parts), [f"{active}.part"])
+
+    def test_identical_files_share_a_blob(self):
+        first = self.upload(self.course)
+        second = self.client.post(
+            reverse("material-list"),
+            {
+                "course": self.other_course.id,
+                "file": SimpleUploadedFile("copy.mp4", self.content),
+            },
+            format="multipart",
+        )
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+
+        blob = MaterialBlob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(
+            set(CourseMaterial.objects.values_list("file", flat=True)),
+            {blob.file.name},
+        )
+
+        path = blob.file.path
+        CourseMaterial.objects.get(pk=first.data["id"]).delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            CourseMaterial.objects.get(pk=second.data["id"]).delete()
+        self.assertFalse(MaterialBlob.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_abandon_upload(self):
+        upload_id = self.start(self.course)
+        self.send(upload_id, 0, self.content[:100])
+        response = self.client.delete(reverse("upload-detail", args=[upload_id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(os.listdir(os.path.join(settings.MEDIA_ROOT, "parts")), [])
+
+    def test_only_the_course_teacher_can_upload(self):
+        other = User.objects.create(username="teacher2", role="teacher")
+        token = str(RefreshToken.for_user(other).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        response = self.client.post(
+            reverse("upload-list"),
+            {"course": self.course.id, "filename": "x.pdf", "size": 10},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_chunk_past_declared_size_is_rejected(self):
+        upload_id = self.start(self.course, size=10)
+        response = self.send(upload_id, 0, b"x" * 11)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    @override_settings(MATERIAL_UPLOAD_MAX_CHUNK_SIZE=4000)
+    def test_oversized_chunk_is_rejected(self):
+        upload_id = self.start(self.course)
+        response = self.send(upload_id, 0, self.content[:4001])
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(UploadSession.objects.get(pk=upload_id).offset, 0)
+        self.assertEqual(self.send(upload_id, 0, self.content[:4000]).status_code, 200)
+
+
+class MaterialDownloadTest(APITestCase):
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        media_override = override_settings(MEDIA_ROOT=media)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        self.teacher = User.objects.create(username="teacher1", role="teacher")
+        self.student = User.objects.create(username="student1", role="student")
+        self.outsider = User.objects.create(username="student2", role="student")
+        self.course = Course.objects.create(
+            title="Math 101", description="", teacher=self.teacher
+        )
+        Enrollment.objects.create(course=self.course, student=self.student)
+        self.content = bytes(range(256)) * 1000
+        self.material = store_material(
+            self.course, SimpleUploadedFile("week1.mp4", self.content)
+        )
+        self.url = reverse("material-download", args=[self.material.id])
+
+    def login(self, user):
+        token = str(RefreshToken.for_user(user).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_enrolled_student_downloads_whole_file(self):
+        self.login(self.student)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["ETag"], f'"{self.material.blob.sha256}"')
+        self.assertIn("Last-Modified", response)
+
+    def test_range_requests(self):
+        self.login(self.student)
+        response = self.client.get(self.url, HTTP_RANGE="bytes=1000-1999")
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(
+            response["Content-Range"], f"bytes 1000-1999/{len(self.content)}"
+        )
+        self.assertEqual(b"".join(response.streaming_content), self.content[1000:2000])
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=-10")
+        self.assertEqual(b"".join(response.streaming_content), self.content[-10:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f"bytes={len(self.content)}-")
+        self.assertEqual(
+            response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        )
+        self.assertEqual(response["Content-Range"], f"bytes */{len(self.content)}")
+
+        # A stale If-Range gets the whole file
+        response = self.client.get(
+            self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"outdated"'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_conditional_get(self):
+        self.login(self.teacher)
+        response = self.client.get(self.url)
+        etag, modified = response["ETag"], response["Last-Modified"]
+        response.close()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_only_course_members_can_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.login(self.outsider)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_signed_link_from_material_list(self):
+        self.login(self.student)
+        response = self.client.get(reverse("material-list"), {"course": self.course.id})
+        link = response.json()[0]["file"]
+        self.assertIn(self.url, link)
+
+        self.client.credentials()
+        response = self.client.get(link)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+        # Tokens are bound to the material and lose access with the enrollment
+        other = store_material(self.course, SimpleUploadedFile("b.pdf", b"notes"))
+        other_url = reverse("material-download", args=[other.id])
+        response = self.client.get(other_url + "?" + link.split("?", 1)[1])
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        Enrollment.objects.filter(student=self.student).delete()
+        response = self.client.get(link)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+@override_settings(MATERIAL_PREVIEW_WORKERS=0)
+class MaterialDownloadAsgiTest(TransactionTestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        media_override = override_settings(MEDIA_ROOT=media)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        teacher = User.objects.create(username="teacher1", role="teacher")
+        course = Course.objects.create(title="Math", description="", teacher=teacher)
+        self.content = bytes(range(256)) * 1000  # four 64 KB blocks
+        material = store_material(course, SimpleUploadedFile("a.mp4", self.content))
+        self.url = reverse("material-download", args=[material.id])
+        self.token = str(RefreshToken.for_user(teacher).access_token)
+
+    def download(self, headers=()):
+        events = []
+        read = FileProxyMixin.read.fget
+
+        def recording_read(file):
+            def read_block(*args):
+                data = read(file)(*args)
+                if data:
+                    events.append("block")
+                return data
+
+            return read_block
+
+        with mock.patch.object(FileProxyMixin, "read", property(recording_read)):
+            start, body = asgi_get(self.url, self.token, headers, events)
+        # Blocks go out as they are read, not after the whole file is
+        self.assertEqual(events.count("block"), 4)
+        self.assertLess(events.index("sent"), events.index("block", 2))
+        return start, b"".join(m.get("body", b"") for m in body)
+
+    def test_whole_file(self):
+        start, content = self.download()
+        self.assertEqual(start["status"], status.HTTP_200_OK)
+        self.assertEqual(content, self.content)
+
+    def test_range(self):
+        start, content = self.download([("Range", "bytes=0-199999")])
+        self.assertEqual(start["status"], status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(content, self.content[:200000])
+
+
+@override_settings(MATERIAL_PREVIEW_WORKERS=0)
+class MaterialPreviewTest(APITestCase):
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        media_override = override_settings(MEDIA_ROOT=media)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        self.teacher = User.objects.create(username="teacher1", role="teacher")
+        self.course = Course.objects.create(
+            title="Art 101", description="", teacher=self.teacher
+        )
+        token = str(RefreshToken.for_user(self.teacher).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def image(self, name="photo.png", size=(2000, 1000)):
+        buffer = io.BytesIO()
+        Image.new("RGB", size, "orange").save(buffer, "PNG")
+        return SimpleUploadedFile(name, buffer.getvalue())
+
+    def upload(self, upload):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("material-list"),
+                {"course": self.course.id, "file": upload},
+                format="multipart",
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return CourseMaterial.objects.get(pk=response.data["id"])
+
+    def test_image_previews_are_rendered_next_to_the_file(self):
+        material = self.upload(self.image())
+        self.assertEqual(material.preview_status, "ready")
+        self.assertEqual(
+            material.previews["thumbnail"], material.file.name + ".thumbnail.jpg"
+        )
+        with default_storage.open(material.previews["preview"]) as f:
+            self.assertEqual(Image.open(f).size, (1280, 640))
+
+        response = self.client.get(reverse("material-list"), {"course": self.course.id})
+        data = response.json()[0]
+        self.assertEqual(data["preview_status"], "ready")
+        self.client.credentials()
+        response = self.client.get(data["thumbnail"])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        content = b"".join(response.streaming_content)
+        self.assertEqual(Image.open(io.BytesIO(content)).size, (320, 160))
+
+    def test_non_images_are_unsupported(self):
+        material = self.upload(
+            SimpleUploadedFile("notes.pdf", b"%PDF-1.4 not an image")
+        )
+        self.assertEqual(material.preview_status, "unsupported")
+        response = self.client.get(reverse("material-list"), {"course": self.course.id})
+        self.assertIsNone(response.json()[0]["thumbnail"])
+        response = self.client.get(
+            reverse("material-download", args=[material.id]), {"size": "thumbnail"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_oversized_images_are_not_previewed(self):
+        # The limit is checked per image; Pillow's global is left alone
+        self.assertEqual(Image.MAX_IMAGE_PIXELS, int(1024 * 1024 * 1024 // 4 // 3))
+        with mock.patch("courses.thumbnails.MAX_PIXELS", 1000 * 1000):
+            material = self.upload(self.image())
+        self.assertEqual(material.preview_status, "unsupported")
+
+    def test_rendering_is_idempotent(self):
+        first = self.upload(self.image())
+        path = default_storage.path(first.previews["thumbnail"])
+        rendered_at = os.path.getmtime(path)
+        # The same content again shares the blob and its previews
+        second = self.upload(self.image("copy.png"))
+        self.assertEqual(second.previews, first.previews)
+        self.assertEqual(os.path.getmtime(path), rendered_at)
+
+        # Both are still in use; deleting the last one removes the files
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(path))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+
+    @override_settings(MATERIAL_PREVIEW_WORKERS=1)
+    def test_command_renders_pending_materials_in_worker_processes(self):
+        # Created outside of a commit: nothing was rendered
+        material = store_material(self.course, self.image())
+        self.assertEqual(material.preview_status, "pending")
+        out = io.StringIO()
+        call_command("generate_previews", stdout=out)
+        self.assertEqual(out.getvalue().strip(), "1 ready")
+        material.refresh_from_db()
+        self.assertEqual(material.preview_status, "ready")
+        self.assertTrue(default_storage.exists(material.previews["thumbnail"]))
+
+
+class CourseSearchTests:
+    backend = None
+
+    def setUp(self):
+        override = override_settings(COURSE_SEARCH_BACKEND=self.backend)
+        override.enable()
+        self.addCleanup(override.disable)
+        course_index.clear()
+
+        self.teacher = User.objects.create(username="teacher1", role="teacher")
+        self.other_teacher = User.objects.create(username="teacher2", role="teacher")
+        self.student = User.objects.create(username="student1", role="student")
+        self.algebra = Course.objects.create(
+            title="Linear Algebra",
+            description="Vectors, matrices and linear maps.",
+            teacher=self.teacher,
+        )
+        self.algorithms = Course.objects.create(
+            title="Algorithms",
+            description="Sorting, graphs and some algebra for analysis.",
+            teacher=self.other_teacher,
+        )
+        self.writing = Course.objects.create(
+            title="Creative Writing",
+            description="Stories, poems and essays.",
+            teacher=self.teacher,
+        )
+        # Unrelated courses, so matching terms are rare enough to rank by
+        for subject in ("Biology", "Chemistry", "History", "Music", "Physics"):
+            Course.objects.create(
+                title=f"Intro to {subject}", description="", teacher=self.teacher
+            )
+        Enrollment.objects.create(course=self.algorithms, student=self.student)
+        token = str(RefreshToken.for_user(self.student).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def search(self, **params):
+        response = self.client.get(reverse("course-search"), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [course["title"] for course in response.data["results"]]
+
+    def test_title_matches_rank_first(self):
+        self.assertEqual(self.search(q="algebra"), ["Linear Algebra", "Algorithms"])
+        self.assertEqual(self.search(q="linear matrices"), ["Linear Algebra"])
+        self.assertEqual(self.search(q="quantum"), [])
+
+    def test_last_word_matches_as_prefix(self):
+        self.assertCountEqual(self.search(q="alg"), ["Algorithms", "Linear Algebra"])
+        self.assertEqual(self.search(q="creative wri"), ["Creative Writing"])
+        # Only the last word is a prefix, and only from three letters on
+        self.assertEqual(self.search(q="alg sorting"), [])
+        self.assertEqual(self.search(q="al"), [])
+
+    def test_filters_and_pages(self):
+        self.assertEqual(
+            self.search(q="alg", teacher=self.teacher.id), ["Linear Algebra"]
+        )
+        self.assertEqual(self.search(q="alg", enrolled="true"), ["Algorithms"])
+        self.assertEqual(self.search(q="alg", enrolled="false"), ["Linear Algebra"])
+
+        response = self.client.get(
+            reverse("course-search"), {"q": "algebra", "limit": 1}
+        )
+        self.assertEqual(response.data["next_offset"], 1)
+        self.assertFalse(response.data["results"][0]["is_enrolled"])
+        response = self.client.get(
+            reverse("course-search"), {"q": "algebra", "limit": 1, "offset": 1}
+        )
+        self.assertEqual(response.data["results"][0]["title"], "Algorithms")
+        self.assertTrue(response.data["results"][0]["is_enrolled"])
+        self.assertIsNone(response.data["next_offset"])
+
+    def test_index_follows_changes(self):
+        self.assertEqual(self.search(q="poems"), ["Creative Writing"])
+        with self.captureOnCommitCallbacks(execute=True):
+            Course.objects.create(
+                title="Poetry", description="Reading poems aloud.", teacher=self.teacher
+            )
+            self.writing.description = "Stories and essays."
+            self.writing.save()
+            self.algebra.delete()
+        self.assertEqual(self.search(q="poems"), ["Poetry"])
+        self.assertEqual(self.search(q="algebra"), ["Algorithms"])
+
+
+class FTSCourseSearchTest(CourseSearchTests, APITestCase):
+    backend = "fts"
+
+
+class PythonCourseSearchTest(CourseSearchTests, APITestCase):
+    backend = "python"
+
+    def test_changes_from_other_processes_rebuild_the_index(self):
+        self.search(q="algebra")
+        built = course_index.version
+        # Another process changed a course: its signal bumped the version
+        Course.objects.filter(pk=self.writing.pk).update(title="Algebraic Topology")
+        get_cache().incr(VERSION_KEY)
+        self.assertEqual(self.search(q="algebraic"), ["Algebraic Topology"])
+        self.assertNotEqual(course_index.version, built)
+
+
+class EnrollmentExportTest(APITestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username="teacher", role="teacher")
+        other_teacher = User.objects.create_user(username="other", role="teacher")
+        self.course = Course.objects.create(
+            title="Math", description="", teacher=self.teacher
+        )
+        self.other_course = Course.objects.create(
+            title="Art", description="", teacher=other_teacher
+        )
+        self.students = [
+            User.objects.create_user(
+                username=name, email=f"s{i}@example.com", role="student"
+            )
+            for i, name in enumerate(["ann", "=HYPERLINK(1)", "bob"])
+        ]
+        for student in self.students[:2]:
+            Enrollment.objects.create(course=self.course, student=student)
+        Enrollment.objects.create(course=self.other_course, student=self.students[2])
+        token = str(RefreshToken.for_user(self.teacher).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.url = reverse("enrollment-export")
+
+    def download(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_csv_of_the_teachers_rosters(self):
+        with self.assertNumQueries(2):  # the user, then one chunked read
+            lines = self.download().splitlines()
+        self.assertEqual(lines[0].split(",")[:3], ["id", "course_id", "course_title"])
+        self.assertEqual(len(lines), 3)
+        self.assertIn(",ann,s0@example.com,", lines[1])
+        # Cells spreadsheets would run as formulas are escaped
+        self.assertIn(",'=HYPERLINK(1),", lines[2])
+
+    def test_ndjson(self):
+        lines = self.download(**{"as": "ndjson", "course": self.course.id})
+        records = [json.loads(line) for line in lines.splitlines()]
+        self.assertEqual(
+            [r["student_username"] for r in records], ["ann", "=HYPERLINK(1)"]
+        )
+        self.assertEqual(records[0]["course_title"], "Math")
+        self.assertEqual(
+            self.client.get(self.url, {"as": "xml"}).status_code,
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+
+class EnrollmentExportAsgiTest(TransactionTestCase):
+    # ASGI runs the view on its own thread, which must see committed rows
+
+    def setUp(self):
+        self.teacher = User.objects.create_user(username="teacher", role="teacher")
+        course = Course.objects.create(
+            title="Math", description="", teacher=self.teacher
+        )
+        for i in range(3):
+            student = User.objects.create_user(username=f"s{i}", role="student")
+            Enrollment.objects.create(course=course, student=student)
+        self.token = str(RefreshToken.for_user(self.teacher).access_token)
+
+    @mock.patch("courses.exports.BLOCK_BYTES", 1)
+    def test_streams_block_by_block(self):
+        events = []
+        in_blocks = exports.in_blocks
+
+        def blocks(lines):
+            for block in in_blocks(lines):
+                events.append("block")
+                yield block
+
+        with mock.patch("courses.exports.in_blocks", blocks):
+            start, body = asgi_get(
+                reverse("enrollment-export"), self.token, events=events
+            )
+        self.assertEqual(start["status"], status.HTTP_200_OK)
+        # Blocks go out as they are made, not after the whole export is read
+        self.assertEqual(events.count("block"), 4)
+        self.assertLess(events.index("sent"), events.index("block", 2))
+        lines = b"".join(m.get("body", b"") for m in body).decode().splitlines()
+        self.assertEqual(len(lines), 4)
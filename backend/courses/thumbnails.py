@@ -0,0 +1,60 @@
+"""
+Preview rendering for course materials.
+
+This module only depends on Pillow so it can be imported by the preview
+worker processes without setting up Django.
+"""
+
+import os
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Derived images, by name: longest side in pixels
+SIZES = {"thumbnail": 320, "preview": 1280}
+
+# Larger images aren't previewed. Checked per image rather than by setting
+# Image.MAX_IMAGE_PIXELS, which would change Pillow for the whole process.
+MAX_PIXELS = 100_000_000
+
+
+def derived_path(path, size):
+    """Where the `size` rendition of `path` is stored: right next to it."""
+    return f"{path}.{size}.jpg"
+
+
+def render_previews(path):
+    """
+    Render every size in SIZES for the image at `path` and return
+    {size: path}, or None if Pillow can't read the file. Multi-page files
+    (TIFF, GIF, ...) are previewed by their first page.
+
+    Sizes that were already rendered are left alone and each file is
+    written under a temporary name and then renamed, so running this again
+    after a crash or for a duplicate upload is safe.
+    """
+    targets = {size: derived_path(path, size) for size in SIZES}
+    missing = {
+        size: target for size, target in targets.items() if not os.path.exists(target)
+    }
+    if not missing:
+        return targets
+
+    try:
+        with Image.open(path) as image:
+            # Only the header has been read so far
+            width, height = image.size
+            if width * height > MAX_PIXELS:
+                return None
+            image.seek(0)
+            image = ImageOps.exif_transpose(image)
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            for size, target in missing.items():
+                rendition = image.copy()
+                rendition.thumbnail((SIZES[size], SIZES[size]))
+                partial = f"{target}.{os.getpid()}.tmp"
+                rendition.save(partial, "JPEG", quality=85, optimize=True)
+                os.replace(partial, target)
+    except (UnidentifiedImageError, Image.DecompressionBombError):
+        return None
+    return targets
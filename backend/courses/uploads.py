@@ -0,0 +1,273 @@
+"""
+Resumable, content-addressed storage for course materials.
+
+An upload session collects chunks in order into a part file under
+MATERIAL_UPLOAD_TEMP_DIR, feeding each chunk into a SHA-256 hasher as it
+arrives. The hasher is kept in memory between requests; a process that
+doesn't have it (after a restart, or on another worker) rebuilds it from
+the part file. When the last byte arrives the digest names the blob:
+identical content is stored once and shared, with `MaterialBlob.ref_count`
+tracking how many materials point at it. Uploads left unfinished are
+discarded by `manage.py expire_uploads`.
+"""
+
+import fcntl
+import hashlib
+import os
+import shutil
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CourseMaterial, MaterialBlob, UploadSession
+from .previews import delete_previews
+
+READ_SIZE = 1 << 20
+
+
+class OffsetMismatch(Exception):
+    """The chunk doesn't start where the upload left off."""
+
+    def __init__(self, offset):
+        super().__init__(f"Expected offset {offset}")
+        self.offset = offset
+
+
+def upload_dir():
+    return Path(
+        getattr(
+            settings,
+            "MATERIAL_UPLOAD_TEMP_DIR",
+            Path(settings.MEDIA_ROOT) / "material_uploads",
+        )
+    )
+
+
+def part_path(session_id):
+    return upload_dir() / f"{session_id}.part"
+
+
+def hash_file(f, limit=None):
+    """SHA-256 hasher over the first `limit` bytes (all if None) of `f`."""
+    hasher = hashlib.sha256()
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = READ_SIZE if remaining is None else min(READ_SIZE, remaining)
+        data = f.read(size)
+        if not data:
+            break
+        hasher.update(data)
+        if remaining is not None:
+            remaining -= len(data)
+    return hasher
+
+
+class Hashers:
+    """In-process SHA-256 state of the sessions this process has seen."""
+
+    def __init__(self):
+        self._hashers = {}
+        self._lock = threading.Lock()
+
+    def get(self, session, f):
+        """Hasher covering the first `session.offset` bytes of the part file."""
+        with self._lock:
+            entry = self._hashers.pop(session.id, None)
+        if entry is not None and entry[0] == session.offset:
+            return entry[1]
+        f.seek(0)
+        hasher = hash_file(f, session.offset)
+        f.seek(session.offset)
+        return hasher
+
+    def put(self, session, offset, hasher):
+        with self._lock:
+            self._hashers[session.id] = (offset, hasher)
+
+    def discard(self, session_id):
+        with self._lock:
+            self._hashers.pop(session_id, None)
+
+
+hashers = Hashers()
+
+
+def append_chunk(session, offset, data):
+    """
+    Append `data` at `offset` and return the new offset. A file lock
+    serializes concurrent requests for the same session; a chunk that
+    doesn't continue the upload raises OffsetMismatch.
+    """
+    path = part_path(session.id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+b") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        session.refresh_from_db(fields=["offset"])
+        if offset != session.offset or offset + len(data) > session.size:
+            raise OffsetMismatch(session.offset)
+        # Drop bytes from a chunk that was written but never recorded
+        f.truncate(offset)
+        hasher = hashers.get(session, f)
+        f.seek(offset)
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+        hasher.update(data)
+
+        session.offset = offset + len(data)
+        session.save(update_fields=["offset", "updated_at"])
+        hashers.put(session, session.offset, hasher)
+        if session.offset == session.size:
+            # Kept for finish_upload
+            session.digest = hasher.hexdigest()
+    return session.offset
+
+
+class PartFile(File):
+    """A finished part file; FileSystemStorage moves it instead of copying."""
+
+    def temporary_file_path(self):
+        return self.name
+
+
+def acquire_blob(sha256, size, f):
+    """
+    The blob for `sha256` with one more reference, storing `f` as its
+    content if this is the first copy (then `blob.stored` is True, and the
+    file must be deleted if the transaction rolls back).
+    """
+    stored = False
+    while True:
+        blob = MaterialBlob.objects.filter(sha256=sha256).first()
+        if blob is None:
+            content = f if isinstance(f, File) else File(f)
+            name = default_storage.save(
+                f"material_blobs/{sha256[:2]}/{sha256}", content
+            )
+            blob, stored = MaterialBlob.objects.get_or_create(
+                sha256=sha256, defaults={"file": name, "size": size}
+            )
+            if not stored:
+                # Stored concurrently by another upload
+                default_storage.delete(name)
+        # A blob whose last reference is being released can disappear
+        # between the lookup and the increment; look it up again then
+        if MaterialBlob.objects.filter(pk=blob.pk).update(ref_count=F("ref_count") + 1):
+            blob.ref_count += 1
+            blob.stored = stored
+            return blob
+
+
+def create_material(course, blob, title):
+    return CourseMaterial.objects.create(
+        course=course, blob=blob, file=blob.file.name, title=title
+    )
+
+
+def store_material(course, upload, title=""):
+    """Store a single-request upload content-addressed and create its material."""
+    upload.seek(0)
+    sha256 = hash_file(upload).hexdigest()
+    upload.seek(0)
+    blob = None
+    try:
+        with transaction.atomic():
+            blob = acquire_blob(sha256, upload.size, upload)
+            return create_material(course, blob, title or upload.name)
+    except BaseException:
+        if blob is not None and blob.stored:
+            default_storage.delete(blob.file.name)
+        raise
+
+
+def finish_upload(session):
+    """
+    Turn a complete session into a CourseMaterial and clean it up. If that
+    fails, the session and its part file are left as they were, so it can
+    be finished again.
+    """
+    session_id, path = session.id, part_path(session.id)
+    sha256 = getattr(session, "digest", None)
+    if sha256 is None:
+        with open(path, "rb") as f:
+            sha256 = hash_file(f).hexdigest()
+
+    # Storage moves a second link to the part file, so the part file itself
+    # is only removed once the material is committed
+    link = path.with_suffix(".finishing")
+    link.unlink(missing_ok=True)
+    try:
+        os.link(path, link)
+    except OSError:
+        shutil.copyfile(path, link)
+    blob = None
+    try:
+        with open(link, "rb") as f, transaction.atomic():
+            blob = acquire_blob(sha256, session.size, PartFile(f, name=str(link)))
+            material = create_material(
+                session.course, blob, session.title or session.filename
+            )
+            session.delete()
+    except BaseException:
+        if blob is not None and blob.stored:
+            default_storage.delete(blob.file.name)
+        raise
+    finally:
+        link.unlink(missing_ok=True)
+    discard_upload(session_id)
+    return material
+
+
+def discard_upload(session_id):
+    hashers.discard(session_id)
+    part_path(session_id).unlink(missing_ok=True)
+
+
+def expire_uploads(max_age):
+    """
+    Discard the sessions idle for longer than `max_age` (a timedelta), and
+    part files that old with no session left (e.g. its course was deleted).
+    Returns (sessions, files) removed.
+    """
+    cutoff = timezone.now() - max_age
+    expired = list(
+        UploadSession.objects.filter(updated_at__lt=cutoff).values_list("id", flat=True)
+    )
+    for session_id in expired:
+        UploadSession.objects.filter(pk=session_id, updated_at__lt=cutoff).delete()
+        discard_upload(session_id)
+
+    files = 0
+    directory = upload_dir()
+    if directory.is_dir():
+        live = {str(pk) for pk in UploadSession.objects.values_list("id", flat=True)}
+        for path in directory.iterdir():
+            if path.stem in live or path.stat().st_mtime >= cutoff.timestamp():
+                continue
+            path.unlink(missing_ok=True)
+            files += 1
+    return len(expired), files
+
+
+def release_blob(blob_id):
+    """Drop a reference; the last one deletes the blob and its file."""
+    MaterialBlob.objects.filter(pk=blob_id, ref_count__gt=0).update(
+        ref_count=F("ref_count") - 1
+    )
+    blob = MaterialBlob.objects.filter(pk=blob_id, ref_count=0).first()
+    if (
+        blob is not None
+        and MaterialBlob.objects.filter(pk=blob.pk, ref_count=0).delete()[0]
+    ):
+        transaction.on_commit(lambda: delete_blob_files(blob.file.name))
+
+
+def delete_blob_files(name):
+    default_storage.delete(name)
+    delete_previews(name)
@@ -1,9 +1,21 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import CourseViewSet, EnrollmentViewSet, CourseMaterialViewSet
+from .views import (
+    CourseViewSet,
+    EnrollmentViewSet,
+    CourseMaterialViewSet,
+    MaterialUploadViewSet,
+    cache_stats,
+    search,
+)
 
 router = DefaultRouter()
 router.register(r"courses", CourseViewSet, basename="course")
 router.register(r"enrollments", EnrollmentViewSet, basename="enrollment")
 router.register(r"materials", CourseMaterialViewSet, basename="material")
+router.register(r"uploads", MaterialUploadViewSet, basename="upload")
 
-urlpatterns = router.urls
+urlpatterns = [
+    path("cache-stats/", cache_stats, name="course-cache-stats"),
+    path("search/", search, name="course-search"),
+] + router.urls
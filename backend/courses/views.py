@@ -1,31 +1,123 @@
-from rest_framework import viewsets, generics, permissions
-from rest_framework.decorators import action
-from rest_framework.response import Response
-from rest_framework.exceptions import PermissionDenied
+import csv
 
+from django.db.models import Count, Exists, F, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
+from rest_framework import viewsets, generics, mixins, permissions, status
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.exceptions import (
+    NotAuthenticated,
+    NotFound,
+    PermissionDenied,
+    ValidationError,
+)
 
-from .models import Course, Enrollment, CourseMaterial
+from feedback.models import Feedback
+from . import seats
+from .cache import CATALOG, CachedResponseMixin, response_cache
+from .downloads import can_download, serve_material, user_from_token
+from .exports import CHUNK_SIZE, export_format, stream_export
+from .models import Course, Enrollment, CourseMaterial, UploadSession, WaitlistEntry
+from .pagination import CoursePagination, wants_summary
+from .parsers import ChunkParser, max_chunk_size
+from .roster import bulk_enroll, read_csv
+from .search import search_courses
 from .serializers import (
+    BulkEnrollSerializer,
     CourseSerializer,
+    CourseSummarySerializer,
     EnrollmentSerializer,
     CourseMaterialSerializer,
+    UploadSessionSerializer,
+)
+from .uploads import (
+    OffsetMismatch,
+    append_chunk,
+    discard_upload,
+    finish_upload,
+    store_material,
 )
 
 
-class CourseViewSet(viewsets.ModelViewSet):
+def course_queryset():
+    """Courses with everything CourseSerializer renders loaded up front."""
+    return Course.objects.select_related("teacher", "rating").prefetch_related(
+        "materials",
+        Prefetch("enrollments", queryset=enrollment_queryset()),
+        Prefetch("feedbacks", queryset=Feedback.objects.select_related("student")),
+    )
+
+
+def per_course(queryset, aggregate):
+    """Correlated subquery computing `aggregate` over a course's rows."""
+    return Subquery(
+        queryset.filter(course=OuterRef("pk"))
+        .order_by()
+        .values("course")
+        .annotate(value=aggregate)
+        .values("value")
+    )
+
+
+def course_summary_queryset(user):
+    """
+    Courses annotated with the catalog counts. Each aggregate is its own
+    subquery so the joins don't multiply into each other.
+    """
+    return Course.objects.select_related("teacher").annotate(
+        material_count=Coalesce(per_course(CourseMaterial.objects, Count("pk")), 0),
+        enrollment_count=Coalesce(per_course(Enrollment.objects, Count("pk")), 0),
+        # Maintained by feedback.ratings, so no feedback rows are read
+        average_rating=F("rating__average"),
+        rating_count=Coalesce(F("rating__count"), 0),
+        is_enrolled=Exists(
+            Enrollment.objects.filter(course=OuterRef("pk"), student=user)
+        ),
+    )
+
+
+def enrollment_queryset():
+    """Enrollments with the student and course EnrollmentSerializer renders."""
+    return Enrollment.objects.select_related("student", "course")
+
+
+class CourseViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     serializer_class = CourseSerializer
+    pagination_class = CoursePagination
+
+    def cache_scopes(self):
+        if self.action == "retrieve":
+            return [self.kwargs["pk"]]
+        return [CATALOG]
+
+    def is_summary(self):
+        # ?view=summary returns lightweight catalog cards for the list
+        return self.action == "list" and wants_summary(self.request)
+
+    def get_serializer_class(self):
+        if self.is_summary():
+            return CourseSummarySerializer
+        return CourseSerializer
 
     def get_queryset(self):
         user = self.request.user
+        if self.is_summary():
+            courses = course_summary_queryset(user)
+        elif self.action in ("enroll", "waitlist"):
+            courses = Course.objects.all()
+        else:
+            courses = course_queryset()
+        courses = courses.order_by("id")
         if user.role == "teacher":
             # teacher sees only their own courses
-            return Course.objects.filter(teacher=user)
+            return courses.filter(teacher=user)
         elif user.role == "student":
             # students see all courses (or we can filter by enrollment later)
-            return Course.objects.all()
+            return courses
         else:
             # admin/staff can see everything
-            return Course.objects.all()
+            return courses
 
     def perform_create(self, serializer):
         # Only teachers can create courses
@@ -33,6 +125,39 @@ class CourseViewSet(viewsets.ModelViewSet):
             raise PermissionDenied("Only teachers can create courses.")
         serializer.save(teacher=self.request.user)
 
+    def perform_update(self, serializer):
+        course = serializer.save()
+        # A raised (or removed) capacity frees seats for the waitlist
+        seats.promote_waitlisted(course.id)
+
+    @action(detail=True, methods=["delete"])
+    def waitlist(self, request, pk=None):
+        """Leave the course waitlist."""
+        course = self.get_object()
+        WaitlistEntry.objects.filter(course=course, student=request.user).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=["post"])
+    def enroll(self, request, pk=None):
+        """
+        Enroll many students at once (course teacher or staff only).
+        Body: {"students": [12, "ana@example.com", ...]} or a multipart
+        `file` CSV with one id or email per row.
+        """
+        course = self.get_object()
+        if course.teacher_id != request.user.id and not request.user.is_staff:
+            raise PermissionDenied("Only the course teacher can enroll students.")
+
+        serializer = BulkEnrollSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        values = list(serializer.validated_data.get("students", []))
+        if "file" in serializer.validated_data:
+            try:
+                values += read_csv(serializer.validated_data["file"])
+            except (UnicodeDecodeError, csv.Error):
+                raise ValidationError({"file": "Expected a UTF-8 CSV file."})
+        return Response(bulk_enroll(course, values))
+
 
 class EnrollmentViewSet(viewsets.ModelViewSet):
     serializer_class = EnrollmentSerializer
@@ -41,21 +166,68 @@ class EnrollmentViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user = self.request.user
         if user.role == "student":
-            return Enrollment.objects.filter(student=user)
+            return enrollment_queryset().filter(student=user)
         elif user.role == "teacher":
             # teachers can see enrollments in their courses
-            return Enrollment.objects.filter(course__teacher=user)
+            return enrollment_queryset().filter(course__teacher=user)
         else:
             # admin/staff see everything
-            return Enrollment.objects.all()
+            return enrollment_queryset()
 
-    def perform_create(self, serializer):
-        # Prevent duplicate enrollments
-        student = self.request.user
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
         course = serializer.validated_data["course"]
-        if Enrollment.objects.filter(student=student, course=course).exists():
-            raise PermissionDenied("You are already enrolled in this course.")
-        serializer.save(student=student)
+        result, obj = seats.enroll(course, request.user)
+        if result == seats.ALREADY_ENROLLED:
+            raise ValidationError("You are already enrolled in this course.")
+        if result == seats.WAITLISTED:
+            return Response(
+                {
+                    "course": course.id,
+                    "waitlisted": True,
+                    "position": seats.waitlist_position(obj),
+                },
+                status=status.HTTP_202_ACCEPTED,
+            )
+        serializer.instance = obj
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """
+        Stream the enrollments the user can see (a teacher's rosters) as CSV
+        or NDJSON.
+        Usage: /api/courses/enrollments/export/?as=ndjson&course=3
+        """
+        fmt = export_format(request)
+        enrollments = self.get_queryset()
+        if request.query_params.get("course"):
+            try:
+                enrollments = enrollments.filter(
+                    course_id=int(request.query_params["course"])
+                )
+            except ValueError:
+                raise ValidationError({"course": "Must be a course id."})
+        columns = [
+            "id",
+            "course_id",
+            "course_title",
+            "student_id",
+            "student_username",
+            "student_email",
+            "date_enrolled",
+        ]
+        rows = enrollments.order_by("pk").values_list(
+            "id",
+            "course_id",
+            "course__title",
+            "student_id",
+            "student__username",
+            "student__email",
+            "date_enrolled",
+        )
+        return stream_export(rows.iterator(CHUNK_SIZE), columns, fmt, "enrollments")
 
     #  Students see only their enrollments
     @action(detail=False, methods=["get"], url_path="my-enrollments")
@@ -63,17 +235,23 @@ class EnrollmentViewSet(viewsets.ModelViewSet):
         """Return only the logged-in student's enrollments"""
         user = request.user
         if user.role == "student":
-            enrollments = Enrollment.objects.filter(student=user)
+            enrollments = enrollment_queryset().filter(student=user)
             serializer = self.get_serializer(enrollments, many=True)
             return Response(serializer.data)
         return Response({"error": "Only students can access this."}, status=403)
 
 
-class CourseMaterialViewSet(viewsets.ModelViewSet):
+class CourseMaterialViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = CourseMaterial.objects.all()
     serializer_class = CourseMaterialSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def cache_scopes(self):
+        course_id = self.request.query_params.get("course")
+        if self.action == "list" and course_id:
+            return [course_id]
+        return [CATALOG]
+
     def get_queryset(self):
         """
         Optionally filter materials by course using query param ?course=<id>
@@ -91,7 +269,7 @@ class CourseMaterialViewSet(viewsets.ModelViewSet):
         # Get course ID from request data
         course_id = self.request.data.get("course")
         if not course_id:
-            raise serializers.ValidationError({"course": "This field is required."})
+            raise ValidationError({"course": "This field is required."})
 
         # Verify teacher owns the course
         try:
@@ -101,4 +279,164 @@ class CourseMaterialViewSet(viewsets.ModelViewSet):
                 "You can only upload materials for your own courses."
             )
 
-        serializer.save(course=course)
+        upload = self.request.FILES.get("file")
+        if upload is None:
+            raise ValidationError({"file": "This field is required."})
+        # Stored content-addressed, like chunked uploads
+        serializer.instance = store_material(
+            course, upload, self.request.data.get("title", "")
+        )
+
+    def get_permissions(self):
+        if self.action == "download":
+            # Links from <a>/<video> tags authenticate with a signed token
+            return [permissions.AllowAny()]
+        return super().get_permissions()
+
+    @action(detail=True, methods=["get"])
+    def download(self, request, pk=None):
+        """
+        GET /api/courses/materials/<id>/download/[?size=thumbnail|preview]
+        Streams the file (or a rendered preview) to the course teacher and
+        enrolled students, with Range and conditional request support.
+        """
+        material = generics.get_object_or_404(
+            CourseMaterial.objects.select_related("course", "blob"), pk=pk
+        )
+        user = request.user
+        token = request.query_params.get("token")
+        if not user.is_authenticated and token:
+            user = user_from_token(token, material)
+        if user is None or not user.is_authenticated:
+            raise NotAuthenticated()
+        if not can_download(user, material):
+            raise PermissionDenied("You are not enrolled in this course.")
+        variant = request.query_params.get("size")
+        if variant and variant not in material.previews:
+            raise NotFound("No such preview.")
+        return serve_material(request, material, variant)
+
+
+class MaterialUploadViewSet(
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.DestroyModelMixin,
+    viewsets.GenericViewSet,
+):
+    """
+    Resumable material uploads:
+      POST   /api/courses/uploads/       {course, filename, size, title}
+      PATCH  /api/courses/uploads/<id>/  chunk bytes with an Upload-Offset header
+      GET    /api/courses/uploads/<id>/  current offset, to resume
+      DELETE /api/courses/uploads/<id>/  abandon the upload
+    The PATCH carrying the last byte creates and returns the material.
+    """
+
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [ChunkParser, *api_settings.DEFAULT_PARSER_CLASSES]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(owner=self.request.user).select_related(
+            "course"
+        )
+
+    def perform_create(self, serializer):
+        if self.request.user.role != "teacher":
+            raise PermissionDenied("Only teachers can upload materials.")
+        serializer.save(owner=self.request.user)
+
+    def partial_update(self, request, pk=None):
+        session = self.get_object()
+        try:
+            offset = int(request.headers["Upload-Offset"])
+        except (KeyError, ValueError):
+            raise ValidationError({"Upload-Offset": "An integer header is required."})
+        if not isinstance(request.data, bytes):
+            raise ValidationError(
+                {"detail": f"Send chunks as {ChunkParser.media_type}."}
+            )
+        if len(request.data) > max_chunk_size():
+            return Response(
+                {"detail": f"Chunks are limited to {max_chunk_size()} bytes."},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+
+        try:
+            new_offset = append_chunk(session, offset, request.data)
+        except OffsetMismatch as exc:
+            return Response(
+                {"offset": exc.offset},
+                status=status.HTTP_409_CONFLICT,
+                headers={"Upload-Offset": str(exc.offset)},
+            )
+        if new_offset < session.size:
+            return Response(
+                {"id": session.id, "offset": new_offset},
+                headers={"Upload-Offset": str(new_offset)},
+            )
+
+        material = finish_upload(session)
+        serializer = CourseMaterialSerializer(
+            material, context=self.get_serializer_context()
+        )
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def perform_destroy(self, instance):
+        session_id = instance.id
+        instance.delete()
+        discard_upload(session_id)
+
+
+@api_view(["GET"])
+@permission_classes([permissions.IsAdminUser])
+def cache_stats(request):
+    """
+    Hit/miss counters of this process's course response cache (staff only).
+    Usage: /api/courses/cache-stats/
+    """
+    return Response(response_cache.stats())
+
+
+@api_view(["GET"])
+@permission_classes([permissions.IsAuthenticated])
+def search(request):
+    """
+    Ranked search over course titles and descriptions; the last word also
+    matches as a prefix, for type-ahead.
+    Usage: /api/courses/search/?q=alg&teacher=<id>&enrolled=true&limit=20&offset=0
+    """
+    query = request.GET.get("q", "").strip()
+    # Require at least 2 characters
+    if len(query) < 2:
+        return Response({"results": [], "next_offset": None})
+
+    try:
+        teacher = request.GET.get("teacher")
+        teacher = int(teacher) if teacher else None
+        limit = min(max(int(request.GET.get("limit", 20)), 1), 100)
+        offset = max(int(request.GET.get("offset", 0)), 0)
+    except ValueError:
+        raise ValidationError("teacher, limit and offset must be integers.")
+    enrolled = {"true": True, "false": False}.get(request.GET.get("enrolled"))
+
+    ids = search_courses(
+        query,
+        limit + 1,
+        offset,
+        teacher_id=teacher,
+        enrolled=enrolled,
+        user=request.user,
+    )
+    courses = course_summary_queryset(request.user).in_bulk(ids[:limit])
+    serializer = CourseSummarySerializer(
+        [courses[pk] for pk in ids[:limit] if pk in courses],
+        many=True,
+        context={"request": request},
+    )
+    return Response(
+        {
+            "results": serializer.data,
+            "next_offset": offset + limit if len(ids) > limit else None,
+        }
+    )
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class FeedbackConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'feedback'
+
+    def ready(self):
+        # Import signals here so they are registered
+        import feedback.signals
@@ -0,0 +1,149 @@
+import random
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from chat.bench import summarize_ms, write_report
+from courses.models import Course
+from feedback.models import (
+    CourseFeedbackRollup,
+    Feedback,
+    FeedbackRollup,
+    TeacherFeedbackRollup,
+)
+from feedback.rollups import rebuild, summarize
+
+User = get_user_model()
+
+UNTIL = date(2025, 12, 31)
+SINCE = UNTIL - timedelta(days=365)
+
+
+def create_feedback(rng, courses, students, per_course):
+    """A year of feedback, inserted directly so the rollups must be backfilled."""
+    teacher = User.objects.create(username="bench_teacher", role="teacher")
+    course_ids = [
+        c.pk
+        for c in Course.objects.bulk_create(
+            [
+                Course(title=f"Course {i}", description="", teacher=teacher)
+                for i in range(courses)
+            ]
+        )
+    ]
+    student_ids = [
+        u.pk
+        for u in User.objects.bulk_create(
+            [
+                User(username=f"bench_student_{i}", role="student")
+                for i in range(students)
+            ]
+        )
+    ]
+    start = timezone.make_aware(datetime.combine(SINCE, dt_time()))
+    rows = []
+    for course_id in course_ids:
+        for student_id in rng.sample(student_ids, per_course):
+            created_at = start + timedelta(seconds=rng.randrange(366 * 86400))
+            rating = rng.choices(range(1, 6), weights=[1, 1, 2, 4, 4])[0]
+            rows.append((student_id, course_id, rating, "", created_at))
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {Feedback._meta.db_table} "
+            "(student_id, course_id, rating, comment, created_at) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            rows,
+        )
+    return teacher, course_ids
+
+
+def run(courses, students, per_course, queries, seed):
+    rng = random.Random(seed)
+    teacher, course_ids = create_feedback(rng, courses, students, per_course)
+
+    start = time.perf_counter()
+    rebuild()
+    report = {
+        "backfill": {
+            "feedback": Feedback.objects.count(),
+            "course_rollups": CourseFeedbackRollup.objects.count(),
+            "teacher_rollups": TeacherFeedbackRollup.objects.count(),
+            "seconds": round(time.perf_counter() - start, 2),
+        }
+    }
+
+    for period in (FeedbackRollup.DAY, FeedbackRollup.WEEK):
+        for scope in ("teacher", "course"):
+            durations = []
+            for _ in range(queries):
+                course_id = rng.choice(course_ids) if scope == "course" else None
+                started = time.perf_counter()
+                summarize(period, SINCE, UNTIL, teacher.pk, course_id)
+                durations.append(time.perf_counter() - started)
+            report[f"{period}_{scope}"] = {
+                "queries": queries,
+                **summarize_ms(durations),
+            }
+    return report
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark feedback analytics: insert a year of feedback for one "
+        "teacher's courses, backfill the rollups and time daily and weekly "
+        "summaries over the whole year. Runs against a throwaway test "
+        "database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--courses", type=int, default=50)
+        parser.add_argument("--students", type=int, default=5000)
+        parser.add_argument(
+            "--per-course", type=int, default=2000, help="Ratings per course."
+        )
+        parser.add_argument("--queries", type=int, default=100)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--target-p99-ms",
+            type=float,
+            default=50,
+            help="Fail if a summary's p99 latency is above this.",
+        )
+        parser.add_argument("--json", action="store_true")
+
+    def handle(self, *args, **options):
+        if options["per_course"] > options["students"]:
+            raise CommandError("--per-course can't exceed --students.")
+
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            report = run(
+                options["courses"],
+                options["students"],
+                options["per_course"],
+                options["queries"],
+                options["seed"],
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        target = options["target_p99_ms"]
+        report = {
+            "config": {
+                key: options[key]
+                for key in ("courses", "students", "per_course", "target_p99_ms")
+            },
+            **report,
+        }
+        missed = [
+            name
+            for name, section in report.items()
+            if "p99_ms" in section and section["p99_ms"] > target
+        ]
+        write_report(self.stdout, report, options["json"])
+        if missed:
+            raise CommandError(f"p99 above {target} ms for: {', '.join(missed)}")
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from feedback.ratings import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute course rating aggregates from the feedback rows and fix "
+        "the ones that drifted, in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report the courses whose aggregate is wrong.",
+        )
+
+    def handle(self, *args, **options):
+        fixed = rebuild(options["batch_size"], dry_run=options["dry_run"])
+        if not fixed:
+            self.stdout.write(self.style.SUCCESS("All course ratings are correct."))
+            return
+        verb = "Would fix" if options["dry_run"] else "Fixed"
+        ids = ", ".join(str(pk) for pk in fixed[:20])
+        more = f" and {len(fixed) - 20} more" if len(fixed) > 20 else ""
+        self.stdout.write(f"{verb} {len(fixed)} course ratings: {ids}{more}")
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from feedback.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount the daily and weekly feedback rollups of every course and "
+        "teacher, with one GROUP BY per batch, and replace the ones that "
+        "drifted. Also the way to backfill them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report the courses and teachers whose rollups are wrong.",
+        )
+
+    def handle(self, *args, **options):
+        fixed = rebuild(options["batch_size"], dry_run=options["dry_run"])
+        if not any(fixed.values()):
+            self.stdout.write(self.style.SUCCESS("All feedback rollups are correct."))
+            return
+        verb = "Would fix" if options["dry_run"] else "Fixed"
+        for name, ids in fixed.items():
+            if not ids:
+                continue
+            listed = ", ".join(str(pk) for pk in ids[:20])
+            more = f" and {len(ids) - 20} more" if len(ids) > 20 else ""
+            self.stdout.write(
+                f"{verb} the rollups of {len(ids)} {name}: {listed}{more}"
+            )
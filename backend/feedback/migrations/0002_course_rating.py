@@ -0,0 +1,82 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:24
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def count_ratings(apps, schema_editor):
+    # Same totals as `manage.py rebuild_course_ratings`
+    Feedback = apps.get_model("feedback", "Feedback")
+    CourseRating = apps.get_model("feedback", "CourseRating")
+    rows = Feedback.objects.values("course").annotate(
+        count=Count("pk"),
+        total=Sum("rating"),
+        **{
+            f"stars_{stars}": Count("pk", filter=Q(rating=stars))
+            for stars in range(1, 6)
+        },
+    )
+    CourseRating.objects.bulk_create(
+        CourseRating(
+            course_id=row.pop("course"),
+            average=row["total"] / row["count"],
+            score=(row["total"] + 5 * 3.0) / (row["count"] + 5),
+            **row,
+        )
+        for row in rows
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0005_course_fts"),
+        ("feedback", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="feedback",
+            name="rating",
+            field=models.IntegerField(
+                validators=[
+                    django.core.validators.MinValueValidator(1),
+                    django.core.validators.MaxValueValidator(5),
+                ]
+            ),
+        ),
+        migrations.CreateModel(
+            name="CourseRating",
+            fields=[
+                (
+                    "course",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="rating",
+                        serialize=False,
+                        to="courses.course",
+                    ),
+                ),
+                ("count", models.IntegerField(default=0)),
+                ("total", models.IntegerField(default=0)),
+                ("stars_1", models.IntegerField(default=0)),
+                ("stars_2", models.IntegerField(default=0)),
+                ("stars_3", models.IntegerField(default=0)),
+                ("stars_4", models.IntegerField(default=0)),
+                ("stars_5", models.IntegerField(default=0)),
+                ("average", models.FloatField(null=True)),
+                ("score", models.FloatField(default=3.0)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["-score", "-count"], name="feedback_rating_score"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(count_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,103 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fan_out_existing(apps, schema_editor):
+    # Put the existing updates on the timelines of the students' teachers
+    Enrollment = apps.get_model("courses", "Enrollment")
+    StatusUpdate = apps.get_model("feedback", "StatusUpdate")
+    TimelineEntry = apps.get_model("feedback", "TimelineEntry")
+    teachers = {}
+    for teacher_id, student_id in Enrollment.objects.values_list(
+        "course__teacher_id", "student_id"
+    ).distinct():
+        teachers.setdefault(student_id, set()).add(teacher_id)
+
+    updates = StatusUpdate.objects.filter(student_id__in=teachers).values_list(
+        "id", "student_id", "created_at"
+    )
+    batch = []
+    for update_id, student_id, created_at in updates.iterator():
+        batch.extend(
+            TimelineEntry(
+                teacher_id=teacher_id, update_id=update_id, created_at=created_at
+            )
+            for teacher_id in teachers[student_id]
+        )
+        if len(batch) >= 1000:
+            TimelineEntry.objects.bulk_create(batch)
+            batch = []
+    TimelineEntry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0006_course_timeline_pull"),
+        ("feedback", "0002_course_rating"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TimelineEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="statusupdate",
+            index=models.Index(
+                fields=["student", "-created_at", "-id"],
+                name="feedback_status_student_page",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="statusupdate",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="feedback_status_page"
+            ),
+        ),
+        migrations.AddField(
+            model_name="timelineentry",
+            name="teacher",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="timeline_entries",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddField(
+            model_name="timelineentry",
+            name="update",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="timeline_entries",
+                to="feedback.statusupdate",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="timelineentry",
+            index=models.Index(
+                fields=["teacher", "-created_at", "-update"],
+                name="feedback_timeline_page",
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="timelineentry",
+            unique_together={("teacher", "update")},
+        ),
+        migrations.RunPython(fan_out_existing, migrations.RunPython.noop),
+    ]
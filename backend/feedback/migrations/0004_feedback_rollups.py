@@ -0,0 +1,138 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate, TruncWeek
+
+COUNTERS = ["count", "total", *(f"stars_{stars}" for stars in range(1, 6))]
+
+
+def count_periods(apps, schema_editor):
+    # Same rows as `manage.py rebuild_feedback_rollups`
+    Feedback = apps.get_model("feedback", "Feedback")
+    CourseFeedbackRollup = apps.get_model("feedback", "CourseFeedbackRollup")
+    TeacherFeedbackRollup = apps.get_model("feedback", "TeacherFeedbackRollup")
+    periods = {
+        "day": TruncDate("created_at"),
+        "week": TruncWeek("created_at", output_field=models.DateField()),
+    }
+    for period, start in periods.items():
+        rows = (
+            Feedback.objects.values("course", start=start)
+            .annotate(
+                count=Count("pk"),
+                total=Sum("rating"),
+                **{
+                    f"stars_{stars}": Count("pk", filter=Q(rating=stars))
+                    for stars in range(1, 6)
+                },
+            )
+            .order_by()
+        )
+        CourseFeedbackRollup.objects.bulk_create(
+            CourseFeedbackRollup(course_id=row.pop("course"), period=period, **row)
+            for row in rows
+        )
+    rows = (
+        CourseFeedbackRollup.objects.values(
+            "period", "start", teacher_id=F("course__teacher")
+        )
+        .annotate(**{field: Sum(field) for field in COUNTERS})
+        .order_by()
+    )
+    TeacherFeedbackRollup.objects.bulk_create(
+        TeacherFeedbackRollup(**row) for row in rows
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0006_course_timeline_pull"),
+        ("feedback", "0003_status_timelines"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CourseFeedbackRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[("day", "Day"), ("week", "Week")], max_length=4
+                    ),
+                ),
+                ("start", models.DateField()),
+                ("count", models.IntegerField(default=0)),
+                ("total", models.IntegerField(default=0)),
+                ("stars_1", models.IntegerField(default=0)),
+                ("stars_2", models.IntegerField(default=0)),
+                ("stars_3", models.IntegerField(default=0)),
+                ("stars_4", models.IntegerField(default=0)),
+                ("stars_5", models.IntegerField(default=0)),
+                (
+                    "course",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="feedback_rollups",
+                        to="courses.course",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("course", "period", "start")},
+            },
+        ),
+        migrations.CreateModel(
+            name="TeacherFeedbackRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[("day", "Day"), ("week", "Week")], max_length=4
+                    ),
+                ),
+                ("start", models.DateField()),
+                ("count", models.IntegerField(default=0)),
+                ("total", models.IntegerField(default=0)),
+                ("stars_1", models.IntegerField(default=0)),
+                ("stars_2", models.IntegerField(default=0)),
+                ("stars_3", models.IntegerField(default=0)),
+                ("stars_4", models.IntegerField(default=0)),
+                ("stars_5", models.IntegerField(default=0)),
+                (
+                    "teacher",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="feedback_rollups",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("teacher", "period", "start")},
+            },
+        ),
+        migrations.RunPython(count_periods, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,5 @@
-from django.db import models
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import models, transaction
 from django.conf import settings
 from courses.models import Course
 
@@ -12,10 +13,42 @@ class StatusUpdate(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pages of one student's updates, and of all updates
+            models.Index(
+                fields=["student", "-created_at", "-id"],
+                name="feedback_status_student_page",
+            ),
+            models.Index(fields=["-created_at", "-id"], name="feedback_status_page"),
+        ]
+
     def __str__(self):
         return f"{self.student.username} - {self.content[:30]}"
 
 
+class TimelineEntry(models.Model):
+    """A status update on a teacher's timeline (see feedback.timelines)."""
+
+    teacher = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="timeline_entries"
+    )
+    update = models.ForeignKey(
+        StatusUpdate, on_delete=models.CASCADE, related_name="timeline_entries"
+    )
+    # Copied from the update, so pages are read from this table's index
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("teacher", "update")
+        indexes = [
+            models.Index(
+                fields=["teacher", "-created_at", "-update"],
+                name="feedback_timeline_page",
+            )
+        ]
+
+
 class Feedback(models.Model):
     student = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name="feedbacks"
@@ -23,7 +56,9 @@ class Feedback(models.Model):
     course = models.ForeignKey(
         Course, on_delete=models.CASCADE, related_name="feedbacks"
     )
-    rating = models.IntegerField()  # e.g., 1-5 stars
+    rating = models.IntegerField(
+        validators=[MinValueValidator(1), MaxValueValidator(5)]
+    )  # 1-5 stars
     comment = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -32,3 +67,95 @@ class Feedback(models.Model):
 
     def __str__(self):
         return f"{self.student.username} feedback on {self.course.title}"
+
+    def save(self, *args, **kwargs):
+        # Signals update the course's CourseRating in the same transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class CourseRating(models.Model):
+    """
+    Running rating totals of a course, updated with every Feedback change
+    (see feedback.ratings) so averages never need the feedback rows.
+    """
+
+    course = models.OneToOneField(
+        Course, on_delete=models.CASCADE, primary_key=True, related_name="rating"
+    )
+    count = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
+    # Histogram: how many ratings gave 1, 2, ... 5 stars
+    stars_1 = models.IntegerField(default=0)
+    stars_2 = models.IntegerField(default=0)
+    stars_3 = models.IntegerField(default=0)
+    stars_4 = models.IntegerField(default=0)
+    stars_5 = models.IntegerField(default=0)
+    average = models.FloatField(null=True)
+    # The average pulled towards a prior, so a single 5-star rating doesn't
+    # top the list; what top-rated courses are ordered by
+    score = models.FloatField(default=3.0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-score", "-count"], name="feedback_rating_score")
+        ]
+
+    def __str__(self):
+        return f"{self.course_id}: {self.average} ({self.count})"
+
+    @property
+    def histogram(self):
+        return {stars: getattr(self, f"stars_{stars}") for stars in range(1, 6)}
+
+
+class FeedbackRollup(models.Model):
+    """
+    Rating totals of one day or week, kept up to date with every Feedback
+    change (see feedback.rollups) for the analytics endpoint.
+    """
+
+    DAY = "day"
+    WEEK = "week"
+    PERIOD_CHOICES = [(DAY, "Day"), (WEEK, "Week")]
+
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    # First day of the period (weeks start on Monday), in TIME_ZONE
+    start = models.DateField()
+    count = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
+    stars_1 = models.IntegerField(default=0)
+    stars_2 = models.IntegerField(default=0)
+    stars_3 = models.IntegerField(default=0)
+    stars_4 = models.IntegerField(default=0)
+    stars_5 = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class CourseFeedbackRollup(FeedbackRollup):
+    course = models.ForeignKey(
+        Course, on_delete=models.CASCADE, related_name="feedback_rollups"
+    )
+
+    class Meta:
+        # Also the index analytics read: courses, period, dates
+        unique_together = ("course", "period", "start")
+
+    def __str__(self):
+        return f"course {self.course_id} {self.period} {self.start}: {self.count}"
+
+
+class TeacherFeedbackRollup(FeedbackRollup):
+    """All the courses of a teacher together, so trends read one row a period."""
+
+    teacher = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="feedback_rollups"
+    )
+
+    class Meta:
+        unique_together = ("teacher", "period", "start")
+
+    def __str__(self):
+        return f"teacher {self.teacher_id} {self.period} {self.start}: {self.count}"
@@ -0,0 +1,107 @@
+"""
+Per-course rating aggregates.
+
+Every Feedback create, update and delete adjusts the course's CourseRating
+row with a single UPDATE of F() expressions, inside the transaction that
+writes the feedback, so concurrent ratings can't overwrite each other and a
+rolled back feedback leaves no trace. Anything that bypasses the signals
+(bulk_create, raw SQL) can be repaired with `manage.py rebuild_course_ratings`.
+"""
+
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Q, Sum
+from django.db.models.functions import Cast, NullIf
+
+from courses.models import Course
+from .models import CourseRating, Feedback
+
+STARS = range(1, 6)
+# Top-rated scores start every course at PRIOR_WEIGHT ratings of PRIOR_MEAN
+PRIOR_MEAN = 3.0
+PRIOR_WEIGHT = 5
+COUNTERS = ["count", "total", *(f"stars_{stars}" for stars in STARS)]
+
+
+def derived(count, total):
+    """(average, score) for the given totals."""
+    average = total / count if count else None
+    return average, (total + PRIOR_WEIGHT * PRIOR_MEAN) / (count + PRIOR_WEIGHT)
+
+
+def adjust(course_id, rating, sign):
+    """Add (sign=1) or take away (sign=-1) one rating of `course_id`."""
+    count = F("count") + sign
+    total = Cast(F("total") + sign * rating, FloatField())
+    changes = {
+        "count": count,
+        "total": F("total") + sign * rating,
+        # Right-hand sides see the values from before the update
+        "average": total / NullIf(count, 0),
+        "score": (total + PRIOR_WEIGHT * PRIOR_MEAN) / (count + PRIOR_WEIGHT),
+    }
+    if rating in STARS:
+        changes[f"stars_{rating}"] = F(f"stars_{rating}") + sign
+
+    ratings = CourseRating.objects.filter(course_id=course_id)
+    if not ratings.update(**changes):
+        # First rating of the course
+        CourseRating.objects.get_or_create(course_id=course_id)
+        ratings.update(**changes)
+
+
+def add_rating(course_id, rating):
+    adjust(course_id, rating, 1)
+
+
+def remove_rating(course_id, rating):
+    adjust(course_id, rating, -1)
+
+
+def count_ratings(course_ids):
+    """Totals recomputed from the feedback rows, for courses with any."""
+    rows = (
+        Feedback.objects.filter(course_id__in=course_ids)
+        .values("course")
+        .annotate(
+            count=Count("pk"),
+            total=Sum("rating"),
+            **{
+                f"stars_{stars}": Count("pk", filter=Q(rating=stars)) for stars in STARS
+            },
+        )
+    )
+    return {row.pop("course"): row for row in rows}
+
+
+def rebuild(batch_size=1000, dry_run=False):
+    """
+    Compare every course's aggregate with its feedback rows and fix those
+    that drifted, `batch_size` courses per transaction. Returns the ids of
+    the courses that were (or, with dry_run, would be) fixed.
+    """
+    fixed = []
+    course_ids = list(Course.objects.order_by("pk").values_list("pk", flat=True))
+    for start in range(0, len(course_ids), batch_size):
+        batch = course_ids[start : start + batch_size]
+        with transaction.atomic():
+            expected = count_ratings(batch)
+            stored = {
+                row.pop("course"): row
+                for row in CourseRating.objects.select_for_update()
+                .filter(course_id__in=batch)
+                .values("course", *COUNTERS)
+            }
+            zero = dict.fromkeys(COUNTERS, 0)
+            for course_id in batch:
+                counters = expected.get(course_id, zero)
+                if stored.get(course_id, zero) == counters:
+                    continue
+                fixed.append(course_id)
+                if dry_run:
+                    continue
+                average, score = derived(counters["count"], counters["total"])
+                CourseRating.objects.update_or_create(
+                    course_id=course_id,
+                    defaults={**counters, "average": average, "score": score},
+                )
+    return fixed
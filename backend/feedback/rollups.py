@@ -0,0 +1,268 @@
+"""
+Daily and weekly feedback rollups per course and per teacher.
+
+Like the rating aggregates (feedback.ratings), every Feedback create, update
+and delete adjusts the rollup rows of its day and week, for the course and
+for its teacher, with F() updates inside the transaction that writes the
+feedback. A teacher's rows are recounted from their course rows when a
+course changes teacher or is deleted.
+
+Backfills don't replay the feedback one row at a time: `rebuild` counts
+every period of a batch of courses (then teachers) with one GROUP BY per
+period and replaces the rows that differ (`manage.py
+rebuild_feedback_rollups`).
+
+Analytics only read rollups: a year of a teacher's trend is at most 366
+daily or 53 weekly rows, however many courses and ratings they have.
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, DateField, F, Q, Sum
+from django.db.models.functions import TruncDate, TruncWeek
+from django.utils import timezone
+
+from courses.models import Course
+from .models import (
+    CourseFeedbackRollup,
+    Feedback,
+    FeedbackRollup,
+    TeacherFeedbackRollup,
+)
+from .ratings import STARS
+
+# Period -> expression of its first day, as the database computes it
+PERIODS = {
+    FeedbackRollup.DAY: lambda field: TruncDate(field),
+    FeedbackRollup.WEEK: lambda field: TruncWeek(field, output_field=DateField()),
+}
+COUNTERS = ["count", "total", *(f"stars_{stars}" for stars in STARS)]
+SUMS = {field: Sum(field) for field in COUNTERS}
+
+
+def first_day(period, day):
+    """First day of the `period` containing `day` (Monday for weeks)."""
+    if period == FeedbackRollup.WEEK:
+        day -= timedelta(days=day.weekday())
+    return day
+
+
+def period_start(period, created_at):
+    return first_day(period, timezone.localdate(created_at))
+
+
+def adjust(course_id, rating, created_at, sign):
+    """Add (sign=1) or take away (sign=-1) one rating given at `created_at`."""
+    teacher_id = (
+        Course.objects.filter(pk=course_id).values_list("teacher_id", flat=True).get()
+    )
+    changes = {"count": F("count") + sign, "total": F("total") + sign * rating}
+    if rating in STARS:
+        changes[f"stars_{rating}"] = F(f"stars_{rating}") + sign
+
+    for period in PERIODS:
+        start = period_start(period, created_at)
+        for model, key in (
+            (CourseFeedbackRollup, {"course_id": course_id}),
+            (TeacherFeedbackRollup, {"teacher_id": teacher_id}),
+        ):
+            key.update(period=period, start=start)
+            rollups = model.objects.filter(**key)
+            if not rollups.update(**changes):
+                # First rating of the period
+                model.objects.get_or_create(**key)
+                rollups.update(**changes)
+
+
+def add_feedback(course_id, rating, created_at):
+    adjust(course_id, rating, created_at, 1)
+
+
+def remove_feedback(course_id, rating, created_at):
+    adjust(course_id, rating, created_at, -1)
+
+
+def count_courses(course_ids):
+    """{course id: {(period, start): counters}} counted from the feedback."""
+    counts = {}
+    for period, start in PERIODS.items():
+        rows = (
+            Feedback.objects.filter(course_id__in=course_ids)
+            .values("course", start=start("created_at"))
+            .annotate(
+                count=Count("pk"),
+                total=Sum("rating"),
+                **{
+                    f"stars_{stars}": Count("pk", filter=Q(rating=stars))
+                    for stars in STARS
+                },
+            )
+            .order_by()
+        )
+        for row in rows:
+            course = counts.setdefault(row.pop("course"), {})
+            course[(period, row.pop("start"))] = row
+    return counts
+
+
+def count_teachers(teacher_ids):
+    """{teacher id: {(period, start): counters}} summed from the course rows."""
+    counts = {}
+    rows = (
+        CourseFeedbackRollup.objects.filter(
+            course__teacher__in=teacher_ids, count__gt=0
+        )
+        .values("period", "start", teacher_id=F("course__teacher"))
+        .annotate(**SUMS)
+        .order_by()
+    )
+    for row in rows:
+        teacher = counts.setdefault(row.pop("teacher_id"), {})
+        teacher[(row.pop("period"), row.pop("start"))] = row
+    return counts
+
+
+def replace_drifted(model, field, ids, expected, dry_run=False):
+    """
+    Compare the `model` rollups of `ids` (values of `field`) with
+    `expected` and replace the ones that differ. Returns their ids.
+    """
+    stored = {}
+    rows = (
+        model.objects.select_for_update()
+        .filter(**{f"{field}__in": ids}, count__gt=0)
+        .values(field, "period", "start", *COUNTERS)
+    )
+    for row in rows:
+        owner = stored.setdefault(row.pop(field), {})
+        owner[(row.pop("period"), row.pop("start"))] = row
+
+    wrong = [pk for pk in ids if stored.get(pk, {}) != expected.get(pk, {})]
+    if wrong and not dry_run:
+        model.objects.filter(**{f"{field}__in": wrong}).delete()
+        model.objects.bulk_create(
+            model(**{field: pk}, period=period, start=start, **counters)
+            for pk in wrong
+            for (period, start), counters in expected.get(pk, {}).items()
+        )
+    return wrong
+
+
+def recount_teachers(teacher_ids):
+    with transaction.atomic():
+        replace_drifted(
+            TeacherFeedbackRollup,
+            "teacher_id",
+            teacher_ids,
+            count_teachers(teacher_ids),
+        )
+
+
+def rebuild(batch_size=1000, dry_run=False):
+    """
+    Recount the rollups of every course from its feedback, then of every
+    teacher from their courses, `batch_size` per transaction, and replace
+    those that drifted. Returns the ids of the courses and of the teachers
+    that were (or, with dry_run, would be) fixed.
+    """
+    course_ids = list(Course.objects.order_by("pk").values_list("pk", flat=True))
+    teacher_ids = sorted(
+        set(Course.objects.values_list("teacher_id", flat=True))
+        | set(TeacherFeedbackRollup.objects.values_list("teacher_id", flat=True))
+    )
+    fixed = {"courses": [], "teachers": []}
+    for name, ids, model, field, count in (
+        ("courses", course_ids, CourseFeedbackRollup, "course_id", count_courses),
+        ("teachers", teacher_ids, TeacherFeedbackRollup, "teacher_id", count_teachers),
+    ):
+        for first in range(0, len(ids), batch_size):
+            batch = ids[first : first + batch_size]
+            with transaction.atomic():
+                fixed[name] += replace_drifted(
+                    model, field, batch, count(batch), dry_run
+                )
+    return fixed
+
+
+def stats(row):
+    """count, average and histogram of a row of summed counters."""
+    count, total, *stars = [row[field] or 0 for field in COUNTERS]
+    return {
+        "count": count,
+        "average": round(total / count, 2) if count else None,
+        "histogram": dict(zip(STARS, stars)),
+    }
+
+
+def whole_days(since, until):
+    """
+    Q of the rollups that add up to exactly the days from `since` to
+    `until`: whole weeks from the weekly rows, the days around them from
+    the daily ones (a year is some 60 rows instead of 365).
+    """
+    days = Q(period=FeedbackRollup.DAY, start__range=(since, until))
+    first_monday = since + timedelta(days=-since.weekday() % 7)
+    # Monday of the week `until` ends early, or the day after it
+    after_weeks = first_day(FeedbackRollup.WEEK, until + timedelta(days=1))
+    if first_monday >= after_weeks:
+        return days
+    return days & (Q(start__lt=first_monday) | Q(start__gte=after_weeks)) | Q(
+        period=FeedbackRollup.WEEK, start__gte=first_monday, start__lt=after_weeks
+    )
+
+
+def summarize(period, since, until, teacher_id=None, course_id=None):
+    """
+    Ratings in the `period`s (days or weeks) from the one containing
+    `since` to the one containing `until`, of one teacher's courses, one
+    course or (neither given) every course: the totals and the series of
+    periods that got any, and the totals of each course.
+    """
+    since = first_day(period, since)
+    until = first_day(period, until)
+    if period == FeedbackRollup.WEEK:
+        until += timedelta(days=6)
+
+    courses = Course.objects.all()
+    if teacher_id:
+        courses = courses.filter(teacher_id=teacher_id)
+    if course_id:
+        courses = courses.filter(pk=course_id)
+        trend = CourseFeedbackRollup.objects.filter(course__in=courses.values("pk"))
+    elif teacher_id:
+        trend = TeacherFeedbackRollup.objects.filter(teacher_id=teacher_id)
+    else:
+        trend = TeacherFeedbackRollup.objects.all()
+    series = (
+        trend.filter(period=period, start__range=(since, until), count__gt=0)
+        .values("start")
+        .annotate(**SUMS)
+        .order_by("start")
+    )
+    per_course = {
+        row.pop("course"): row
+        for row in CourseFeedbackRollup.objects.filter(
+            whole_days(since, until), course__in=courses.values("pk"), count__gt=0
+        )
+        .values("course")
+        .annotate(**SUMS)
+        .order_by()
+    }
+    empty = dict.fromkeys(COUNTERS, 0)
+    return {
+        "period": period,
+        "since": since,
+        "until": until,
+        **stats(
+            {
+                field: sum(row[field] for row in per_course.values())
+                for field in COUNTERS
+            }
+        ),
+        "series": [{"start": row["start"], **stats(row)} for row in series],
+        "courses": [
+            {"course": pk, "title": title, **stats(per_course.get(pk, empty))}
+            for pk, title in courses.order_by("pk").values_list("pk", "title")
+        ],
+    }
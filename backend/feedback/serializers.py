@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import StatusUpdate, Feedback
+from .models import CourseRating, StatusUpdate, Feedback
 
 
 class StatusUpdateSerializer(serializers.ModelSerializer):
@@ -26,3 +26,23 @@ class FeedbackSerializer(serializers.ModelSerializer):
             "created_at",
         ]
         read_only_fields = ["student", "created_at"]
+
+
+class CourseRatingSerializer(serializers.ModelSerializer):
+    course_title = serializers.CharField(source="course.title", read_only=True)
+    teacher_name = serializers.CharField(
+        source="course.teacher.username", read_only=True
+    )
+    histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+
+    class Meta:
+        model = CourseRating
+        fields = [
+            "course",
+            "course_title",
+            "teacher_name",
+            "count",
+            "average",
+            "score",
+            "histogram",
+        ]
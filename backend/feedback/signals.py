@@ -0,0 +1,92 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from courses.models import Course, Enrollment
+from .models import Feedback, StatusUpdate
+from .ratings import add_rating, remove_rating
+from .rollups import add_feedback, recount_teachers, remove_feedback
+from .timelines import add_students, fan_out, remove_student
+
+
+@receiver(pre_save, sender=Feedback)
+def remember_previous_rating(sender, instance, **kwargs):
+    instance._previous_rating = None
+    if instance.pk:
+        instance._previous_rating = (
+            Feedback.objects.filter(pk=instance.pk)
+            .values_list("course_id", "rating")
+            .first()
+        )
+
+
+@receiver(post_save, sender=Feedback)
+def count_rating(sender, instance, **kwargs):
+    previous = getattr(instance, "_previous_rating", None)
+    if previous == (instance.course_id, instance.rating):
+        return
+    if previous:
+        remove_rating(*previous)
+        remove_feedback(*previous, instance.created_at)
+    add_rating(instance.course_id, instance.rating)
+    add_feedback(instance.course_id, instance.rating, instance.created_at)
+
+
+def deletes_course(origin, course_id):
+    """Whether deleting `origin` (an object or queryset) takes the course too."""
+    User = get_user_model()
+    if isinstance(origin, Course) or getattr(origin, "model", None) is Course:
+        return True
+    if isinstance(origin, User):
+        return Course.objects.filter(pk=course_id, teacher=origin).exists()
+    if getattr(origin, "model", None) is User:
+        return Course.objects.filter(pk=course_id, teacher__in=origin).exists()
+    return False
+
+
+@receiver(post_delete, sender=Feedback)
+def uncount_rating(sender, instance, origin=None, **kwargs):
+    if deletes_course(origin, instance.course_id):
+        # The aggregate and rollups are deleted along with the course
+        return
+    remove_rating(instance.course_id, instance.rating)
+    remove_feedback(instance.course_id, instance.rating, instance.created_at)
+
+
+@receiver(post_save, sender=Course)
+def move_teacher_rollups(sender, instance, **kwargs):
+    # _previous_teacher_id is set by courses.signals.remember_previous_teacher
+    previous = getattr(instance, "_previous_teacher_id", None)
+    if previous and previous != instance.teacher_id:
+        recount_teachers([previous, instance.teacher_id])
+
+
+@receiver(post_delete, sender=Course)
+def uncount_course_rollups(sender, instance, origin=None, **kwargs):
+    User = get_user_model()
+    if isinstance(origin, User) or getattr(origin, "model", None) is User:
+        # The teacher's rollups are being deleted too
+        return
+    recount_teachers([instance.teacher_id])
+
+
+@receiver(post_save, sender=StatusUpdate)
+def fan_out_status_update(sender, instance, created, **kwargs):
+    if created:
+        fan_out(instance)
+
+
+@receiver(post_save, sender=Enrollment)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        add_students(instance.course, [instance.student_id])
+
+
+@receiver(post_delete, sender=Enrollment)
+def clean_timeline(sender, instance, origin=None, **kwargs):
+    # When a user goes, their timeline rows cascade with them
+    if isinstance(origin, (Enrollment, Course)) or getattr(origin, "model", None) in (
+        Enrollment,
+        Course,
+    ):
+        remove_student(instance.course.teacher_id, instance.student_id)
@@ -1,12 +1,28 @@
-from django.test import TestCase
+import io
+import json
+from datetime import date, datetime, timezone as dt_timezone
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.test import TestCase, override_settings
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from courses.models import Course
-from .models import StatusUpdate, Feedback
+from courses.models import Course, Enrollment
+from courses.roster import bulk_enroll
+from .models import (
+    CourseRating,
+    CourseFeedbackRollup,
+    Feedback,
+    StatusUpdate,
+    TeacherFeedbackRollup,
+    TimelineEntry,
+)
+from .rollups import rebuild
 
 User = get_user_model()
 
@@ -76,6 +92,21 @@ class FeedbackViewsTest(APITestCase):
         self.assertEqual(Feedback.objects.count(), 1)
         self.assertEqual(Feedback.objects.first().student, self.student)
 
+    def test_teacher_can_export_feedback_for_their_course(self):
+        Feedback.objects.create(
+            student=self.student, course=self.course, rating=4, comment="Good"
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.teacher_token}")
+        response = self.client.get(reverse("feedback-export"), {"as": "ndjson"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("attachment;", response["Content-Disposition"])
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        record = json.loads(lines[0])
+        self.assertEqual(len(lines), 1)
+        self.assertEqual((record["rating"], record["comment"]), (4, "Good"))
+        self.assertEqual(record["student_username"], "student1")
+
         # Test 4: Teacher Can View Feedback for Their Course
 
     def test_teacher_can_view_feedback_for_their_course(self):
@@ -92,3 +123,365 @@ class FeedbackViewsTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
         self.assertEqual(response.data[0]["course"], self.course.id)
+
+
+class CourseRatingTest(APITestCase):
+
+    def setUp(self):
+        self.teacher = User.objects.create(username="teacher1", role="teacher")
+        self.students = User.objects.bulk_create(
+            [User(username=f"student{i}", role="student") for i in range(6)]
+        )
+        self.course = Course.objects.create(
+            title="Math 101", description="", teacher=self.teacher
+        )
+        self.other_course = Course.objects.create(
+            title="Art 101", description="", teacher=self.teacher
+        )
+
+    def rate(self, student, rating, course=None):
+        return Feedback.objects.create(
+            student=student, course=course or self.course, rating=rating
+        )
+
+    def assertAggregate(self, course, count, total, histogram):
+        rating = CourseRating.objects.get(course=course)
+        self.assertEqual((rating.count, rating.total), (count, total))
+        self.assertEqual(rating.histogram, dict(zip(range(1, 6), histogram)))
+        self.assertAlmostEqual(rating.average, total / count if count else None)
+        self.assertAlmostEqual(rating.score, (total + 15) / (count + 5))
+
+    def test_feedback_changes_update_the_aggregate(self):
+        first = self.rate(self.students[0], 5)
+        second = self.rate(self.students[1], 3)
+        self.assertAggregate(self.course, 2, 8, [0, 0, 1, 0, 1])
+
+        second.rating = 4
+        second.save()
+        first.comment = "No rating change"
+        first.save()
+        self.assertAggregate(self.course, 2, 9, [0, 0, 0, 1, 1])
+
+        second.course = self.other_course
+        second.save()
+        self.assertAggregate(self.course, 1, 5, [0, 0, 0, 0, 1])
+        self.assertAggregate(self.other_course, 1, 4, [0, 0, 0, 1, 0])
+
+        first.delete()
+        self.students[1].delete()
+        self.assertAggregate(self.course, 0, 0, [0, 0, 0, 0, 0])
+        self.assertAggregate(self.other_course, 0, 0, [0, 0, 0, 0, 0])
+
+        # Deleting a rated course takes its aggregate along
+        self.rate(self.students[2], 2)
+        self.course.delete()
+        self.assertFalse(CourseRating.objects.filter(course_id=self.course.id).exists())
+
+    def test_rolled_back_feedback_is_not_counted(self):
+        self.rate(self.students[0], 4)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.rate(self.students[0], 1)
+        self.assertAggregate(self.course, 1, 4, [0, 0, 0, 1, 0])
+
+    def test_ratings_must_be_one_to_five_stars(self):
+        token = str(RefreshToken.for_user(self.students[0]).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        response = self.client.post(
+            reverse("feedback-list"), {"course": self.course.id, "rating": 6}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rebuild_repairs_drift(self):
+        self.rate(self.students[0], 5)
+        # Bypasses the signals
+        Feedback.objects.bulk_create(
+            [Feedback(student=self.students[1], course=self.other_course, rating=2)]
+        )
+        CourseRating.objects.filter(course=self.course).update(count=7, stars_1=3)
+
+        out = io.StringIO()
+        call_command("rebuild_course_ratings", "--dry-run", stdout=out)
+        self.assertIn("Would fix 2 course ratings", out.getvalue())
+        self.assertEqual(CourseRating.objects.get(course=self.course).count, 7)
+
+        call_command("rebuild_course_ratings", stdout=io.StringIO())
+        self.assertAggregate(self.course, 1, 5, [0, 0, 0, 0, 1])
+        self.assertAggregate(self.other_course, 1, 2, [0, 1, 0, 0, 0])
+        out = io.StringIO()
+        call_command("rebuild_course_ratings", stdout=out)
+        self.assertIn("All course ratings are correct", out.getvalue())
+
+    def test_top_rated_reads_one_page_of_aggregates(self):
+        courses = [
+            Course.objects.create(
+                title=f"Course {i}", description="", teacher=self.teacher
+            )
+            for i in range(3)
+        ]
+        # One 5-star rating ranks below many 4-star ones
+        self.rate(self.students[0], 5, courses[0])
+        for student in self.students:
+            self.rate(student, 4, courses[1])
+            self.rate(student, 2, courses[2])
+
+        token = str(RefreshToken.for_user(self.students[0]).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        with self.assertNumQueries(2):  # the user, then one page
+            response = self.client.get(reverse("top-rated"), {"limit": 2})
+        self.assertEqual(
+            [row["course"] for row in response.data["results"]],
+            [courses[1].id, courses[0].id],
+        )
+        self.assertEqual(response.data["results"][0]["histogram"]["4"], 6)
+        self.assertEqual(response.data["next_offset"], 2)
+
+        response = self.client.get(reverse("top-rated"), {"min_count": 2})
+        self.assertEqual(
+            [row["course"] for row in response.data["results"]],
+            [courses[1].id, courses[2].id],
+        )
+
+
+class TimelineTest(APITestCase):
+
+    def setUp(self):
+        self.teacher = User.objects.create_user(username="t", role="teacher")
+        self.other_teacher = User.objects.create_user(username="t2", role="teacher")
+        self.students = [
+            User.objects.create_user(username=f"s{i}", role="student") for i in range(3)
+        ]
+        self.course = Course.objects.create(
+            title="Course", description="", teacher=self.teacher
+        )
+        self.other_course = Course.objects.create(
+            title="Other", description="", teacher=self.other_teacher
+        )
+
+    def post(self, student, content="Hi"):
+        return StatusUpdate.objects.create(student=student, content=content)
+
+    def timeline(self, teacher, **params):
+        token = str(RefreshToken.for_user(teacher).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        response = self.client.get(reverse("status-update-list"), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def ids(self, data):
+        return [update["id"] for update in data["results"]]
+
+    def test_updates_reach_the_teachers_of_enrolled_students(self):
+        Enrollment.objects.create(course=self.course, student=self.students[0])
+        Enrollment.objects.create(course=self.other_course, student=self.students[1])
+        mine = self.post(self.students[0])
+        self.post(self.students[1])
+        self.post(self.students[2])
+
+        self.assertEqual(self.ids(self.timeline(self.teacher)), [mine.id])
+        self.assertEqual(TimelineEntry.objects.count(), 2)
+
+    def test_enrolling_backfills_and_unenrolling_removes(self):
+        earlier = self.post(self.students[0])
+        enrollment = Enrollment.objects.create(
+            course=self.course, student=self.students[0]
+        )
+        self.assertEqual(self.ids(self.timeline(self.teacher)), [earlier.id])
+
+        bulk_enroll(self.course, [self.students[1].id])
+        later = self.post(self.students[1])
+        self.assertEqual(self.ids(self.timeline(self.teacher)), [later.id, earlier.id])
+
+        # Still in another of the teacher's courses: the updates stay
+        second = Course.objects.create(
+            title="Second", description="", teacher=self.teacher
+        )
+        second_enrollment = Enrollment.objects.create(
+            course=second, student=self.students[0]
+        )
+        enrollment.delete()
+        self.assertEqual(len(self.timeline(self.teacher)["results"]), 2)
+        second_enrollment.delete()
+        self.assertEqual(self.ids(self.timeline(self.teacher)), [later.id])
+
+        second.delete()
+        self.course.delete()
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    @override_settings(TIMELINE_FANOUT_MAX_STUDENTS=1)
+    def test_large_courses_are_pulled_at_read_time(self):
+        bulk_enroll(self.course, [student.id for student in self.students[:2]])
+        # Also in a small course of the same teacher, so in both sources
+        small = Course.objects.create(
+            title="Small", description="", teacher=self.teacher
+        )
+        Enrollment.objects.create(course=small, student=self.students[0])
+        updates = [self.post(student) for student in self.students[:2]]
+
+        self.course.refresh_from_db()
+        self.assertTrue(self.course.timeline_pull)
+        self.assertEqual(TimelineEntry.objects.count(), 1)
+        self.assertEqual(
+            self.ids(self.timeline(self.teacher)), [u.id for u in reversed(updates)]
+        )
+
+    def test_keyset_pages(self):
+        Enrollment.objects.create(course=self.course, student=self.students[0])
+        updates = [self.post(self.students[0], str(i)) for i in range(5)]
+        # Same timestamp: the id breaks the tie
+        StatusUpdate.objects.update(created_at=updates[0].created_at)
+        TimelineEntry.objects.update(created_at=updates[0].created_at)
+
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 2, **({"before": cursor} if cursor else {})}
+            # The user, then one page of entries and one of pulled courses
+            with self.assertNumQueries(3):
+                data = self.timeline(self.teacher, **params)
+            seen += self.ids(data)
+            cursor = data["next"]
+            if not cursor:
+                break
+        self.assertEqual(seen, [u.id for u in reversed(updates)])
+
+        data = self.timeline(self.other_teacher, student_id=self.students[0].id)
+        self.assertEqual(len(data["results"]), 5)
+        response = self.client.get(reverse("status-update-list"), {"before": "nope"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class FeedbackRollupTest(APITestCase):
+
+    def setUp(self):
+        self.teacher = User.objects.create(username="teacher1", role="teacher")
+        self.students = User.objects.bulk_create(
+            [User(username=f"student{i}", role="student") for i in range(4)]
+        )
+        self.course = Course.objects.create(
+            title="Math 101", description="", teacher=self.teacher
+        )
+        self.other_course = Course.objects.create(
+            title="Art 101", description="", teacher=self.teacher
+        )
+
+    def rate(self, student, rating, day, course=None):
+        when = datetime(2025, 3, day, 12, tzinfo=dt_timezone.utc)
+        with mock.patch("django.utils.timezone.now", return_value=when):
+            return Feedback.objects.create(
+                student=student, course=course or self.course, rating=rating
+            )
+
+    def analytics(self, user=None, **params):
+        token = str(RefreshToken.for_user(user or self.teacher).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        return self.client.get(
+            reverse("feedback-analytics"),
+            {"since": "2025-01-01", "until": "2025-12-31", **params},
+        )
+
+    def test_rollups_follow_feedback_changes(self):
+        # Monday and Wednesday of one week, then the next Monday
+        first = self.rate(self.students[0], 5, 3)
+        second = self.rate(self.students[1], 2, 5)
+        self.rate(self.students[2], 4, 10)
+        self.rate(self.students[3], 3, 10, self.other_course)
+        second.rating = 4
+        second.save()
+        first.delete()
+
+        weeks = CourseFeedbackRollup.objects.filter(course=self.course, period="week")
+        self.assertEqual(
+            {(r.start, r.count, r.total, r.stars_4) for r in weeks},
+            {(date(2025, 3, 3), 1, 4, 1), (date(2025, 3, 10), 1, 4, 1)},
+        )
+        weeks = TeacherFeedbackRollup.objects.filter(
+            teacher=self.teacher, period="week"
+        )
+        self.assertEqual(
+            {(r.start, r.count, r.total) for r in weeks},
+            {(date(2025, 3, 3), 1, 4), (date(2025, 3, 10), 2, 7)},
+        )
+        # Incremental and batch counts agree
+        self.assertEqual(rebuild(dry_run=True), {"courses": [], "teachers": []})
+
+    def test_teacher_rollups_follow_their_courses(self):
+        self.rate(self.students[0], 5, 3)
+        self.rate(self.students[1], 3, 3, self.other_course)
+        new_teacher = User.objects.create(username="t2", role="teacher")
+        self.other_course.teacher = new_teacher
+        self.other_course.save()
+
+        def totals(teacher):
+            rows = TeacherFeedbackRollup.objects.filter(teacher=teacher, count__gt=0)
+            return {(r.period, r.count, r.total) for r in rows}
+
+        self.assertEqual(totals(self.teacher), {("day", 1, 5), ("week", 1, 5)})
+        self.assertEqual(totals(new_teacher), {("day", 1, 3), ("week", 1, 3)})
+        self.course.delete()
+        self.assertEqual(totals(self.teacher), set())
+        new_teacher.delete()
+        self.assertFalse(TeacherFeedbackRollup.objects.exists())
+
+    def test_analytics_per_course_and_overall(self):
+        self.rate(self.students[0], 5, 3)
+        self.rate(self.students[1], 2, 4)
+        self.rate(self.students[2], 4, 11, self.other_course)
+        other = Course.objects.create(
+            title="Not mine",
+            description="",
+            teacher=User.objects.create(username="t2", role="teacher"),
+        )
+        self.rate(self.students[0], 1, 4, other)
+
+        # The user, the series, the course totals and the course titles
+        with self.assertNumQueries(4):
+            response = self.analytics()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data["count"], response.data["average"]), (3, 3.67))
+        self.assertEqual(
+            [(w["start"], w["count"]) for w in response.data["series"]],
+            [(date(2025, 3, 3), 2), (date(2025, 3, 10), 1)],
+        )
+        math, art = response.data["courses"]
+        self.assertEqual((math["title"], math["average"]), ("Math 101", 3.5))
+        self.assertEqual(math["histogram"], {1: 0, 2: 1, 3: 0, 4: 0, 5: 1})
+        self.assertEqual((art["count"], art["average"]), (1, 4.0))
+
+        response = self.analytics(period="day", course=self.course.id)
+        self.assertEqual(
+            [d["start"] for d in response.data["series"]],
+            [date(2025, 3, 3), date(2025, 3, 4)],
+        )
+        response = self.analytics(since="2025-03-05")
+        self.assertEqual(response.data["count"], 3)  # weeks starting before it
+
+        self.assertEqual(
+            self.analytics(self.students[0]).status_code, status.HTTP_403_FORBIDDEN
+        )
+        self.assertEqual(
+            self.analytics(period="month").status_code, status.HTTP_400_BAD_REQUEST
+        )
+
+    def test_rebuild_backfills_rollups(self):
+        self.rate(self.students[0], 5, 3)
+        # Bypasses the signals
+        Feedback.objects.bulk_create(
+            [Feedback(student=self.students[1], course=self.other_course, rating=2)]
+        )
+        CourseFeedbackRollup.objects.filter(course=self.course).update(count=7)
+
+        out = io.StringIO()
+        call_command("rebuild_feedback_rollups", "--dry-run", stdout=out)
+        self.assertIn("Would fix the rollups of 2 courses", out.getvalue())
+        self.assertIn("Would fix the rollups of 1 teachers", out.getvalue())
+
+        call_command("rebuild_feedback_rollups", "--batch-size", "1", stdout=out)
+        self.assertEqual(
+            CourseFeedbackRollup.objects.filter(course=self.other_course).count(), 2
+        )
+        weeks = TeacherFeedbackRollup.objects.filter(
+            teacher=self.teacher, period="week"
+        )
+        self.assertEqual(sum(week.count for week in weeks), 2)
+        out = io.StringIO()
+        call_command("rebuild_feedback_rollups", stdout=out)
+        self.assertIn("All feedback rollups are correct", out.getvalue())
@@ -0,0 +1,171 @@
+"""
+Teacher timelines: the status updates of the students in a teacher's
+courses, newest first.
+
+Timelines are materialized when an update is written: it gets a
+TimelineEntry for every teacher of a course the student is enrolled in.
+Enrolling backfills the student's earlier updates into the teacher's
+timeline, and unenrolling takes them out again unless the student is still
+in another of the teacher's courses.
+
+Courses with more than TIMELINE_FANOUT_MAX_STUDENTS students would make
+enrollments and roster imports copy a lot of rows, so once a course grows
+past the limit it's switched (for good) to pull: its students' updates are
+no longer fanned out but queried when the teacher reads the timeline, and
+merged with the materialized entries.
+
+Pages are keyset-paginated on (created_at, id): each source is one index
+range scan of `limit + 1` rows, whatever the length of the timeline.
+"""
+
+import base64
+import binascii
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework import serializers
+
+from courses.models import Course, Enrollment
+from .models import StatusUpdate, TimelineEntry
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+BATCH_SIZE = 1000
+
+
+def fanout_limit():
+    return getattr(settings, "TIMELINE_FANOUT_MAX_STUDENTS", 500)
+
+
+def encode_cursor(created_at, pk):
+    raw = f"{created_at.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return the (created_at, id) position stored in a cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, pk = raw.split("|")
+        return datetime.fromisoformat(created_at), int(pk)
+    except (binascii.Error, UnicodeError, ValueError):
+        raise serializers.ValidationError({"before": "Invalid cursor."})
+
+
+def get_page_size(value):
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def older_than(queryset, position, id_field="id"):
+    """Rows strictly before the (created_at, id) position, newest first."""
+    if position:
+        created_at, pk = position
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at)
+            | Q(created_at=created_at, **{f"{id_field}__lt": pk})
+        )
+    return queryset.order_by("-created_at", f"-{id_field}")
+
+
+def page(updates, limit):
+    """(this page, cursor of the next page or None) of a newest-first list."""
+    next_cursor = None
+    if len(updates) > limit:
+        last = updates[limit - 1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return updates[:limit], next_cursor
+
+
+def paginate(queryset, before=None, limit=DEFAULT_PAGE_SIZE):
+    """A keyset page of a StatusUpdate queryset, newest first."""
+    position = decode_cursor(before) if before else None
+    updates = list(
+        older_than(queryset.select_related("student"), position)[: limit + 1]
+    )
+    return page(updates, limit)
+
+
+def switch_to_pull(courses):
+    """
+    Flag the courses in `courses` that outgrew fan-out; returns the ones
+    still fanned out.
+    """
+    courses.filter(timeline_pull=False, seats_taken__gt=fanout_limit()).update(
+        timeline_pull=True
+    )
+    return courses.filter(timeline_pull=False)
+
+
+def fan_out(update):
+    """Put a new status update on the timelines of the student's teachers."""
+    courses = switch_to_pull(
+        Course.objects.filter(enrollments__student=update.student_id)
+    )
+    teacher_ids = set(courses.values_list("teacher_id", flat=True))
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(teacher_id=pk, update=update, created_at=update.created_at)
+            for pk in teacher_ids
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def add_students(course, student_ids):
+    """Backfill the updates of students who just enrolled in `course`."""
+    if not switch_to_pull(Course.objects.filter(pk=course.pk)).exists():
+        return
+    updates = StatusUpdate.objects.filter(student_id__in=student_ids).values_list(
+        "id", "created_at"
+    )
+    batch = []
+    for update_id, created_at in updates.iterator():
+        batch.append(
+            TimelineEntry(
+                teacher_id=course.teacher_id, update_id=update_id, created_at=created_at
+            )
+        )
+        if len(batch) == BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def remove_student(teacher_id, student_id):
+    """Drop a student's updates from a timeline they no longer belong on."""
+    still_enrolled = Enrollment.objects.filter(
+        student_id=student_id, course__teacher_id=teacher_id
+    ).exists()
+    if not still_enrolled:
+        TimelineEntry.objects.filter(
+            teacher_id=teacher_id, update__student_id=student_id
+        ).delete()
+
+
+def teacher_timeline(teacher, before=None, limit=DEFAULT_PAGE_SIZE):
+    """A page of `teacher`'s timeline: materialized entries plus pulled courses."""
+    position = decode_cursor(before) if before else None
+    entries = older_than(
+        TimelineEntry.objects.filter(teacher=teacher).select_related("update__student"),
+        position,
+        id_field="update_id",
+    )
+    updates = [entry.update for entry in entries[: limit + 1]]
+
+    pulled = Enrollment.objects.filter(
+        course__teacher=teacher, course__timeline_pull=True
+    ).values("student_id")
+    recent = older_than(
+        StatusUpdate.objects.filter(student_id__in=pulled).select_related("student"),
+        position,
+    )
+    # A student in both kinds of course shows up in both sources
+    seen = {update.id for update in updates}
+    updates += [u for u in recent[: limit + 1] if u.id not in seen]
+    updates.sort(key=lambda u: (u.created_at, u.id), reverse=True)
+    return page(updates, limit)
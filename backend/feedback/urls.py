@@ -1,8 +1,12 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import StatusUpdateViewSet, FeedbackViewSet
+from .views import StatusUpdateViewSet, FeedbackViewSet, analytics, top_rated
 
 router = DefaultRouter()
 router.register(r"status-updates", StatusUpdateViewSet, basename="status-update")
 router.register(r"feedbacks", FeedbackViewSet, basename="feedback")
 
-urlpatterns = router.urls
+urlpatterns = [
+    path("top-rated/", top_rated, name="top-rated"),
+    path("analytics/", analytics, name="feedback-analytics"),
+] + router.urls
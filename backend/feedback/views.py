@@ -1,7 +1,19 @@
+from datetime import date, timedelta
+
+from django.utils import timezone
 from rest_framework import viewsets, permissions
-from rest_framework.exceptions import PermissionDenied
-from .models import StatusUpdate, Feedback
-from .serializers import StatusUpdateSerializer, FeedbackSerializer
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.response import Response
+from courses.exports import CHUNK_SIZE, export_format, stream_export
+from .models import CourseRating, FeedbackRollup, StatusUpdate, Feedback
+from .rollups import PERIODS, summarize
+from .timelines import get_page_size, paginate, teacher_timeline
+from .serializers import (
+    CourseRatingSerializer,
+    StatusUpdateSerializer,
+    FeedbackSerializer,
+)
 
 
 class StatusUpdateViewSet(viewsets.ModelViewSet):
@@ -18,10 +30,36 @@ class StatusUpdateViewSet(viewsets.ModelViewSet):
         if user.role == "student":
             # student sees their own updates
             return StatusUpdate.objects.filter(student=user)
+        elif user.role == "teacher":
+            # teachers see updates from the students in their courses
+            return StatusUpdate.objects.filter(
+                student__enrollments__course__teacher=user
+            ).distinct()
         else:
-            # teachers/admins can see all updates
+            # admins can see all updates
             return StatusUpdate.objects.all()
 
+    def list(self, request, *args, **kwargs):
+        """
+        Newest first, one keyset page at a time. Teachers get their
+        timeline: updates from the students in their courses.
+        Usage: /api/feedback/status-updates/?before=<cursor>&limit=20
+        """
+        before = request.query_params.get("before")
+        limit = get_page_size(request.query_params.get("limit"))
+        if request.user.role == "teacher" and not request.query_params.get(
+            "student_id"
+        ):
+            updates, next_cursor = teacher_timeline(request.user, before, limit)
+        else:
+            updates, next_cursor = paginate(self.get_queryset(), before, limit)
+        return Response(
+            {
+                "results": self.get_serializer(updates, many=True).data,
+                "next": next_cursor,
+            }
+        )
+
     def perform_create(self, serializer):
         if self.request.user.role != "student":
             raise PermissionDenied("Only students can post status updates.")
@@ -53,3 +91,108 @@ class FeedbackViewSet(viewsets.ModelViewSet):
         if self.request.user.role != "student":
             raise PermissionDenied("Only students can submit feedback.")
         serializer.save(student=self.request.user)
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """
+        Stream the feedback the user can see (a teacher's courses) as CSV or
+        NDJSON.
+        Usage: /api/feedback/feedbacks/export/?as=ndjson&course=3
+        """
+        fmt = export_format(request)
+        feedback = self.get_queryset()
+        if request.query_params.get("course"):
+            try:
+                feedback = feedback.filter(
+                    course_id=int(request.query_params["course"])
+                )
+            except ValueError:
+                raise ValidationError({"course": "Must be a course id."})
+        columns = [
+            "id",
+            "course_id",
+            "course_title",
+            "student_id",
+            "student_username",
+            "rating",
+            "comment",
+            "created_at",
+        ]
+        rows = feedback.order_by("pk").values_list(
+            "id",
+            "course_id",
+            "course__title",
+            "student_id",
+            "student__username",
+            "rating",
+            "comment",
+            "created_at",
+        )
+        return stream_export(rows.iterator(CHUNK_SIZE), columns, fmt, "feedback")
+
+
+@api_view(["GET"])
+@permission_classes([permissions.IsAuthenticated])
+def top_rated(request):
+    """
+    Courses by rating score, best first, read from the rating aggregates
+    alone (an index scan of one page, however many ratings there are).
+    Usage: /api/feedback/top-rated/?min_count=3&limit=20&offset=0
+    """
+    try:
+        min_count = max(int(request.GET.get("min_count", 1)), 1)
+        limit = min(max(int(request.GET.get("limit", 20)), 1), 100)
+        offset = max(int(request.GET.get("offset", 0)), 0)
+    except ValueError:
+        raise ValidationError("min_count, limit and offset must be integers.")
+
+    ratings = list(
+        CourseRating.objects.filter(count__gte=min_count)
+        .select_related("course__teacher")
+        .order_by("-score", "-count", "course_id")[offset : offset + limit + 1]
+    )
+    return Response(
+        {
+            "results": CourseRatingSerializer(ratings[:limit], many=True).data,
+            "next_offset": offset + limit if len(ratings) > limit else None,
+        }
+    )
+
+
+@api_view(["GET"])
+@permission_classes([permissions.IsAuthenticated])
+def analytics(request):
+    """
+    Rating counts, averages and histograms of a teacher's courses per day or
+    week, for each course and all of them together, read from the feedback
+    rollups. Staff can pick any teacher, or leave it out for every course.
+    Usage: /api/feedback/analytics/?period=week&since=2025-01-01&until=2025-12-31&course=3
+    """
+    user = request.user
+    period = request.GET.get("period", FeedbackRollup.WEEK)
+    if period not in PERIODS:
+        raise ValidationError(f"period must be one of: {', '.join(PERIODS)}.")
+    try:
+        until = date.fromisoformat(request.GET["until"])
+    except KeyError:
+        until = timezone.localdate()
+    except ValueError:
+        raise ValidationError("until must be a YYYY-MM-DD date.")
+    try:
+        since = date.fromisoformat(request.GET["since"])
+    except KeyError:
+        since = until - timedelta(days=365)
+    except ValueError:
+        raise ValidationError("since must be a YYYY-MM-DD date.")
+
+    try:
+        teacher_id = int(request.GET.get("teacher") or 0)
+        course_id = int(request.GET.get("course") or 0)
+    except ValueError:
+        raise ValidationError("teacher and course must be ids.")
+
+    if not user.is_staff:
+        if user.role != "teacher":
+            raise PermissionDenied("Only teachers can see feedback analytics.")
+        teacher_id = user.id
+    return Response(summarize(period, since, until, teacher_id, course_id))
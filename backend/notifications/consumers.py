@@ -0,0 +1,57 @@
+import json
+from urllib.parse import parse_qs
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from rest_framework_simplejwt.exceptions import InvalidToken
+from chat.auth import decode_user_id, load_user, user_cache
+from .push import group_name, unread_snapshot
+
+
+class NotificationConsumer(AsyncWebsocketConsumer):
+    """
+    A user's notification feed: an unread snapshot on connect, then every
+    new notification as it is created.
+    """
+
+    async def connect(self):
+        query_string = parse_qs(self.scope["query_string"].decode())
+        token = query_string.get("token", [None])[0]
+        if not token:
+            await self.close(code=4001)  # No token
+            return
+
+        try:
+            user_id = decode_user_id(token)
+        except InvalidToken:
+            await self.close(code=4002)  # Invalid token
+            return
+
+        user = user_cache.get(user_id)
+        if user is None:
+            user = await database_sync_to_async(load_user)(user_id)
+        if user is None:
+            await self.close(code=4002)  # Unknown or inactive user
+            return
+        self.scope["user"] = user
+
+        # Join before taking the snapshot so nothing created in between is
+        # missed; what it already holds is not pushed a second time
+        self.group_name = group_name(user.pk)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        snapshot = await database_sync_to_async(unread_snapshot)(user.pk)
+        self.sent_on_join = {n["id"] for n in snapshot["notifications"]}
+
+        await self.accept()
+        await self.send(text_data=json.dumps(snapshot))
+
+    async def disconnect(self, close_code):
+        if hasattr(self, "group_name"):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def notification_created(self, event):
+        notification = event["notification"]
+        if notification["id"] in self.sent_on_join:
+            return
+        await self.send(
+            text_data=json.dumps({"type": "notification", "notification": notification})
+        )
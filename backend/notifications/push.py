@@ -0,0 +1,56 @@
+"""
+Real-time delivery of notifications.
+
+Every notification is pushed, once its transaction commits, to the group of
+its owner's sockets (see consumers.NotificationConsumer), so clients no
+longer poll the notifications endpoint. A socket that (re)connects starts
+from a snapshot of the unread notifications.
+"""
+
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from .models import Notification
+from .serializers import NotificationSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def group_name(user_id):
+    return f"notifications_{user_id}"
+
+
+def notification_payload(notification):
+    return dict(NotificationSerializer(notification).data)
+
+
+def unread_snapshot(user_id):
+    """The newest unread notifications (up to the snapshot limit) and the count."""
+    limit = getattr(settings, "NOTIFICATIONS_SNAPSHOT_LIMIT", 50)
+    unread = Notification.objects.filter(user_id=user_id, is_read=False)
+    return {
+        "type": "snapshot",
+        "unread_count": unread.count(),
+        "notifications": [notification_payload(n) for n in unread[:limit]],
+    }
+
+
+def push(notification):
+    """Send a new notification to its owner's open sockets."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(
+            group_name(notification.user_id),
+            {
+                "type": "notification_created",
+                "notification": notification_payload(notification),
+            },
+        )
+    except Exception:
+        # The notification is saved; clients still see it on their next snapshot
+        logger.exception("Failed to push notification %s", notification.pk)
@@ -1,6 +1,13 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.tokens import RefreshToken
+from chat.auth import user_cache
 from .models import Notification
+from .routing import websocket_urlpatterns
 from .serializers import NotificationSerializer
 
 User = get_user_model()
@@ -52,3 +59,74 @@ class NotificationSerializerTest(TestCase):
         self.assertNotEqual(
             updated_notification.created_at.isoformat(), "2024-01-01T00:00:00"
         )
+
+
+@override_settings(
+    CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+)
+class NotificationConsumerTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="alice", password="pass123")
+        self.other = User.objects.create_user(username="bob", password="pass123")
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+        user_cache.clear()
+
+    def communicator(self, token=None):
+        return WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns),
+            f"/ws/notifications/?token={token or self.token}",
+        )
+
+    def notify(self, message):
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.create(user=self.user, message=message)
+
+    def test_connect_sends_unread_snapshot(self):
+        Notification.objects.create(user=self.user, message="read", is_read=True)
+        unread = Notification.objects.create(user=self.user, message="unread")
+        Notification.objects.create(user=self.other, message="not mine")
+
+        async def run():
+            communicator = self.communicator()
+            connected, _ = await communicator.connect()
+            snapshot = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return connected, snapshot
+
+        connected, snapshot = async_to_sync(run)()
+        self.assertTrue(connected)
+        self.assertEqual(snapshot["type"], "snapshot")
+        self.assertEqual(snapshot["unread_count"], 1)
+        self.assertEqual([n["id"] for n in snapshot["notifications"]], [unread.id])
+
+    def test_new_notifications_are_pushed_to_their_owner(self):
+        async def run():
+            mine, theirs = self.communicator(), self.communicator(
+                str(RefreshToken.for_user(self.other).access_token)
+            )
+            await mine.connect()
+            await theirs.connect()
+            await mine.receive_json_from()
+            await theirs.receive_json_from()
+
+            await database_sync_to_async(self.notify)("Graded")
+            pushed = await mine.receive_json_from()
+            self.assertTrue(await theirs.receive_nothing())
+            await mine.disconnect()
+            await theirs.disconnect()
+            return pushed
+
+        pushed = async_to_sync(run)()
+        self.assertEqual(pushed["type"], "notification")
+        self.assertEqual(pushed["notification"]["message"], "Graded")
+
+    def test_rejects_missing_token(self):
+        async def run():
+            communicator = WebsocketCommunicator(
+                URLRouter(websocket_urlpatterns), "/ws/notifications/"
+            )
+            return await communicator.connect()
+
+        connected, code = async_to_sync(run)()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4001)
@@ -124,6 +124,23 @@ export const getCourses = async () => {
   return response.data;
 };
 
+//  Get one page of catalog summaries ({count, next, results})
+export const getCourseCatalog = async ({ limit = 24, offset = 0 } = {}) => {
+  const response = await api.get("courses/courses/", {
+    params: { view: "summary", limit, offset },
+  });
+  return response.data;
+};
+
+//  Ranked course search ({results, next_offset}); the last word matches as a
+//  prefix, so this can be called while the user types
+export const searchCourses = async ({ q, teacher, enrolled, limit = 24, offset = 0 }) => {
+  const response = await api.get("courses/search/", {
+    params: { q, teacher, enrolled, limit, offset },
+  });
+  return response.data;
+};
+
 //  Get single course detail
 export const getCourseDetail = async (courseId) => {
   const response = await api.get(`courses/courses/${courseId}/`);
@@ -138,6 +155,56 @@ export const enrollInCourse = async (courseId) => {
   return response.data;
 };
 
+//  Teacher: enroll many students (ids/emails array, or a CSV File)
+export const bulkEnroll = async (courseId, students) => {
+  const body = students instanceof File ? new FormData() : { students };
+  if (students instanceof File) body.append("file", students);
+  const response = await api.post(`courses/courses/${courseId}/enroll/`, body);
+  return response.data;
+};
+
+//  Teacher: upload a material in resumable chunks. Pass `uploadId` to
+//  resume an interrupted upload; resolves with the created material.
+const UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024;
+
+export const uploadMaterial = async (
+  courseId,
+  file,
+  { title = "", uploadId = null, onProgress } = {}
+) => {
+  let offset = 0;
+  if (uploadId) {
+    offset = (await api.get(`courses/uploads/${uploadId}/`)).data.offset;
+  } else {
+    const session = await api.post("courses/uploads/", {
+      course: courseId,
+      filename: file.name,
+      size: file.size,
+      title,
+    });
+    uploadId = session.data.id;
+  }
+
+  while (true) {
+    const chunk = file.slice(offset, offset + UPLOAD_CHUNK_SIZE);
+    try {
+      const response = await api.patch(`courses/uploads/${uploadId}/`, chunk, {
+        headers: {
+          "Content-Type": "application/offset+octet-stream",
+          "Upload-Offset": offset,
+        },
+      });
+      if (response.status === 201) return response.data;
+      offset = response.data.offset;
+      onProgress?.(offset / file.size, uploadId);
+    } catch (err) {
+      // The server is ahead of us (e.g. a lost response): continue from there
+      if (err.response?.status !== 409) throw err;
+      offset = err.response.data.offset;
+    }
+  }
+};
+
 //  Teacher: Create a new course
 export const createCourse = async (courseData) => {
   const response = await api.post("courses/courses/", courseData, {
@@ -165,10 +232,30 @@ export const leaveFeedback = async (feedbackData) => {
   return response.data;
 };
 
-//  Get all status updates (optionally filter by student id)
-export const getStatusUpdates = async (userId) => {
+//  Best rated courses ({results, next_offset}); `minCount` skips courses
+//  with fewer ratings
+export const getTopRatedCourses = async ({ minCount = 1, limit = 10, offset = 0 } = {}) => {
+  const response = await api.get("feedback/top-rated/", {
+    params: { min_count: minCount, limit, offset },
+  });
+  return response.data;
+};
+
+//  Rating counts, averages and histograms of the teacher's courses per day or
+//  week ({count, average, histogram, series, courses}); `since`/`until` are
+//  YYYY-MM-DD dates and default to the last year
+export const getFeedbackAnalytics = async ({ period = "week", since, until, course } = {}) => {
+  const response = await api.get("feedback/analytics/", {
+    params: { period, since, until, course },
+  });
+  return response.data;
+};
+
+//  Get a page of status updates (optionally filter by student id)
+//  Returns { results, next }: pass `next` as `before` for the next page
+export const getStatusUpdates = async (userId, before) => {
   const response = await api.get("feedback/status-updates/", {
-    params: { student_id: userId }
+    params: { student_id: userId, before }
   });
   return response.data;
 };
@@ -214,9 +301,13 @@ export const getChatRooms = async () => {
   return response.data;
 };
 
-//  Get messages in a room
-export const getMessages = async (roomId) => {
-  const response = await api.get(`chat/messages/?room=${roomId}`);
+//  Get a page of messages in a room
+//  Pass the `before` cursor from a previous page to load older messages,
+//  or the `after` cursor to load newer ones.
+export const getMessages = async (roomId, { before, after, limit } = {}) => {
+  const response = await api.get(`chat/rooms/${roomId}/messages/`, {
+    params: { before, after, limit },
+  });
   return response.data;
 };
 
@@ -10,10 +10,19 @@ const CourseCard = ({ course }) => {
       </p>
       <p className="mt-3 text-xs text-gray-500">
         <strong>Teacher:</strong>{" "}
-        {typeof course.teacher === "string"
-          ? course.teacher
-          : course.teacher?.username || "Unknown"}
+        {course.teacher_name ||
+          (typeof course.teacher === "string"
+            ? course.teacher
+            : course.teacher?.username) ||
+          "Unknown"}
       </p>
+      {course.enrollment_count !== undefined && (
+        <p className="mt-1 text-xs text-gray-500">
+          {course.material_count} materials · {course.enrollment_count} students
+          {course.average_rating !== null &&
+            ` · ★ ${course.average_rating.toFixed(1)} (${course.rating_count})`}
+        </p>
+      )}
       <Link
         to={`/courses/${course.id}`}
         className="mt-4 inline-block text-blue-600 hover:text-blue-800 font-medium text-sm transition"
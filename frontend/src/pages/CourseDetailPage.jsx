@@ -166,17 +166,26 @@ export default function CourseDetailPage() {
             <ul className="space-y-3">
               {course.materials.map((material) => (
                 <li key={material.id} className="flex items-start">
-                  <svg
-                    className="w-5 h-5 text-blue-500 mr-3 mt-1 flex-shrink-0"
-                    fill="currentColor"
-                    viewBox="0 0 20 20"
-                  >
-                    <path
-                      fillRule="evenodd"
-                      d="M4 4a2 2 0 012-2h4.586A2 2 0 0112 2.586L15.414 6A2 2 0 0116 7.414V16a2 2 0 01-2 2H6a2 2 0 01-2-2V4z"
-                      clipRule="evenodd"
+                  {material.thumbnail ? (
+                    <img
+                      src={material.thumbnail}
+                      alt=""
+                      loading="lazy"
+                      className="w-16 h-16 object-cover rounded mr-3 flex-shrink-0"
                     />
-                  </svg>
+                  ) : (
+                    <svg
+                      className="w-5 h-5 text-blue-500 mr-3 mt-1 flex-shrink-0"
+                      fill="currentColor"
+                      viewBox="0 0 20 20"
+                    >
+                      <path
+                        fillRule="evenodd"
+                        d="M4 4a2 2 0 012-2h4.586A2 2 0 0112 2.586L15.414 6A2 2 0 0116 7.414V16a2 2 0 01-2 2H6a2 2 0 01-2-2V4z"
+                        clipRule="evenodd"
+                      />
+                    </svg>
+                  )}
 
                   <a
                     href={material.file}
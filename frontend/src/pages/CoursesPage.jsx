@@ -2,7 +2,7 @@ import { useState, useEffect } from "react";
 import Navbar from "../components/Navbar";
 import CourseCard from "../components/CourseCard";
 import { useAuth } from "../context/AuthContext";
-import { getCourses, enrollInCourse } from "../api/api";
+import { getCourseCatalog, searchCourses, enrollInCourse } from "../api/api";
 
 export default function CoursesPage() {
   const { user } = useAuth();
@@ -12,24 +12,30 @@ export default function CoursesPage() {
   const [message, setMessage] = useState("");
   const [error, setError] = useState("");
 
+  const [hasMore, setHasMore] = useState(false);
+  const [query, setQuery] = useState("");
+  // The search only starts from two characters
+  const searchTerm = query.trim().length >= 2 ? query.trim() : "";
+
+  const loadPage = async (offset) => {
+    const page = searchTerm
+      ? await searchCourses({ q: searchTerm, offset })
+      : await getCourseCatalog({ offset });
+    setCourses((prev) => (offset ? [...prev, ...page.results] : page.results));
+    setHasMore(searchTerm ? page.next_offset !== null : Boolean(page.next));
+    setEnrolledCourseIds((prev) => {
+      const ids = new Set(offset ? prev : []);
+      page.results.filter((c) => c.is_enrolled).forEach((c) => ids.add(c.id));
+      return ids;
+    });
+  };
+
   useEffect(() => {
     const loadCourses = async () => {
       try {
-        setLoading(true);
+        if (!courses.length) setLoading(true);
         setError("");
-
-        const coursesData = await getCourses();
-
-        setCourses(coursesData);
-
-        if (user?.role === "student") {
-          const userEnrollments = coursesData
-            .filter((course) =>
-              course.enrollments?.some((e) => e.student === user.id)
-            )
-            .map((c) => c.id);
-          setEnrolledCourseIds(new Set(userEnrollments));
-        }
+        await loadPage(0);
       } catch (err) {
         console.error("Failed to load courses", err);
         setError("Could not load courses. Please try again later.");
@@ -38,8 +44,19 @@ export default function CoursesPage() {
       }
     };
 
-    loadCourses();
-  }, [user]);
+    // Wait for the user to stop typing before searching
+    const timer = setTimeout(loadCourses, searchTerm ? 250 : 0);
+    return () => clearTimeout(timer);
+  }, [user, searchTerm]);
+
+  const handleLoadMore = async () => {
+    try {
+      await loadPage(courses.length);
+    } catch (err) {
+      console.error("Failed to load more courses", err);
+      setError("Could not load more courses.");
+    }
+  };
 
   const handleEnroll = async (courseId) => {
     if (!user) {
@@ -52,7 +69,12 @@ export default function CoursesPage() {
     }
 
     try {
-      await enrollInCourse(courseId);
+      const result = await enrollInCourse(courseId);
+      if (result.waitlisted) {
+        setMessage(`The course is full. You are #${result.position} on the waitlist.`);
+        setError("");
+        return;
+      }
       setEnrolledCourseIds((prev) => new Set(prev).add(courseId));
       setMessage("Successfully enrolled in course!");
       setError("");
@@ -87,6 +109,17 @@ export default function CoursesPage() {
           <p className="text-lg text-gray-600 mt-2">Explore and enroll in interactive courses</p>
         </div>
 
+        {/* Search */}
+        <div className="mb-6 max-w-xl mx-auto">
+          <input
+            type="search"
+            value={query}
+            onChange={(e) => setQuery(e.target.value)}
+            placeholder="Search courses..."
+            className="w-full px-4 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-blue-400"
+          />
+        </div>
+
         {/* Messages */}
         {message && (
           <div className="bg-green-50 border border-green-200 text-green-600 px-4 py-3 rounded-md text-sm mb-6 text-center">
@@ -129,10 +162,21 @@ export default function CoursesPage() {
             ))
           ) : (
             <p className="col-span-full text-center text-gray-500 italic">
-              No courses available at the moment.
+              {searchTerm ? "No courses match your search." : "No courses available at the moment."}
             </p>
           )}
         </div>
+
+        {hasMore && (
+          <div className="mt-8 text-center">
+            <button
+              onClick={handleLoadMore}
+              className="px-4 py-2 border border-gray-300 rounded-md text-gray-700 hover:bg-gray-100 transition duration-200"
+            >
+              Load more courses
+            </button>
+          </div>
+        )}
       </main>
     </div>
   );
@@ -1,6 +1,6 @@
 import { useState, useEffect } from "react";
 import Navbar from "../components/Navbar";
-import { getCourses, createCourse } from "../api/api";
+import { getCourses, createCourse, uploadMaterial } from "../api/api";
 import api, { loadTokens } from "../api/api";
 import ChatRoom from "../components/ChatRoom";
 
@@ -110,16 +110,12 @@ export default function TeacherDashboard() {
     }
 
     try {
-      const tokens = loadTokens();
-      const formData = new FormData();
-      formData.append("file", file);
-      formData.append("course", courseId);
-
-      await api.post("courses/materials/", formData, {
-        headers: {
-          "Content-Type": "multipart/form-data",
-          Authorization: `Bearer ${tokens.access}`,
-        },
+      await uploadMaterial(courseId, file, {
+        onProgress: (fraction) =>
+          setUploadMessages((prev) => ({
+            ...prev,
+            [courseId]: `Uploading… ${Math.round(fraction * 100)}%`,
+          })),
       });
 
       const res = await api.get(`courses/materials/?course=${courseId}`);
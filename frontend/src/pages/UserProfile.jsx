@@ -24,7 +24,7 @@ const UserProfile = () => {
 
         //  Load status updates from feedback app
         const updates = await getStatusUpdates(data.id);
-        setStatusUpdates(updates);
+        setStatusUpdates(updates.results);
 
         const tokens = loadTokens();
         if (!tokens) return;